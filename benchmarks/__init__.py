@@ -0,0 +1,11 @@
+"""
+Benchmarks Package
+
+Offline benchmarks for the API's Python-side costs. Run the scripts in
+this package from the repository root, e.g.:
+
+    python -m benchmarks.bench_serialization
+    python -m benchmarks.bench_analytics
+    python -m benchmarks.corpus --docs 10000 --output benchmarks/corpus
+    python -m benchmarks.load_test --serve-fake --rps 20
+"""
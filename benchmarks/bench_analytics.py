@@ -0,0 +1,296 @@
+"""
+Analytics benchmark suite
+
+Measures the Python-side cost of every analytics function in utils
+(query building, response processing, pandas, serialization) without a
+live cluster. Elasticsearch is replaced by benchmarks.fake_es
+(recorded responses when available, generated ones otherwise), the Redis
+cache is bypassed and Gemini returns a canned answer.
+
+Each case is run `--repeat` times after `--warmup` runs; the report shows
+median / p95 wall time and the median of every profiled phase
+(param_normalization, query_build, es, post_processing, serialization).
+Results are written as JSON so two runs can be compared.
+
+Usage:
+    python -m benchmarks.bench_analytics --label before
+    python -m benchmarks.bench_analytics --label after --case kol_overview
+    python -m benchmarks.bench_analytics --compare benchmarks/results/before.json benchmarks/results/after.json
+    python -m benchmarks.bench_analytics --record     # record responses from the cluster in .env
+"""
+
+import argparse
+import importlib
+import inspect
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from benchmarks.fake_es import RECORDINGS_DIR, FakeElasticsearch, RecordingElasticsearch
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Parameter bersama; tiap case hanya menerima yang ada di signature fungsinya
+COMMON_PARAMS = {
+    "keywords": ["ekonomi", "harga pangan"],
+    "date_filter": "custom",
+    "custom_start_date": "2025-01-01",
+    "custom_end_date": "2025-01-31",
+    "owner_id": "5",
+    "project_name": "benchmark",
+}
+
+# name -> (module, function, parameter tambahan)
+CASES = {
+    "social_media_matrix": ("utils.analysis_overview", "get_social_media_matrix", {}),
+    "category_analytics": ("utils.analysis_sentiment_mentions", "get_category_analytics", {}),
+    "context_of_discussion": ("utils.context_of_disccusion", "get_context_of_discussion", {}),
+    "intents_emotions_region": ("utils.intent_emotions_region", "get_intents_emotions_region_share", {}),
+    "keyword_trends": ("utils.keyword_trends", "get_keyword_trends", {}),
+    "list_of_mentions": ("utils.list_of_mentions", "get_mentions", {"page": 1, "page_size": 100}),
+    "topics_sentiment": ("utils.topics_sentiment_analysis", "get_topics_sentiment_analysis", {}),
+    "topics_cluster": ("utils.topics_cluster", "get_topics_cluster", {}),
+    "kol_overview": ("utils.kol_overview", "search_kol", {}),
+    "most_followers": ("utils.most_followers", "get_most_followers", {"limit": 100, "page": 1, "page_size": 10}),
+    "popular_emojis": ("utils.popular_emojis", "get_popular_emojis", {}),
+    "presence_score": ("utils.presence_score", "get_presence_score", {}),
+    "share_of_voice": ("utils.share_of_voice", "get_share_of_voice", {"limit": 100, "page": 1, "page_size": 10}),
+    "stats_summary": ("utils.summary_stats", "get_stats_summary", {}),
+    "trending_hashtags": ("utils.trending_hashtags", "get_trending_hashtags", {"limit": 100, "page": 1, "page_size": 10}),
+    "trending_links": ("utils.trending_links", "get_trending_links", {"limit": 10000, "page": 1, "page_size": 10000}),
+}
+
+FAKE_GEMINI_RESPONSE = json.dumps({
+    "positive_topics": "Benchmark positive summary.",
+    "negative_topics": "Benchmark negative summary."
+})
+
+
+def fake_call_gemini(prompt, *args, **kwargs):
+    return FAKE_GEMINI_RESPONSE
+
+
+def install_fakes(es_client, bypass_cache=True):
+    """Point every utils module at the given client, bypass Gemini (and by default Redis)"""
+    if bypass_cache:
+        from utils.redis_client import redis_client
+        redis_client.get = lambda key: None
+        redis_client.set_with_ttl = lambda *args, **kwargs: True
+
+    for name, module in list(sys.modules.items()):
+        if not name.startswith("utils.") or module is None:
+            continue
+        if hasattr(module, "get_elasticsearch_client") and name != "utils.es_client":
+            module.get_elasticsearch_client = lambda *args, **kwargs: es_client
+        if hasattr(module, "call_gemini"):
+            module.call_gemini = fake_call_gemini
+
+
+def load_cases(selected=None):
+    """Import the case functions; cases whose module cannot be imported are reported and skipped"""
+    cases = {}
+    for name, (module_name, function_name, extra) in CASES.items():
+        if selected and name not in selected:
+            continue
+        try:
+            module = importlib.import_module(module_name)
+        except Exception as e:
+            print(f"Skipping {name}: cannot import {module_name} ({e})")
+            continue
+        func = getattr(module, function_name)
+        accepted = inspect.signature(inspect.unwrap(func)).parameters
+        params = {k: v for k, v in {**COMMON_PARAMS, **extra}.items() if k in accepted}
+        cases[name] = (func, params)
+    return cases
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def _phase_timings(profile_tree):
+    """Sum profiled time per phase below the utils function span"""
+    phases = {}
+    for child in profile_tree.get("children", []):
+        if child["name"] == "serialization" or "children" not in child:
+            phases[child["name"]] = phases.get(child["name"], 0) + child["ms"]
+            continue
+        for node in child["children"]:
+            phases[node["name"]] = phases.get(node["name"], 0) + node["ms"]
+    return phases
+
+
+def run_case(func, params, repeat, warmup, profile=True):
+    from utils.profiling import Profile, _current_profile
+    from utils.responses import dumps
+
+    timings = []
+    phase_samples = {}
+    size = 0
+    for i in range(warmup + repeat):
+        prof = Profile(func.__name__) if profile else None
+        token = _current_profile.set(prof)
+        try:
+            start = time.perf_counter()
+            result = func(**params)
+            if prof is not None:
+                with prof.span("serialization"):
+                    body = dumps(result)
+            else:
+                body = dumps(result)
+            elapsed = (time.perf_counter() - start) * 1000
+        finally:
+            _current_profile.reset(token)
+
+        if i < warmup:
+            continue
+        timings.append(elapsed)
+        size = len(body)
+        if prof is not None:
+            for phase, ms in _phase_timings(prof.to_dict()).items():
+                phase_samples.setdefault(phase, []).append(ms)
+
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(_percentile(timings, 95), 3),
+        "min_ms": round(min(timings), 3),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "runs": len(timings),
+        "response_bytes": size,
+        "phases_ms": {phase: round(statistics.median(v), 3) for phase, v in sorted(phase_samples.items())}
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def run(selected=None, repeat=10, warmup=2, max_buckets=5000, profile=True, label=None):
+    fake = FakeElasticsearch(recordings_dir=RECORDINGS_DIR, max_buckets=max_buckets)
+    cases = load_cases(selected)
+    install_fakes(fake)
+
+    results = {}
+    print(f"{'case':<26}{'median ms':>12}{'p95 ms':>12}{'bytes':>12}  phases (median ms)")
+    for name, (func, params) in cases.items():
+        try:
+            stats = run_case(func, params, repeat, warmup, profile=profile)
+        except Exception as e:
+            print(f"{name:<26}{'error':>12}  {type(e).__name__}: {e}")
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+            continue
+        results[name] = stats
+        phases = ", ".join(f"{k}={v}" for k, v in stats["phases_ms"].items())
+        print(f"{name:<26}{stats['median_ms']:>12.2f}{stats['p95_ms']:>12.2f}{stats['response_bytes']:>12,}  {phases}")
+
+    report = {
+        "meta": {
+            "label": label,
+            "created": datetime.now(timezone.utc).isoformat(),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "repeat": repeat,
+            "warmup": warmup,
+            "max_buckets": max_buckets,
+            "es_responses": fake.stats,
+        },
+        "cases": results
+    }
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    filename = label or datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(RESULTS_DIR, f"{filename}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"ES responses: {fake.stats['replayed']} replayed, {fake.stats['generated']} generated")
+    print(f"Results written to {path}")
+    return report
+
+
+def record(selected=None):
+    """Run every case once against the configured cluster, storing the responses"""
+    from utils.es_client import get_elasticsearch_client
+
+    client = get_elasticsearch_client()
+    if client is None:
+        raise SystemExit("Cannot connect to Elasticsearch, nothing recorded")
+    cases = load_cases(selected)
+    install_fakes(RecordingElasticsearch(client))
+    for name, (func, params) in cases.items():
+        func(**params)
+        print(f"Recorded {name}")
+
+
+def compare(base_path, new_path, threshold=0.10):
+    """
+    Print a per-case comparison of two result files
+
+    Returns the number of cases whose median regressed by more than `threshold`.
+    """
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    print(f"base: {base['meta'].get('label')} ({base['meta'].get('git_revision')})  "
+          f"new: {new['meta'].get('label')} ({new['meta'].get('git_revision')})")
+    print(f"{'case':<26}{'base ms':>12}{'new ms':>12}{'delta':>10}")
+    regressions = 0
+    for name in sorted(set(base["cases"]) | set(new["cases"])):
+        old_stats = base["cases"].get(name, {})
+        new_stats = new["cases"].get(name, {})
+        if "median_ms" not in old_stats or "median_ms" not in new_stats:
+            print(f"{name:<26}{'-':>12}{'-':>12}{'n/a':>10}")
+            continue
+        delta = (new_stats["median_ms"] - old_stats["median_ms"]) / old_stats["median_ms"]
+        flag = ""
+        if delta > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif delta < -threshold:
+            flag = "  faster"
+        print(f"{name:<26}{old_stats['median_ms']:>12.2f}{new_stats['median_ms']:>12.2f}{delta:>+10.1%}{flag}")
+
+        # Fase yang berubah paling banyak, untuk menunjukkan sumber perubahan
+        phases = set(old_stats.get("phases_ms", {})) | set(new_stats.get("phases_ms", {}))
+        for phase in sorted(phases):
+            before = old_stats.get("phases_ms", {}).get(phase, 0)
+            after = new_stats.get("phases_ms", {}).get(phase, 0)
+            if abs(after - before) >= max(0.5, threshold * old_stats["median_ms"]):
+                print(f"{'  ' + phase:<26}{before:>12.2f}{after:>12.2f}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline analytics benchmark suite")
+    parser.add_argument("--case", action="append", help="Only run this case (repeatable)")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--max-buckets", type=int, default=5000,
+                        help="Upper bound for generated terms buckets")
+    parser.add_argument("--no-profile", action="store_true", help="Disable per-phase timings")
+    parser.add_argument("--label", help="Name of the results file")
+    parser.add_argument("--record", action="store_true", help="Record responses from the live cluster")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="Compare two result files")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Regression threshold for --compare")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, threshold=args.threshold) else 0)
+    elif args.record:
+        record(args.case)
+    else:
+        run(args.case, repeat=args.repeat, warmup=args.warmup, max_buckets=args.max_buckets,
+            profile=not args.no_profile, label=args.label)
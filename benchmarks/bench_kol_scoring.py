@@ -0,0 +1,107 @@
+"""
+KOL scoring benchmark
+
+Times the kol_overview scoring stage (utils.kol_overview.score_kols:
+categories, profile links, most_viral, share of voice and rising-star
+metrics) on synthetic KOL frames of 1k-50k rows, as produced by
+utils.kol_engine.
+
+The old row-wise implementation (DataFrame.apply with five column
+maxima per row) is kept here as a reference: it is timed on the small
+sizes only, because it is quadratic, and its most_viral values are
+compared with the vectorized ones.
+
+Usage:
+    python -m benchmarks.bench_kol_scoring
+    python -m benchmarks.bench_kol_scoring --rows 1000 10000 50000 --repeat 5
+"""
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.kol_engine import KOL_COLUMNS
+from utils.kol_overview import score_kols
+
+CHANNELS = ["twitter", "instagram", "tiktok", "linkedin", "reddit", "youtube", "news"]
+CATEGORIES = ["Influencer", "News Account", "Regular User", ""]
+
+
+def synthetic_kols(rows, seed=42):
+    """KOL frame with the columns of kol_engine.fetch_kol_frame and long-tailed metrics"""
+    rng = np.random.default_rng(seed)
+    posts = np.maximum(rng.zipf(1.6, rows), 1).clip(max=100000)
+    sentiment = rng.dirichlet([2, 1, 3], rows)
+    frame = pd.DataFrame({
+        "username": [f"user_{i}" if i % 97 else f"news_{i}" for i in range(rows)],
+        "channel": rng.choice(CHANNELS, rows),
+        "link_post": posts,
+        "viral_score": rng.random(rows) * 100 * posts,
+        "reach_score": rng.random(rows) * 100 * posts,
+        "user_image_url": [f"https://cdn.example.com/{i}.jpg" for i in range(rows)],
+        "user_followers": rng.pareto(1.2, rows) * 1000,
+        "engagement_rate": rng.random(rows) * 20 * posts,
+        "issue": [[f"issue {j}" for j in range(i % 7)] for i in range(rows)],
+        "user_category": rng.choice(CATEGORIES, rows),
+        "user_influence_score": rng.random(rows) * 10,
+        "sentiment_positive": np.round(sentiment[:, 0] * posts).astype(int),
+        "sentiment_negative": np.round(sentiment[:, 1] * posts).astype(int),
+        "sentiment_neutral": np.round(sentiment[:, 2] * posts).astype(int),
+    }, columns=KOL_COLUMNS)
+    return frame
+
+
+def legacy_most_viral(final_kol):
+    """most_viral as computed before vectorization (row-wise apply)"""
+    def calculate(row):
+        max_followers = final_kol['user_followers'].max() if final_kol['user_followers'].max() > 0 else 1
+        max_influence = final_kol['user_influence_score'].max() if final_kol['user_influence_score'].max() > 0 else 1
+        max_posts = final_kol['link_post'].max() if final_kol['link_post'].max() > 0 else 1
+        max_reach = final_kol['reach_score'].max() if final_kol['reach_score'].max() > 0 else 1
+        max_engagement = final_kol['engagement_rate'].max() if final_kol['engagement_rate'].max() > 0 else 1
+        total = row['sentiment_positive'] + row['sentiment_negative'] + row['sentiment_neutral']
+        factor = 1 + (row['sentiment_negative'] / total * 0.3 + row['sentiment_positive'] / total * 0.2 if total > 0 else 0)
+        return (row['user_influence_score'] / max_influence * 0.35 +
+                row['user_followers'] / max_followers * 0.25 +
+                row['link_post'] / max_posts * 0.15 +
+                row['reach_score'] / max_reach * 0.15 +
+                row['engagement_rate'] / max_engagement * 0.10) * factor
+
+    scores = final_kol.apply(calculate, axis=1).replace([np.inf, -np.inf], 0).fillna(0)
+    max_viral = scores.max() if scores.max() > 0 else 1
+    return (scores / max_viral * 100).to_numpy()
+
+
+def _time(func, frame, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        copy = frame.copy()
+        start = time.perf_counter()
+        result = func(copy)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="KOL scoring benchmark")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 5000, 10000, 50000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--legacy-max-rows", type=int, default=5000,
+                        help="Largest frame the row-wise reference is run on")
+    args = parser.parse_args()
+
+    print(f"{'rows':>8}{'vectorized ms':>16}{'row-wise ms':>14}  most_viral max diff")
+    for rows in args.rows:
+        frame = synthetic_kols(rows)
+        vectorized_ms, scored = _time(score_kols, frame, args.repeat)
+        legacy = ""
+        diff = ""
+        if rows <= args.legacy_max_rows:
+            legacy_ms, reference = _time(legacy_most_viral, frame, 1)
+            legacy = f"{legacy_ms:.1f}"
+            diff = f"{np.abs(scored['most_viral'].to_numpy() - reference).max():.2e}"
+        print(f"{rows:>8}{vectorized_ms:>16.1f}{legacy:>14}  {diff}")
@@ -0,0 +1,212 @@
+"""
+Serialization & compression benchmark
+
+Compares the default FastAPI encoding path (jsonable_encoder + json)
+against orjson, and gzip against brotli, on production-size payloads.
+
+Payloads are read from benchmarks/payloads/*.json when present (record
+them from a running API with --record-from), otherwise synthetic payloads
+of the same shape are generated.
+
+Usage:
+    python -m benchmarks.bench_serialization
+    python -m benchmarks.bench_serialization --record-from http://localhost:8080
+"""
+
+import argparse
+import glob
+import gzip
+import json
+import os
+import random
+import statistics
+import string
+import time
+import urllib.request
+
+from utils.responses import dumps as orjson_dumps
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from fastapi.encoders import jsonable_encoder
+except ImportError:
+    jsonable_encoder = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+PAYLOAD_DIR = os.path.join(os.path.dirname(__file__), "payloads")
+
+# Endpoint yang direkam beserta body request-nya
+RECORD_REQUESTS = {
+    "trending_links": ("/api/v2/trending-links", {"limit": 10000, "page": 1, "page_size": 10000}),
+    "kol_overview": ("/api/v2/kol-overview", {"owner_id": "5", "project_name": "benchmark"}),
+    "list_of_mentions": ("/api/v2/list-of-mentions", {"page": 1, "page_size": 100}),
+}
+
+
+def _random_text(rng, words):
+    return " ".join(
+        "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 10)))
+        for _ in range(words)
+    )
+
+
+def _number(rng, value):
+    # kol_overview mengembalikan nilai turunan pandas (numpy scalar)
+    if np is not None:
+        return np.float64(value)
+    return float(value)
+
+
+def synthetic_payloads(seed=42):
+    """Generate payloads with production-like shapes and sizes"""
+    rng = random.Random(seed)
+
+    links = {
+        "data": [
+            {"link_post": f"https://www.example{i % 500}.com/{_random_text(rng, 1)}",
+             "total_mentions": rng.randint(1, 5000)}
+            for i in range(10000)
+        ],
+        "pagination": {"page": 1, "page_size": 10000, "total_pages": 1, "total_items": 10000},
+        "channels": ["twitter", "instagram", "news"],
+        "total_unique_links": 10000,
+    }
+
+    kol = [
+        {
+            "username": f"user_{i}",
+            "channel": rng.choice(["twitter", "instagram", "tiktok", "news"]),
+            "link_post": rng.randint(1, 500),
+            "viral_score": _number(rng, rng.random() * 1000),
+            "reach_score": _number(rng, rng.random() * 1000),
+            "user_image_url": f"https://cdn.example.com/avatars/{i}.jpg",
+            "user_followers": _number(rng, rng.randint(0, 10_000_000)),
+            "engagement_rate": _number(rng, rng.random() * 50),
+            "issue": [_random_text(rng, 3) for _ in range(5)],
+            "user_category": rng.choice(["Influencer", "News Account", ""]),
+            "user_influence_score": _number(rng, rng.random() * 10),
+            "sentiment_positive": rng.randint(0, 100),
+            "sentiment_negative": rng.randint(0, 100),
+            "sentiment_neutral": rng.randint(0, 100),
+            "link_user": f"https://x.com/user_{i}",
+            "is_negative_driver": rng.random() > 0.7,
+            "unified_issue": [_random_text(rng, 3) for _ in range(5)],
+            "most_viral": _number(rng, rng.random() * 100),
+            "share_of_voice": _number(rng, rng.random()),
+            "engagement_per_follower": _number(rng, rng.random()),
+        }
+        for i in range(1000)
+    ]
+
+    mentions = {
+        "data": [
+            {
+                "post_caption": _random_text(rng, 250),
+                "channel": rng.choice(["twitter", "instagram", "tiktok", "news"]),
+                "username": f"user_{i}",
+                "link_post": f"https://x.com/user_{i}/status/{rng.randint(10**15, 10**16)}",
+                "post_created_at": "2025-04-01T10:00:00",
+                "sentiment": rng.choice(["positive", "negative", "neutral"]),
+                "likes": rng.randint(0, 100000),
+                "comments": rng.randint(0, 5000),
+                "views": rng.randint(0, 1000000),
+                "viral_score": rng.random() * 100,
+                "reach_score": rng.random() * 100,
+                "influence_score": rng.random() * 10,
+                "cluster": _random_text(rng, 4),
+                "region": "jakarta, bandung",
+            }
+            for i in range(100)
+        ],
+        "pagination": {"page": 1, "page_size": 100, "total_pages": 50, "total_posts": 5000},
+    }
+
+    return {"trending_links": links, "kol_overview": kol, "list_of_mentions": mentions}
+
+
+def load_payloads():
+    """Load recorded payloads, falling back to synthetic ones"""
+    payloads = {}
+    for path in sorted(glob.glob(os.path.join(PAYLOAD_DIR, "*.json"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path, "rb") as f:
+            payloads[name] = json.load(f)
+    if payloads:
+        return payloads, "recorded"
+    return synthetic_payloads(), "synthetic"
+
+
+def record_payloads(base_url):
+    """Record production-size responses from a running API"""
+    os.makedirs(PAYLOAD_DIR, exist_ok=True)
+    for name, (path, body) in RECORD_REQUESTS.items():
+        request = urllib.request.Request(
+            base_url.rstrip("/") + path,
+            data=json.dumps(body).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=300) as resp:
+            data = resp.read()
+        with open(os.path.join(PAYLOAD_DIR, f"{name}.json"), "wb") as f:
+            f.write(data)
+        print(f"Recorded {name}: {len(data):,} bytes")
+
+
+def _timeit(func, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), result
+
+
+def _default_json(content):
+    # Jalur default FastAPI: jsonable_encoder lalu json.dumps
+    if jsonable_encoder is not None:
+        content = jsonable_encoder(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, default=float).encode("utf-8")
+
+
+def run(repeat=20):
+    payloads, origin = load_payloads()
+    print(f"Payloads: {origin}")
+    print(f"{'payload':<18}{'encoder':<10}{'ms':>10}{'bytes':>12}")
+
+    for name, content in payloads.items():
+        try:
+            default_ms, default_body = _timeit(lambda: _default_json(content), repeat)
+            print(f"{name:<18}{'default':<10}{default_ms:>10.2f}{len(default_body):>12,}")
+        except (TypeError, ValueError) as e:
+            print(f"{name:<18}{'default':<10}{'failed':>10}  {e}")
+
+        orjson_ms, body = _timeit(lambda: orjson_dumps(content), repeat)
+        print(f"{name:<18}{'orjson':<10}{orjson_ms:>10.2f}{len(body):>12,}")
+
+        gzip_ms, gz = _timeit(lambda: gzip.compress(body, compresslevel=6), repeat)
+        print(f"{name:<18}{'gzip-6':<10}{gzip_ms:>10.2f}{len(gz):>12,}")
+
+        if brotli is not None:
+            br_ms, br = _timeit(lambda: brotli.compress(body, quality=4), repeat)
+            print(f"{name:<18}{'br-4':<10}{br_ms:>10.2f}{len(br):>12,}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serialization & compression benchmark")
+    parser.add_argument("--record-from", help="Base URL of a running API to record payloads from")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.record_from:
+        record_payloads(args.record_from)
+    run(repeat=args.repeat)
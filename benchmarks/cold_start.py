@@ -0,0 +1,88 @@
+"""
+Cold-start measurement
+
+Measures how long a fresh interpreter takes to import `main` (which builds
+the FastAPI app) and checks it against a budget. Each run is a separate
+process, so nothing is cached between runs except the OS file cache. The
+slowest imports are listed from `python -X importtime`.
+
+Warm-up is disabled (STARTUP_WARMUP=off) because only the import path is
+measured; the lifespan hook runs later, when the server starts.
+
+Usage:
+    python -m benchmarks.cold_start
+    python -m benchmarks.cold_start --runs 5 --budget 1.5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+DEFAULT_BUDGET_SECONDS = float(os.getenv("COLD_START_BUDGET", "2.0"))
+
+_PROBE = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def _env():
+    env = dict(os.environ)
+    env["STARTUP_WARMUP"] = "off"
+    return env
+
+
+def measure_import(runs=3):
+    """Seconds to import main in fresh interpreters (one sample per run)"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-c", _PROBE], capture_output=True, text=True, env=_env()
+        )
+        process_seconds = time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError(f"import main failed:\n{result.stderr[-2000:]}")
+        import_seconds = float(result.stdout.strip().splitlines()[-1])
+        samples.append((import_seconds, process_seconds))
+    return samples
+
+
+def slowest_imports(top=15):
+    """Top modules by cumulative import time (from -X importtime)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        capture_output=True, text=True, env=_env()
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative_us), int(self_us), name[1:].rstrip()))
+    # Hanya modul top-level (indentasi menunjukkan kedalaman import)
+    top_level = [row for row in rows if not row[2].startswith(" ")]
+    return sorted(top_level, reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold-start measurement for main.py")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_SECONDS,
+                        help="Budget in seconds for importing main")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest imports to list")
+    args = parser.parse_args()
+
+    samples = measure_import(args.runs)
+    import_median = statistics.median(s[0] for s in samples)
+    process_median = statistics.median(s[1] for s in samples)
+    print(f"import main: median {import_median:.3f}s  (process incl. interpreter: {process_median:.3f}s)")
+
+    print(f"\n{'cumulative ms':>14}{'self ms':>10}  module")
+    for cumulative_us, self_us, name in slowest_imports(args.top):
+        print(f"{cumulative_us / 1000:>14.1f}{self_us / 1000:>10.1f}  {name}")
+
+    if import_median > args.budget:
+        print(f"\nOver budget: {import_median:.3f}s > {args.budget:.3f}s")
+        sys.exit(1)
+    print(f"\nWithin budget ({args.budget:.3f}s)")
@@ -0,0 +1,263 @@
+"""
+Synthetic social-media corpus
+
+Generates realistic documents for the nine `*_data` indices with the
+fields the analytics modules read (post_caption, cluster, sentiment,
+engagement counters, region, user_followers, viral_score, reach_score,
+...). Usernames, hashtags and clusters follow a Zipf distribution, so
+terms aggregations see the same long tail as production.
+
+The corpus can be bulk-loaded into a local Elasticsearch, written as
+NDJSON bulk files, or loaded into benchmarks.fake_es.FakeElasticsearch.
+
+Usage:
+    python -m benchmarks.corpus --docs 20000 --output benchmarks/corpus
+    python -m benchmarks.corpus --docs 20000 --load        # ES from .env (ES_HOST, ...)
+"""
+
+import argparse
+import bisect
+import itertools
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+from benchmarks.fake_es import CHANNELS, REGIONS, WORDS
+
+EMOJIS = ["😂", "🔥", "❤️", "🙏", "😡", "👍", "😭", "🇮🇩", "💯", "😍"]
+INTENTS = ["informative", "opinion", "promotion", "complaint", "question"]
+EMOTIONS = ["joy", "anger", "fear", "sadness", "surprise", "trust", "neutral"]
+USER_CATEGORIES = ["Influencer", "News Account", "Regular User", "Government", "Brand"]
+# Nilai placeholder yang memang muncul di data production
+PLACEHOLDERS = ["Not Specified", "not specified", "unknown", ""]
+
+# Mapping mengikuti tipe field yang diasumsikan query di utils
+INDEX_MAPPING = {
+    "properties": {
+        "post_caption": {"type": "text", "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}},
+        "cluster": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
+        "cluster_description": {"type": "text", "fields": {"keyword": {"type": "keyword", "ignore_above": 512}}},
+        "emotions": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
+        "user_category": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
+        "channel": {"type": "keyword"},
+        "username": {"type": "keyword"},
+        "sentiment": {"type": "keyword"},
+        "link_post": {"type": "keyword"},
+        "post_hashtags": {"type": "keyword"},
+        "list_word": {"type": "keyword"},
+        "region": {"type": "keyword"},
+        "language": {"type": "keyword"},
+        "intent": {"type": "keyword"},
+        "user_image_url": {"type": "keyword"},
+        "post_created_at": {"type": "date", "format": "strict_date_optional_time||yyyy-MM-dd HH:mm:ss"},
+        "viral_score": {"type": "float"},
+        "reach_score": {"type": "float"},
+        "influence_score": {"type": "float"},
+        "user_influence_score": {"type": "float"},
+        "engagement_rate": {"type": "float"},
+        "likes": {"type": "long"},
+        "comments": {"type": "long"},
+        "replies": {"type": "long"},
+        "shares": {"type": "long"},
+        "retweets": {"type": "long"},
+        "views": {"type": "long"},
+        "user_followers": {"type": "long"},
+        "user_connections": {"type": "long"},
+        "subscriber": {"type": "long"},
+    }
+}
+
+
+class ZipfSampler:
+    """Samples from a population with P(rank k) proportional to 1 / k^s"""
+
+    def __init__(self, population, s=1.1):
+        self.population = population
+        self.cum_weights = list(itertools.accumulate(1.0 / (rank ** s) for rank in range(1, len(population) + 1)))
+
+    def sample(self, rng):
+        x = rng.random() * self.cum_weights[-1]
+        return self.population[bisect.bisect_left(self.cum_weights, x)]
+
+
+class CorpusGenerator:
+    """
+    Deterministic generator of posts for all channels
+
+    Parameters:
+    -----------
+    seed : int
+        Random seed
+    users : int
+        Size of the username pool per channel
+    hashtags : int
+        Size of the hashtag pool
+    clusters : int
+        Size of the cluster (issue) pool
+    start_date, end_date : str
+        Range of post_created_at (YYYY-MM-DD)
+    """
+
+    def __init__(self, seed=42, users=5000, hashtags=2000, clusters=300,
+                 start_date="2025-01-01", end_date="2025-03-31"):
+        self.rng = random.Random(seed)
+        self.start = datetime.strptime(start_date, "%Y-%m-%d")
+        self.span_seconds = int((datetime.strptime(end_date, "%Y-%m-%d") - self.start).total_seconds()) + 86399
+
+        self.users = {
+            channel: ZipfSampler([f"{channel[:2]}_{self._word()}_{i}" for i in range(users)])
+            for channel in CHANNELS
+        }
+        self.hashtags = ZipfSampler([f"#{self._word()}{i}" for i in range(hashtags)])
+        self.clusters = ZipfSampler([f"{self._word()} {self._word()} {self._word()}" for _ in range(clusters)])
+        self.cluster_descriptions = {}
+        self.user_profiles = {}
+
+    def _word(self):
+        return self.rng.choice(WORDS)
+
+    def _profile(self, channel, username):
+        # Atribut user tetap sama di semua post milik user tersebut
+        key = (channel, username)
+        profile = self.user_profiles.get(key)
+        if profile is None:
+            rng = random.Random(f"{channel}:{username}")
+            followers = int(rng.paretovariate(1.1) * 500)
+            profile = {
+                "user_followers": followers,
+                "user_influence_score": round(min(10.0, followers ** 0.25 / 5), 3),
+                "user_category": rng.choice(USER_CATEGORIES),
+                "user_image_url": f"https://cdn.example.com/{channel}/{username}.jpg",
+            }
+            self.user_profiles[key] = profile
+        return profile
+
+    def _cluster_description(self, cluster):
+        if cluster not in self.cluster_descriptions:
+            rng = random.Random(cluster)
+            self.cluster_descriptions[cluster] = " ".join(rng.choice(WORDS) for _ in range(20))
+        return self.cluster_descriptions[cluster]
+
+    def document(self, channel):
+        """One synthetic post for the given channel"""
+        rng = self.rng
+        username = self.users[channel].sample(rng)
+        profile = self._profile(channel, username)
+        cluster = self.clusters.sample(rng)
+        hashtags = sorted({self.hashtags.sample(rng) for _ in range(rng.randint(0, 5))})
+        words = [rng.choice(WORDS) for _ in range(rng.randint(8, 80))]
+        caption = " ".join(words + hashtags)
+        if rng.random() < 0.3:
+            caption += " " + "".join(rng.choice(EMOJIS) for _ in range(rng.randint(1, 3)))
+
+        # Engagement mengikuti jumlah follower dengan noise lognormal
+        base = max(profile["user_followers"], 10)
+        views = int(base * rng.lognormvariate(0, 1.2))
+        likes = int(views * rng.uniform(0.005, 0.08))
+        comments = int(likes * rng.uniform(0.01, 0.2))
+        shares = int(likes * rng.uniform(0.01, 0.15))
+        created = self.start + timedelta(seconds=rng.randint(0, self.span_seconds))
+
+        doc = {
+            "post_caption": caption,
+            "channel": channel,
+            "username": username,
+            "user_image_url": profile["user_image_url"],
+            "user_followers": profile["user_followers"],
+            "user_influence_score": profile["user_influence_score"],
+            "user_category": profile["user_category"],
+            "link_post": f"https://www.{channel}.com/{username}/{rng.randint(10**12, 10**13)}",
+            "post_created_at": created.strftime("%Y-%m-%dT%H:%M:%S"),
+            "post_hashtags": hashtags,
+            "list_word": sorted(set(words))[:20],
+            "cluster": cluster,
+            "cluster_description": self._cluster_description(cluster),
+            "sentiment": rng.choices(["positive", "negative", "neutral"], weights=[3, 2, 5])[0],
+            "intent": rng.choice(PLACEHOLDERS) if rng.random() < 0.1 else rng.choice(INTENTS),
+            "emotions": rng.choice(PLACEHOLDERS) if rng.random() < 0.1 else rng.choice(EMOTIONS),
+            "region": (rng.choice(PLACEHOLDERS) if rng.random() < 0.2
+                       else ", ".join(rng.sample(REGIONS, rng.randint(1, 2)))),
+            "language": rng.choices(["id", "en"], weights=[4, 1])[0],
+            "likes": likes,
+            "comments": comments,
+            "replies": comments,
+            "shares": shares,
+            "retweets": shares if channel == "twitter" else 0,
+            "views": views,
+            "viral_score": round(min(100.0, (likes + 2 * comments + 3 * shares) ** 0.5 / 10), 3),
+            "reach_score": round(min(100.0, views ** 0.4 / 2), 3),
+            "influence_score": round(profile["user_influence_score"] * rng.uniform(0.8, 1.2), 3),
+            "engagement_rate": round((likes + comments + shares) / base * 100, 3),
+        }
+        if channel == "youtube":
+            doc["subscriber"] = profile["user_followers"]
+        if channel == "linkedin":
+            doc["user_connections"] = profile["user_followers"]
+        if channel == "news":
+            # Akun news diwakili domain portal berita
+            doc["username"] = f"{username.split('_')[1]}news.co.id"
+            doc["link_post"] = f"https://www.{doc['username']}/read/{rng.randint(10**6, 10**7)}"
+        return doc
+
+    def documents(self, docs_per_index):
+        """Yield (index, document) for every channel"""
+        for channel in CHANNELS:
+            for _ in range(docs_per_index):
+                yield f"{channel}_data", self.document(channel)
+
+
+def write_bulk_files(generator, docs_per_index, output_dir):
+    """Write one Elasticsearch bulk NDJSON file per index"""
+    os.makedirs(output_dir, exist_ok=True)
+    handles = {}
+    try:
+        for index, doc in generator.documents(docs_per_index):
+            if index not in handles:
+                handles[index] = open(os.path.join(output_dir, f"{index}.ndjson"), "w")
+            handles[index].write(json.dumps({"index": {"_index": index}}) + "\n")
+            handles[index].write(json.dumps(doc, ensure_ascii=False) + "\n")
+    finally:
+        for handle in handles.values():
+            handle.close()
+    print(f"Wrote {len(handles)} bulk files to {output_dir}")
+
+
+def bulk_load(es, generator, docs_per_index, recreate=False, chunk_size=2000):
+    """Create the indices (with mapping) and bulk-load the corpus"""
+    from elasticsearch import helpers
+
+    for channel in CHANNELS:
+        index = f"{channel}_data"
+        if recreate and es.indices.exists(index=index):
+            es.indices.delete(index=index)
+        if not es.indices.exists(index=index):
+            es.indices.create(index=index, mappings=INDEX_MAPPING)
+
+    actions = ({"_index": index, "_source": doc} for index, doc in generator.documents(docs_per_index))
+    success, errors = helpers.bulk(es, actions, chunk_size=chunk_size, raise_on_error=False, refresh=True)
+    print(f"Indexed {success} documents, {len(errors)} errors")
+    return success, errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic social-media corpus generator")
+    parser.add_argument("--docs", type=int, default=10000, help="Documents per index")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write bulk NDJSON files to this directory")
+    parser.add_argument("--load", action="store_true", help="Bulk-load into the Elasticsearch configured in .env")
+    parser.add_argument("--recreate", action="store_true", help="Drop and recreate the indices before loading")
+    args = parser.parse_args()
+
+    generator = CorpusGenerator(seed=args.seed)
+    if args.output:
+        write_bulk_files(generator, args.docs, args.output)
+    if args.load:
+        from utils.es_client import get_elasticsearch_client
+
+        client = get_elasticsearch_client()
+        if client is None:
+            raise SystemExit("Cannot connect to Elasticsearch")
+        bulk_load(client, generator, args.docs, recreate=args.recreate)
+    if not args.output and not args.load:
+        parser.error("nothing to do: pass --output and/or --load")
@@ -0,0 +1,471 @@
+"""
+Elasticsearch stand-in for offline benchmarks
+
+FakeElasticsearch answers search / msearch / scroll / count without a
+cluster. Responses are replayed from recordings (keyed by a request
+fingerprint) when available, otherwise they are generated from the
+request itself: every aggregation in the body gets buckets / values of the
+right shape, honouring the requested `size`, and `hits` contains
+synthetic posts with the fields the analytics modules read.
+
+Recordings are produced by wrapping a real client with
+RecordingElasticsearch while running the benchmark cases against a live
+cluster (python -m benchmarks.bench_analytics --record). With
+load_corpus(), hits and terms keys come from a benchmarks.corpus corpus.
+"""
+
+import copy
+import glob
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from datetime import datetime, timedelta
+
+from utils.profiling import current_profile, record_es_span
+
+RECORDINGS_DIR = os.path.join(os.path.dirname(__file__), "recordings")
+
+CHANNELS = ["twitter", "instagram", "tiktok", "facebook", "youtube", "news", "reddit", "linkedin", "threads"]
+SENTIMENTS = ["positive", "negative", "neutral"]
+WORDS = [
+    "pemerintah", "ekonomi", "harga", "pangan", "pemilu", "presiden", "jakarta", "banjir",
+    "pendidikan", "kesehatan", "subsidi", "bbm", "korupsi", "infrastruktur", "pajak", "digital",
+    "investasi", "ekspor", "rupiah", "inflasi", "startup", "umkm", "pariwisata", "energi",
+]
+REGIONS = ["jakarta", "jawa barat", "jawa timur", "bali", "sumatera utara", "sulawesi selatan"]
+
+# Tanggal di body query (mis. hasil "last 30 days") tidak ikut fingerprint
+_DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}([T ][\d:.]+)?(Z|[+-]\d{2}:?\d{2})?")
+
+
+def _normalize_for_fingerprint(value):
+    if isinstance(value, dict):
+        return {k: _normalize_for_fingerprint(v) for k, v in value.items() if k != "profile"}
+    if isinstance(value, list):
+        return [_normalize_for_fingerprint(v) for v in value]
+    if isinstance(value, str):
+        return _DATE_PATTERN.sub("<date>", value)
+    return value
+
+
+def request_fingerprint(method, kwargs):
+    """
+    Stable fingerprint of an Elasticsearch request
+
+    Absolute dates are masked so that recordings made with relative date
+    filters keep matching on later days.
+    """
+    request = {k: v for k, v in kwargs.items() if k not in ("headers", "params", "request_timeout")}
+    payload = json.dumps(
+        {"method": method, "request": _normalize_for_fingerprint(request)},
+        sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class RecordingElasticsearch:
+    """Wraps a real client and stores every response under its fingerprint"""
+
+    def __init__(self, client, directory=RECORDINGS_DIR):
+        self.client = client
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _record(self, method, kwargs):
+        response = getattr(self.client, method)(**kwargs)
+        body = getattr(response, "body", response)
+        fingerprint = request_fingerprint(method, kwargs)
+        with open(os.path.join(self.directory, f"{fingerprint}.json"), "w") as f:
+            json.dump({"method": method, "request": kwargs, "response": body}, f, default=str)
+        return response
+
+    def search(self, **kwargs):
+        return self._record("search", kwargs)
+
+    def msearch(self, **kwargs):
+        return self._record("msearch", kwargs)
+
+    def scroll(self, **kwargs):
+        return self._record("scroll", kwargs)
+
+    def count(self, **kwargs):
+        return self._record("count", kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class FakeElasticsearch:
+    """
+    Offline Elasticsearch client
+
+    Parameters:
+    -----------
+    recordings_dir : str, optional
+        Directory with recorded responses (replayed when the fingerprint matches)
+    max_buckets : int
+        Upper bound for generated terms buckets, whatever `size` the query asks for
+    total_hits : int
+        Value reported in hits.total for generated responses
+    seed : int
+        Base seed; generation is deterministic per request
+    """
+
+    def __init__(self, recordings_dir=None, max_buckets=5000, total_hits=50000, seed=0):
+        self.max_buckets = max_buckets
+        self.total_hits = total_hits
+        self.seed = seed
+        self.recordings = {}
+        self.stats = {"replayed": 0, "generated": 0}
+        self.corpus = []
+        self._value_counts = {}
+        self._composite_keys = {}
+        if recordings_dir:
+            for path in glob.glob(os.path.join(recordings_dir, "*.json")):
+                with open(path) as f:
+                    self.recordings[os.path.splitext(os.path.basename(path))[0]] = json.load(f)["response"]
+
+    def load_corpus(self, documents):
+        """
+        Serve hits and terms keys from a corpus (see benchmarks.corpus)
+
+        Parameters:
+        -----------
+        documents : iterable
+            Documents, or (index, document) pairs as produced by
+            CorpusGenerator.documents
+        """
+        for item in documents:
+            self.corpus.append(item[1] if isinstance(item, tuple) else item)
+        self._value_counts = {}
+
+    def _top_values(self, field, size):
+        # Nilai field terurut berdasarkan frekuensi di corpus (long tail Zipf)
+        field = field[:-len(".keyword")] if field.endswith(".keyword") else field
+        if field not in self._value_counts:
+            counts = {}
+            for doc in self.corpus:
+                values = doc.get(field)
+                for value in values if isinstance(values, list) else [values]:
+                    if value is not None:
+                        counts[value] = counts.get(value, 0) + 1
+            self._value_counts[field] = sorted(counts, key=counts.get, reverse=True)
+        return self._value_counts[field][:size]
+
+    # ------------------------------------------------------------------ API
+
+    def ping(self):
+        return True
+
+    def search(self, **kwargs):
+        return self._respond("search", kwargs, lambda rng: self._search_response(kwargs, rng))
+
+    def msearch(self, **kwargs):
+        def generate(rng):
+            searches = kwargs.get("searches") or kwargs.get("body") or []
+            bodies = searches[1::2]
+            return {"took": 1, "responses": [self._search_body_response(body, rng) for body in bodies]}
+        return self._respond("msearch", kwargs, generate)
+
+    def scroll(self, **kwargs):
+        # Scroll hasil generate berhenti di halaman pertama
+        return self._respond("scroll", kwargs, lambda rng: {
+            "_scroll_id": kwargs.get("scroll_id", "fake-scroll"),
+            "took": 1,
+            "hits": {"total": {"value": 0, "relation": "eq"}, "hits": []}
+        })
+
+    def count(self, **kwargs):
+        return self._respond("count", kwargs, lambda rng: {"count": self.total_hits})
+
+    def clear_scroll(self, **kwargs):
+        return {"succeeded": True}
+
+    # ------------------------------------------------------------ internals
+
+    def _respond(self, method, kwargs, generate):
+        start = time.perf_counter()
+        fingerprint = request_fingerprint(method, kwargs)
+        recorded = self.recordings.get(fingerprint)
+        if recorded is not None:
+            self.stats["replayed"] += 1
+            response = copy.deepcopy(recorded)
+        else:
+            self.stats["generated"] += 1
+            response = generate(random.Random(f"{self.seed}:{fingerprint}"))
+
+        # Span "es" agar fase query_build / post_processing terpisah di profile
+        profile = current_profile()
+        if profile is not None:
+            record_es_span(profile, method, kwargs, start, time.perf_counter(), response)
+        return response
+
+    def _search_response(self, kwargs, rng):
+        body = dict(kwargs.get("body") or {})
+        # Parameter search yang dikirim sebagai keyword argument
+        for key in ("size", "aggs", "aggregations", "script_fields", "query"):
+            if key in kwargs and key not in body:
+                body[key] = kwargs[key]
+        response = self._search_body_response(body, rng)
+        if kwargs.get("scroll") or body.get("scroll"):
+            response["_scroll_id"] = "fake-scroll"
+        return response
+
+    def _search_body_response(self, body, rng):
+        size = body.get("size", 10)
+        hits = [self._hit(body, rng, i) for i in range(min(size, self.total_hits))]
+        response = {
+            "took": rng.randint(5, 200),
+            "timed_out": False,
+            "_shards": {"total": 9, "successful": 9, "skipped": 0, "failed": 0},
+            "hits": {
+                "total": {"value": self.total_hits, "relation": "eq"},
+                "max_score": None,
+                "hits": hits
+            }
+        }
+        aggs = body.get("aggs") or body.get("aggregations")
+        if aggs:
+            response["aggregations"] = self._aggs(aggs, rng, self.total_hits)
+        return response
+
+    def _hit(self, body, rng, i):
+        if self.corpus:
+            source = dict(rng.choice(self.corpus))
+            hit = {"_index": f"{source['channel']}_data", "_id": f"{i}-{rng.random():.12f}",
+                   "_score": None, "_source": source}
+            if body.get("script_fields"):
+                hit["fields"] = {name: [round(rng.random() * 10, 3)] for name in body["script_fields"]}
+            return hit
+
+        channel = rng.choice(CHANNELS)
+        username = f"user_{int(rng.paretovariate(1.2)) % 5000}"
+        created = datetime(2025, 1, 1) + timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+        source = {
+            "post_caption": " ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 60))),
+            "channel": channel,
+            "username": username,
+            "user_image_url": f"https://cdn.example.com/{username}.jpg",
+            "link_post": f"https://www.{channel}.com/{username}/status/{rng.randint(10**12, 10**13)}",
+            "post_created_at": created.strftime("%Y-%m-%dT%H:%M:%S"),
+            "post_hashtags": [f"#{rng.choice(WORDS)}" for _ in range(rng.randint(0, 4))],
+            "sentiment": rng.choice(SENTIMENTS),
+            "cluster": " ".join(rng.choice(WORDS) for _ in range(3)),
+            "cluster_description": " ".join(rng.choice(WORDS) for _ in range(15)),
+            "region": ", ".join(rng.sample(REGIONS, rng.randint(1, 2))),
+            "language": rng.choice(["id", "en"]),
+            "intent": rng.choice(["informative", "opinion", "promotion", "complaint"]),
+            "emotions": rng.choice(["joy", "anger", "fear", "sadness", "neutral"]),
+            "likes": rng.randint(0, 100000),
+            "comments": rng.randint(0, 5000),
+            "replies": rng.randint(0, 5000),
+            "shares": rng.randint(0, 5000),
+            "reposts": rng.randint(0, 5000),
+            "views": rng.randint(0, 1000000),
+            "user_followers": rng.randint(0, 10_000_000),
+            "viral_score": round(rng.random() * 100, 3),
+            "reach_score": round(rng.random() * 100, 3),
+            "influence_score": round(rng.random() * 10, 3),
+            "user_influence_score": round(rng.random() * 10, 3),
+            "engagement_rate": round(rng.random() * 20, 3),
+            "user_category": rng.choice(["Influencer", "News Account", "Regular User"]),
+        }
+        hit = {"_index": f"{channel}_data", "_id": f"{i}-{rng.random():.12f}", "_score": None, "_source": source}
+        if body.get("script_fields"):
+            hit["fields"] = {name: [round(rng.random() * 10, 3)] for name in body["script_fields"]}
+        return hit
+
+    # ------------------------------------------------------------ aggregations
+
+    def _aggs(self, aggs, rng, doc_count):
+        # Pipeline bucket_sort tidak muncul di response, hanya memotong bucket
+        return {name: self._agg(spec, rng, doc_count) for name, spec in aggs.items()
+                if "bucket_sort" not in spec}
+
+    def _agg(self, spec, rng, doc_count):
+        sub_aggs = spec.get("aggs") or spec.get("aggregations") or {}
+
+        if "terms" in spec or "significant_terms" in spec:
+            terms = spec.get("terms") or spec.get("significant_terms")
+            size = min(terms.get("size", 10), self.max_buckets)
+            keys = self._term_keys(terms, size, rng)
+            counts = self._zipf_counts(len(keys), doc_count, rng)
+            buckets = []
+            for key, count in zip(keys, counts):
+                bucket = {"key": key, "doc_count": count}
+                if "significant_terms" in spec:
+                    bucket.update({"score": rng.random(), "bg_count": count * rng.randint(2, 10)})
+                bucket.update(self._aggs(sub_aggs, rng, count))
+                buckets.append(bucket)
+            return {
+                "doc_count_error_upper_bound": 0,
+                "sum_other_doc_count": max(doc_count - sum(counts), 0),
+                "buckets": self._bucket_sort(sub_aggs, buckets)
+            }
+
+        if "composite" in spec:
+            composite = spec["composite"]
+            names, keys = self._composite_population(composite, rng)
+            position = 0
+            if composite.get("after"):
+                after = tuple(composite["after"].get(name) for name in names)
+                position = keys.index(after) + 1 if after in keys else len(keys)
+            page = keys[position:position + composite.get("size", 10)]
+            counts = self._zipf_counts(len(keys), doc_count, rng)[position:position + len(page)]
+            buckets = []
+            for key, count in zip(page, counts):
+                bucket = {"key": dict(zip(names, key)), "doc_count": count}
+                bucket.update(self._aggs(sub_aggs, rng, count))
+                buckets.append(bucket)
+            response = {"buckets": buckets}
+            if buckets:
+                response["after_key"] = buckets[-1]["key"]
+            return response
+
+        if "multi_terms" in spec:
+            terms = spec["multi_terms"]
+            size = min(terms.get("size", 10), self.max_buckets)
+            values = [self._term_keys(source, size, rng) or ["unknown"] for source in terms.get("terms", [])]
+            counts = self._zipf_counts(size, doc_count, rng)
+            buckets = []
+            for i, count in enumerate(counts):
+                key = [column[i % len(column)] for column in values]
+                bucket = {"key": key, "key_as_string": "|".join(map(str, key)), "doc_count": count}
+                bucket.update(self._aggs(sub_aggs, rng, count))
+                buckets.append(bucket)
+            return {"doc_count_error_upper_bound": 0,
+                    "sum_other_doc_count": max(doc_count - sum(counts), 0),
+                    "buckets": self._bucket_sort(sub_aggs, buckets)}
+
+        if "date_histogram" in spec:
+            buckets = []
+            day = datetime(2025, 1, 1)
+            counts = [max(int(doc_count / 30 * rng.uniform(0.5, 1.5)), 0) for _ in range(30)]
+            for count in counts:
+                bucket = {
+                    "key_as_string": day.strftime("%Y-%m-%d"),
+                    "key": int(day.timestamp() * 1000),
+                    "doc_count": count
+                }
+                bucket.update(self._aggs(sub_aggs, rng, count))
+                buckets.append(bucket)
+                day += timedelta(days=1)
+            return {"buckets": buckets}
+
+        if "filters" in spec:
+            filters = spec["filters"].get("filters", {})
+            names = filters.keys() if isinstance(filters, dict) else range(len(filters))
+            buckets = {}
+            for name in names:
+                count = rng.randint(0, doc_count)
+                buckets[name] = {"doc_count": count, **self._aggs(sub_aggs, rng, count)}
+            return {"buckets": buckets if isinstance(filters, dict) else list(buckets.values())}
+
+        if "filter" in spec or "missing" in spec:
+            count = rng.randint(0, doc_count)
+            return {"doc_count": count, **self._aggs(sub_aggs, rng, count)}
+
+        if "range" in spec:
+            buckets = []
+            for r in spec["range"].get("ranges", []):
+                count = rng.randint(0, doc_count)
+                buckets.append({**r, "key": f"{r.get('from', '*')}-{r.get('to', '*')}",
+                                "doc_count": count, **self._aggs(sub_aggs, rng, count)})
+            return {"buckets": buckets}
+
+        if "top_hits" in spec:
+            size = spec["top_hits"].get("size", 3)
+            return {"hits": {
+                "total": {"value": doc_count, "relation": "eq"},
+                "max_score": None,
+                "hits": [self._hit({}, rng, i) for i in range(min(size, max(doc_count, 1)))]
+            }}
+
+        if "top_metrics" in spec:
+            if not doc_count:
+                return {"top": []}
+            metrics = spec["top_metrics"].get("metrics", [])
+            metrics = metrics if isinstance(metrics, list) else [metrics]
+            return {"top": [{
+                "sort": [rng.randint(0, 1_000_000)],
+                "metrics": {m["field"]: (self._term_keys(m, 1, rng) or [None])[0] for m in metrics}
+            }]}
+
+        if "cardinality" in spec or "value_count" in spec:
+            return {"value": rng.randint(0, doc_count)}
+
+        if "max" in spec or "min" in spec or "avg" in spec:
+            return {"value": round(rng.random() * 1_000_000, 3) if doc_count else None}
+
+        if "sum" in spec:
+            return {"value": round(rng.random() * 1_000_000 * max(doc_count, 1) ** 0.5, 3)}
+
+        # Agregasi lain: bentuk minimal
+        return {"value": None}
+
+    @staticmethod
+    def _bucket_sort(sub_aggs, buckets):
+        # Hanya from/size dari bucket_sort (urutan bucket generate sudah menurun)
+        for spec in sub_aggs.values():
+            if "bucket_sort" in spec:
+                start = spec["bucket_sort"].get("from", 0)
+                size = spec["bucket_sort"].get("size")
+                buckets = buckets[start:start + size if size is not None else None]
+        return buckets
+
+    def _composite_population(self, composite, rng):
+        # Semua kombinasi key composite, stabil antar halaman (after_key)
+        sources = composite.get("sources", [])
+        fingerprint = json.dumps(sources, sort_keys=True)
+        if fingerprint not in self._composite_keys:
+            names = [next(iter(source)) for source in sources]
+            values = [self._term_keys(next(iter(source.values())).get("terms", {}), self.max_buckets, rng) or ["unknown"]
+                      for source in sources]
+            size = max((len(column) for column in values), default=0)
+            keys = list(dict.fromkeys(tuple(column[i % len(column)] for column in values)
+                                      for i in range(size)))
+            self._composite_keys[fingerprint] = (names, keys)
+        return self._composite_keys[fingerprint]
+
+    @staticmethod
+    def _zipf_counts(n, doc_count, rng):
+        if n == 0:
+            return []
+        weights = [1.0 / (rank + 1) for rank in range(n)]
+        total = sum(weights)
+        return [max(int(doc_count * w / total), 1) for w in weights]
+
+    def _term_keys(self, terms, size, rng):
+        field = terms.get("field", "")
+        script = json.dumps(terms.get("script", ""))
+        include = terms.get("include")
+        if isinstance(include, list):
+            return include[:size]
+        if self.corpus and field:
+            keys = self._top_values(field, size)
+            if keys:
+                return keys
+
+        if "|" in script:
+            # Key gabungan username|channel (kol_overview)
+            return [f"user_{i}|{CHANNELS[i % len(CHANNELS)]}" for i in range(size)]
+        if field.startswith("channel"):
+            return CHANNELS[:size]
+        if field.startswith("sentiment"):
+            return SENTIMENTS[:size]
+        if field.startswith("username"):
+            return [f"user_{i}" for i in range(size)]
+        if field.startswith("link_post"):
+            return [f"https://www.site{i % 700}.com/{rng.choice(WORDS)}/{i}" for i in range(size)]
+        if field.startswith("post_hashtags"):
+            return [f"#{rng.choice(WORDS)}{i}" for i in range(size)]
+        if field.startswith("region"):
+            return [", ".join(rng.sample(REGIONS, 2)) for _ in range(size)]
+        if field.startswith("user_image_url"):
+            return [f"https://cdn.example.com/avatar_{i}.jpg" for i in range(size)]
+        if field.startswith("user_category"):
+            return ["Influencer", "News Account", "Regular User"][:size]
+        return [f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}" for i in range(size)]
@@ -0,0 +1,266 @@
+"""
+Load-test harness
+
+Replays a realistic mix of /api/v2/* calls against a running API at a
+target request rate (open loop: requests are started on schedule, whether
+or not earlier ones have finished) and reports p50/p95/p99 latency per
+endpoint plus cache hit rates, taken from the /metrics counters before and
+after the run.
+
+Request parameters are drawn with a Zipf distribution over keyword sets,
+date filters and channel subsets, so popular dashboards repeat (and hit
+the cache) the way they do in production.
+
+The API can run against a real cluster, or in-process with the fake
+Elasticsearch client serving a synthetic corpus (--serve-fake). In that
+mode Redis is used as configured, so the cache behaves as in production.
+
+Usage:
+    python -m benchmarks.load_test --base-url http://localhost:8080 --rps 20 --duration 60
+    python -m benchmarks.load_test --serve-fake --port 8099 --corpus-docs 2000 --rps 20
+"""
+
+import argparse
+import json
+import random
+import re
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.corpus import ZipfSampler
+
+# Endpoint dan bobotnya: satu halaman dashboard memanggil beberapa endpoint sekaligus
+ENDPOINT_MIX = [
+    ("/api/v2/stats", 10, {"compare_with_previous": True}),
+    ("/api/v2/keyword-trends", 10, {}),
+    ("/api/v2/list-of-mentions", 12, {"page_size": 10, "sort_type": "recent"}),
+    ("/api/v2/context-of-discussion", 6, {}),
+    ("/api/v2/analysis-overview", 6, {}),
+    ("/api/v2/mention-sentiment-breakdown", 5, {}),
+    ("/api/v2/presence-score", 4, {}),
+    ("/api/v2/most-share-of-voice", 5, {"limit": 100, "page_size": 10}),
+    ("/api/v2/most-followers", 5, {"limit": 100, "page_size": 10}),
+    ("/api/v2/trending-hashtags", 5, {"limit": 100, "page_size": 10}),
+    ("/api/v2/trending-links", 4, {"limit": 100, "page_size": 10}),
+    ("/api/v2/popular-emojis", 4, {"limit": 100, "page_size": 10}),
+    ("/api/v2/intent-emotions-region", 4, {}),
+    ("/api/v2/topics-cluster", 3, {}),
+    ("/api/v2/kol-overview", 4, {}),
+]
+
+KEYWORD_SETS = [
+    ["prabowo"], ["gibran"], ["prabowo", "gibran"], ["harga beras"], ["bbm", "subsidi"],
+    ["banjir jakarta"], ["korupsi"], ["pemilu"], ["timnas"], ["ibu kota nusantara"],
+    ["pajak"], ["rupiah"], ["inflasi"], ["umkm"], ["pendidikan gratis"],
+    ["makan siang gratis"], ["tapera"], ["judi online"], ["pinjol"], ["kereta cepat"],
+]
+DATE_FILTERS = ["last 30 days", "last 7 days", "last 14 days", "yesterday", "this week"]
+CHANNEL_SETS = [None, ["twitter"], ["instagram", "tiktok"], ["news"], ["twitter", "news"]]
+
+_CACHE_SAMPLE = re.compile(r'^moskal_cache_requests_total\{prefix="([^"]*)",result="([^"]*)"\} (\S+)$')
+
+
+class RequestMix:
+    """Draws (path, body) pairs following ENDPOINT_MIX and Zipf-distributed parameters"""
+
+    def __init__(self, seed=7, owner_id="5", project_name="loadtest"):
+        self.rng = random.Random(seed)
+        self.paths = [path for path, _, _ in ENDPOINT_MIX]
+        self.weights = [weight for _, weight, _ in ENDPOINT_MIX]
+        self.extras = {path: extra for path, _, extra in ENDPOINT_MIX}
+        self.keywords = ZipfSampler(KEYWORD_SETS, s=1.2)
+        self.date_filters = ZipfSampler(DATE_FILTERS, s=1.5)
+        self.channels = ZipfSampler(CHANNEL_SETS, s=1.5)
+        self.owner_id = owner_id
+        self.project_name = project_name
+        self._lock = threading.Lock()
+
+    def next(self):
+        with self._lock:
+            path = self.rng.choices(self.paths, weights=self.weights)[0]
+            body = {
+                "keywords": self.keywords.sample(self.rng),
+                "date_filter": self.date_filters.sample(self.rng),
+                "channels": self.channels.sample(self.rng),
+                "owner_id": self.owner_id,
+                "project_name": self.project_name,
+                **self.extras[path]
+            }
+            if "page_size" in body:
+                body["page"] = self.rng.choices([1, 2, 3], weights=[8, 2, 1])[0]
+        return path, body
+
+
+def scrape_cache_counters(base_url):
+    """Read moskal_cache_requests_total from /metrics as {(prefix, result): value}"""
+    try:
+        with urllib.request.urlopen(base_url.rstrip("/") + "/metrics", timeout=10) as resp:
+            text = resp.read().decode("utf-8")
+    except (urllib.error.URLError, OSError) as e:
+        print(f"Cannot scrape /metrics: {e}")
+        return {}
+    counters = {}
+    for line in text.splitlines():
+        match = _CACHE_SAMPLE.match(line)
+        if match:
+            counters[(match.group(1), match.group(2))] = float(match.group(3))
+    return counters
+
+
+def _send(base_url, path, body, timeout):
+    request = urllib.request.Request(
+        base_url.rstrip("/") + path,
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json", "Accept-Encoding": "gzip, br"},
+        method="POST"
+    )
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except (urllib.error.URLError, OSError):
+        status = "error"
+    return path, status, (time.perf_counter() - start) * 1000
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def run_load(base_url, rps, duration, workers=64, timeout=120, seed=7):
+    """
+    Drive the API at `rps` requests per second for `duration` seconds
+
+    Returns:
+    --------
+    dict
+        Per-endpoint latency percentiles and error counts, plus cache hit rates
+    """
+    mix = RequestMix(seed=seed)
+    before = scrape_cache_counters(base_url)
+    results = []
+    results_lock = threading.Lock()
+    late = 0
+
+    def task(path, body):
+        outcome = _send(base_url, path, body, timeout)
+        with results_lock:
+            results.append(outcome)
+
+    interval = 1.0 / rps
+    total = int(rps * duration)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i in range(total):
+            scheduled = started + i * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -interval:
+                late += 1
+            pool.submit(task, *mix.next())
+    elapsed = time.perf_counter() - started
+    after = scrape_cache_counters(base_url)
+
+    endpoints = {}
+    for path, status, ms in results:
+        stats = endpoints.setdefault(path, {"latencies": [], "errors": 0})
+        if status == 200:
+            stats["latencies"].append(ms)
+        else:
+            stats["errors"] += 1
+
+    report = {"achieved_rps": round(len(results) / elapsed, 2), "late_dispatches": late, "endpoints": {}, "cache": {}}
+    for path, stats in sorted(endpoints.items()):
+        latencies = stats["latencies"]
+        report["endpoints"][path] = {
+            "requests": len(latencies) + stats["errors"],
+            "errors": stats["errors"],
+            "p50_ms": round(statistics.median(latencies), 1) if latencies else None,
+            "p95_ms": round(_percentile(latencies, 95), 1) if latencies else None,
+            "p99_ms": round(_percentile(latencies, 99), 1) if latencies else None,
+        }
+
+    prefixes = {prefix for prefix, _ in after}
+    for prefix in sorted(prefixes):
+        delta = {result: after.get((prefix, result), 0) - before.get((prefix, result), 0)
+                 for result in ("hit", "miss", "unavailable")}
+        lookups = sum(delta.values())
+        if lookups:
+            report["cache"][prefix] = {
+                "lookups": int(lookups),
+                "hit_rate": round(delta["hit"] / lookups, 3),
+                "unavailable": int(delta["unavailable"])
+            }
+    return report
+
+
+def print_report(report):
+    print(f"achieved rps: {report['achieved_rps']}  (late dispatches: {report['late_dispatches']})")
+    print(f"{'endpoint':<40}{'req':>7}{'err':>6}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for path, stats in report["endpoints"].items():
+        print(f"{path:<40}{stats['requests']:>7}{stats['errors']:>6}"
+              f"{stats['p50_ms'] or 0:>10.1f}{stats['p95_ms'] or 0:>10.1f}{stats['p99_ms'] or 0:>10.1f}")
+    if report["cache"]:
+        print(f"\n{'cache prefix':<30}{'lookups':>10}{'hit rate':>10}")
+        for prefix, stats in report["cache"].items():
+            print(f"{prefix:<30}{stats['lookups']:>10}{stats['hit_rate']:>10.1%}")
+
+
+def serve_fake(port, corpus_docs, seed=42):
+    """Start the API in a background thread with the fake Elasticsearch client and a synthetic corpus"""
+    import uvicorn
+
+    import main
+    from benchmarks.bench_analytics import install_fakes
+    from benchmarks.corpus import CorpusGenerator
+    from benchmarks.fake_es import FakeElasticsearch
+
+    fake = FakeElasticsearch(max_buckets=2000)
+    fake.load_corpus(CorpusGenerator(seed=seed).documents(corpus_docs))
+    # Modul analytics di-import lazy; muat dulu supaya bisa di-patch
+    for function in main.ANALYTICS_FUNCTIONS:
+        function.load()
+    install_fakes(fake, bypass_cache=False)
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.1)
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test harness for the analytics API")
+    parser.add_argument("--base-url", default="http://localhost:8080")
+    parser.add_argument("--rps", type=float, default=10)
+    parser.add_argument("--duration", type=float, default=60, help="Seconds")
+    parser.add_argument("--workers", type=int, default=64)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--serve-fake", action="store_true",
+                        help="Run the API in-process against the fake Elasticsearch client")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--corpus-docs", type=int, default=2000, help="Corpus documents per index (--serve-fake)")
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    base_url = args.base_url
+    if args.serve_fake:
+        serve_fake(args.port, args.corpus_docs)
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    report = run_load(base_url, args.rps, args.duration, workers=args.workers, timeout=args.timeout, seed=args.seed)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -4,33 +4,53 @@ from typing import Optional, List
 from datetime import datetime
 from pydantic import BaseModel, Field
 from fastapi.middleware.cors import CORSMiddleware  # Import CORS middleware
-from fastapi.responses import StreamingResponse
-from utils.gemini import call_gemini
-
-from utils.analysis_overview import get_social_media_matrix
-from utils.analysis_sentiment_mentions import get_category_analytics
-from utils.context_of_disccusion import get_context_of_discussion
-from utils.intent_emotions_region import get_intents_emotions_region_share
-from utils.keyword_trends import get_keyword_trends
-from utils.list_of_mentions import get_mentions
-from utils.topics_sentiment_analysis import get_topics_sentiment_analysis
-
-from utils.topics_cluster import get_topics_cluster
-from utils.kol_overview import search_kol
-from utils.most_followers import get_most_followers
-from utils.popular_emojis import get_popular_emojis
-from utils.presence_score import get_presence_score
-from utils.share_of_voice import get_share_of_voice
-from utils.summary_stats import get_stats_summary
-from utils.trending_hashtags import get_trending_hashtags
-from utils.trending_links import get_trending_links
-from utils.moskal_ai import pipeline_ai_streaming
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from utils.responses import ORJSONResponse
+from utils.compression import CompressionMiddleware
+from utils.metrics import MetricsMiddleware, registry as metrics_registry
+from utils.profiling import ProfilingMiddleware
+from utils.slow_query_log import get_slow_queries
+
+from utils.lazy_import import lazy_function, warm_up
+
+# Modul analytics (pandas, numpy, Vertex AI) di-import saat endpoint pertama kali
+# dipanggil, atau lebih awal oleh warm-up di lifespan (lihat STARTUP_WARMUP)
+get_social_media_matrix = lazy_function("utils.analysis_overview", "get_social_media_matrix")
+get_category_analytics = lazy_function("utils.analysis_sentiment_mentions", "get_category_analytics")
+get_context_of_discussion = lazy_function("utils.context_of_disccusion", "get_context_of_discussion")
+get_intents_emotions_region_share = lazy_function("utils.intent_emotions_region", "get_intents_emotions_region_share")
+get_keyword_trends = lazy_function("utils.keyword_trends", "get_keyword_trends")
+get_mentions = lazy_function("utils.list_of_mentions", "get_mentions")
+get_topics_sentiment_analysis = lazy_function("utils.topics_sentiment_analysis", "get_topics_sentiment_analysis")
+get_topics_cluster = lazy_function("utils.topics_cluster", "get_topics_cluster")
+search_kol = lazy_function("utils.kol_overview", "search_kol")
+get_most_followers = lazy_function("utils.most_followers", "get_most_followers")
+get_popular_emojis = lazy_function("utils.popular_emojis", "get_popular_emojis")
+get_presence_score = lazy_function("utils.presence_score", "get_presence_score")
+get_share_of_voice = lazy_function("utils.share_of_voice", "get_share_of_voice")
+get_stats_summary = lazy_function("utils.summary_stats", "get_stats_summary")
+get_trending_hashtags = lazy_function("utils.trending_hashtags", "get_trending_hashtags")
+get_trending_links = lazy_function("utils.trending_links", "get_trending_links")
+pipeline_ai_streaming = lazy_function("utils.moskal_ai", "pipeline_ai_streaming")
+
+ANALYTICS_FUNCTIONS = [
+    get_social_media_matrix, get_category_analytics, get_context_of_discussion,
+    get_intents_emotions_region_share, get_keyword_trends, get_mentions,
+    get_topics_sentiment_analysis, get_topics_cluster, search_kol, get_most_followers,
+    get_popular_emojis, get_presence_score, get_share_of_voice, get_stats_summary,
+    get_trending_hashtags, get_trending_links, pipeline_ai_streaming
+]
 from models.types import AIFeedbackData # Import the new model
 from elasticsearch import Elasticsearch, NotFoundError # Import Elasticsearch and NotFoundError
 from fastapi import BackgroundTasks, HTTPException # Added for v2 endpoint and error handling
 import sys
 import traceback
 import json
+import os
+import time
+import asyncio
+import threading
+from contextlib import asynccontextmanager
 
 try:
     # Log versioning info
@@ -41,10 +61,42 @@ except Exception as e:
     traceback.print_exc()
     sys.exit(1)
     
+def run_warmup():
+    """Import analytics modules, connect Redis and build the Gemini model"""
+    from utils.redis_client import redis_client
+    from utils.gemini import get_gemini
+
+    extra = [("redis", redis_client.is_connected)]
+    if os.getenv("GEMINI_CREDS_LOCATION"):
+        extra.append(("gemini", get_gemini))
+    start = time.perf_counter()
+    timings = warm_up(ANALYTICS_FUNCTIONS, extra)
+    print(f"Warm-up finished in {time.perf_counter() - start:.2f}s: {timings}")
+    return timings
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # STARTUP_WARMUP: background (default, server langsung menerima request),
+    # blocking (startup menunggu warm-up selesai) atau off (murni lazy)
+    mode = os.getenv("STARTUP_WARMUP", "background").lower()
+    if mode == "blocking":
+        await asyncio.to_thread(run_warmup)
+    elif mode == "background":
+        threading.Thread(target=run_warmup, name="warmup", daemon=True).start()
+    yield
+    # Client ES async (Moskal AI) hanya ada kalau sudah pernah dipakai
+    es_client_module = sys.modules.get("utils.es_client")
+    if es_client_module is not None:
+        await es_client_module.close_async_elasticsearch_client()
+
+
 app = FastAPI(
     title="Social Media Analytics API",
     description="API for analyzing social media data from Elasticsearch",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 
@@ -57,6 +109,15 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Mode profiling opt-in: ?debug=profile atau header X-Debug: profile
+app.add_middleware(ProfilingMiddleware)
+
+# Kompresi brotli/gzip untuk response besar (trending-links, kol-overview, mentions)
+app.add_middleware(CompressionMiddleware)
+
+# Metrics per route (latency, ukuran response, in-flight) -> /metrics
+app.add_middleware(MetricsMiddleware)
+
 
 # Base model for common parameters
 class CommonParams(BaseModel):
@@ -368,6 +429,33 @@ example_json = {
     "domain": ["kumparan.com", "detik.com"]
 }
 
+########### MONITORING ##########
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    Metrics dalam format teks Prometheus.
+    
+    Berisi latency per route, waktu ES (took vs wall) per query,
+    cache hit/miss per prefix, latency & token Gemini, ukuran response,
+    dan jumlah request in-flight.
+    """
+    return PlainTextResponse(
+        metrics_registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+@app.get("/debug/slow-queries", include_in_schema=False)
+def slow_queries(
+    limit: int = Query(50, ge=1, le=1000),
+    endpoint: Optional[str] = None,
+    operation: Optional[str] = None
+):
+    """
+    Query Elasticsearch yang melewati ambang ES_SLOW_QUERY_MS (terbaru dulu),
+    lengkap dengan body query dan fingerprint parameter.
+    """
+    return ORJSONResponse(get_slow_queries(limit=limit, endpoint=endpoint, operation=operation))
+
 ########### DASHBOARD MENU ##########
 @app.post("/api/v2/keyword-trends", tags=["Dashboard Menu"])
 def keyword_trends_analysis(
@@ -398,7 +486,7 @@ def keyword_trends_analysis(
     if 'channels' in params_dict and isinstance(params_dict['channels'], list):
         params_dict['channels'] = ['news' if ch == 'media' else ch for ch in params_dict['channels']]
 
-    return get_keyword_trends(**params_dict)
+    return ORJSONResponse(get_keyword_trends(**params_dict))
 
 @app.post("/api/v2/context-of-discussion", tags=["Dashboard Menu"])
 def context_analysis(
@@ -428,7 +516,7 @@ def context_analysis(
     if 'channels' in params_dict and isinstance(params_dict['channels'], list):
         params_dict['channels'] = ['news' if ch == 'media' else ch for ch in params_dict['channels']]
 
-    return get_context_of_discussion(**params_dict)
+    return ORJSONResponse(get_context_of_discussion(**params_dict))
 
 @app.post("/api/v2/list-of-mentions", tags=["Dashboard Menu"])
 def get_mentions_list(
@@ -482,7 +570,7 @@ def get_mentions_list(
     if 'channels' in params_dict and isinstance(params_dict['channels'], list):
         params_dict['channels'] = ['news' if ch == 'media' else ch for ch in params_dict['channels']]
 
-    return get_mentions(**params_dict)
+    return ORJSONResponse(get_mentions(**params_dict))
 
 
 ########### ANALYSIS MENU ##########
@@ -507,7 +595,7 @@ def analysis_overview(
     - Summary -> Summary
     - Comparison -> Overview
     """
-    return get_social_media_matrix(**params.dict())
+    return ORJSONResponse(get_social_media_matrix(**params.dict()))
 
 @app.post("/api/v2/mention-sentiment-breakdown", tags=["Analysis Menu"])
 def analysis_sentiment(
@@ -537,7 +625,7 @@ def analysis_sentiment(
         1. Sentiment breakdown
         2. Channels share -> gunakan Mention by categories
     """
-    return get_category_analytics(**params.dict())
+    return ORJSONResponse(get_category_analytics(**params.dict()))
 
 
 @app.post("/api/v2/presence-score", tags=["Analysis Menu"])
@@ -582,7 +670,7 @@ def presence_score_analysis(
     - compare_with_topics: true/false
     - num_topics_to_compare: jumlah topik untuk dibandingkan
     """
-    return get_presence_score(**params.dict())
+    return ORJSONResponse(get_presence_score(**params.dict()))
 
 
 @app.post("/api/v2/most-share-of-voice", tags=["Analysis Menu"])
@@ -616,7 +704,7 @@ def share_of_voice_analysis(
     - page_size: jumlah data per halaman
     - include_total_count: true/false untuk menampilkan total data
     """
-    return get_share_of_voice(**params.dict())
+    return ORJSONResponse(get_share_of_voice(**params.dict()))
 
 
 @app.post("/api/v2/most-followers", tags=["Analysis Menu"])
@@ -650,7 +738,7 @@ def most_followers_analysis(
     - page_size: jumlah data per halaman
     - include_total_count: true/false untuk menampilkan total data
     """
-    return get_most_followers(**params.dict())
+    return ORJSONResponse(get_most_followers(**params.dict()))
 
 
 @app.post("/api/v2/trending-hashtags", tags=["Analysis Menu"])
@@ -684,7 +772,7 @@ def trending_hashtags_analysis(
     - page_size: jumlah data per halaman
     - sort_by: cara pengurutan data
     """
-    return get_trending_hashtags(**params.dict())
+    return ORJSONResponse(get_trending_hashtags(**params.dict()))
 
 @app.post("/api/v2/trending-links", tags=["Analysis Menu"])
 def trending_links_analysis(
@@ -715,7 +803,7 @@ def trending_links_analysis(
     - page: halaman yang ditampilkan
     - page_size: jumlah data per halaman
     """
-    return get_trending_links(**params.dict())
+    return ORJSONResponse(get_trending_links(**params.dict()))
 
 @app.post("/api/v2/popular-emojis", tags=["Analysis Menu"])
 def popular_emojis_analysis(
@@ -746,7 +834,7 @@ def popular_emojis_analysis(
     - page: halaman yang ditampilkan
     - page_size: jumlah data per halaman
     """
-    return get_popular_emojis(**params.dict())
+    return ORJSONResponse(get_popular_emojis(**params.dict()))
 
 ########### SUMMARY MENU ##########
 
@@ -775,7 +863,7 @@ def stats_summary_analysis(
     Parameter tambahan:
     - compare_with_previous: true/false untuk membandingkan dengan periode sebelumnya
     """
-    return get_stats_summary(**params.dict())
+    return ORJSONResponse(get_stats_summary(**params.dict()))
 
 ########### TOPICS MENU ##########
 @app.post("/api/v2/intent-emotions-region", tags=["Topics Menu"])
@@ -801,7 +889,7 @@ def intent_emotions_analysis(
         2. Emotions Shares
         3. Top Regions
     """
-    return get_intents_emotions_region_share(**params.dict())
+    return ORJSONResponse(get_intents_emotions_region_share(**params.dict()))
 
 @app.post("/api/v2/topics-sentiment", tags=["Topics Menu"])
 def topics_sentiment_analysis(
@@ -825,7 +913,7 @@ def topics_sentiment_analysis(
     """
 
 
-    return get_topics_sentiment_analysis(**params.dict())
+    return ORJSONResponse(get_topics_sentiment_analysis(**params.dict()))
 
 @app.post("/api/v2/kol-overview", tags=["KOL Menu"])
 def kol_overview_analysis(
@@ -867,7 +955,7 @@ def kol_overview_analysis(
     if 'channels' in params_dict and isinstance(params_dict['channels'], list):
         params_dict['channels'] = ['news' if ch == 'media' else ch for ch in params_dict['channels']]
 
-    return search_kol(**params_dict)
+    return ORJSONResponse(search_kol(**params_dict))
 
 @app.post("/api/v2/topics-cluster", tags=["Topics Menu"])
 def topics_cluster_analysis(
@@ -901,7 +989,7 @@ def topics_cluster_analysis(
     if 'channels' in params_dict and isinstance(params_dict['channels'], list):
         params_dict['channels'] = ['news' if ch == 'media' else ch for ch in params_dict['channels']]
 
-    return get_topics_cluster(**params_dict)
+    return ORJSONResponse(get_topics_cluster(**params_dict))
 
 ########### MOSKAL AI ##########
 @app.get("/api/v2/moskal-ai",tags=["Moskal AI"])
@@ -939,7 +1027,9 @@ def stream_analysis(
             media_type="text/plain",
             headers={
                 "Cache-Control": "no-cache",
-                "Connection": "keep-alive"
+                "Connection": "keep-alive",
+                # Matikan buffering reverse proxy (nginx) supaya delta langsung sampai ke client
+                "X-Accel-Buffering": "no"
             }
         )
         
@@ -5,27 +5,39 @@ This package provides utilities for connecting to Elasticsearch,
 building queries, and fetching data for analytical purposes.
 """
 
-from utils.es_client import get_elasticsearch_client
-from utils.es_query_builder import (
-    build_elasticsearch_query,
-    get_indices_from_channels,
-    get_date_range,
-    add_time_series_aggregation
-)
-from utils.es_data_fetcher import (
-    fetch_elasticsearch_data,
-    process_time_series_results,
-    keyword_trends,
-    context_of_discussion
-)
-from utils.text_processor import (
-    preprocess_text,
-    get_stopwords,
-    get_indonesian_stopwords,
-    get_english_stopwords
-)
-
-from utils.list_of_mentions import get_mentions
+import importlib
+
+# Nama publik -> modul asalnya. Di-import saat pertama diakses (PEP 562), sehingga
+# `import utils.<modul>` tidak ikut memuat nltk, pandas, dst.
+_LAZY_ATTRIBUTES = {
+    'get_elasticsearch_client': 'utils.es_client',
+    'build_elasticsearch_query': 'utils.es_query_builder',
+    'get_indices_from_channels': 'utils.es_query_builder',
+    'get_date_range': 'utils.es_query_builder',
+    'add_time_series_aggregation': 'utils.es_query_builder',
+    'fetch_elasticsearch_data': 'utils.es_data_fetcher',
+    'process_time_series_results': 'utils.es_data_fetcher',
+    'keyword_trends': 'utils.es_data_fetcher',
+    'context_of_discussion': 'utils.es_data_fetcher',
+    'preprocess_text': 'utils.text_processor',
+    'get_stopwords': 'utils.text_processor',
+    'get_indonesian_stopwords': 'utils.text_processor',
+    'get_english_stopwords': 'utils.text_processor',
+    'get_mentions': 'utils.list_of_mentions',
+}
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module 'utils' has no attribute '{name}'")
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
 
 __all__ = [
     # Client
@@ -1,6 +1,5 @@
 import argparse
 import json
-import pandas as pd
 from datetime import datetime, timedelta
 from typing import Dict, List, Literal, Optional, Union
 
@@ -8,7 +7,9 @@ from typing import Dict, List, Literal, Optional, Union
 from utils.es_client import get_elasticsearch_client
 from utils.es_query_builder import get_date_range
 from utils.redis_client import redis_client
+from utils.metrics import instrument
 from utils.script_score import script_score
+@instrument()
 def get_social_media_matrix(
     es_host=None,
     es_username=None,
@@ -452,8 +453,6 @@ def get_social_media_matrix(
     current_base_query = build_base_query(start_date, end_date)
     current_metrics_query = build_metrics_query(current_base_query)
     
-    import json
-    #print(json.dumps(current_metrics_query, indent=2))
 
     current_all_response = es.search(
         index=",".join(all_indices),
@@ -481,7 +480,6 @@ def get_social_media_matrix(
         # Bangun dan jalankan query untuk periode sebelumnya
         previous_base_query = build_base_query(previous_start_str, previous_end_str)
         previous_metrics_query = build_metrics_query(previous_base_query)
-        #print(json.dumps(previous_base_query, indent=2))
 
         previous_all_response = es.search(
             index=",".join(all_indices),
@@ -7,7 +7,6 @@ kategori dari Elasticsearch untuk visualisasi.
 
 import argparse
 import json
-import pandas as pd
 from datetime import datetime
 from typing import Dict, List, Literal, Optional, Union, Tuple
 
@@ -15,7 +14,9 @@ from typing import Dict, List, Literal, Optional, Union, Tuple
 from utils.es_client import get_elasticsearch_client
 from utils.es_query_builder import get_date_range
 from utils.redis_client import redis_client
+from utils.metrics import instrument
 
+@instrument()
 def get_category_analytics(
     es_host=None,
     es_username=None,
@@ -343,8 +344,6 @@ def get_category_analytics(
 
         # Query untuk kategori
         category_query = build_category_query()
-        import json
-        #print(json.dumps(category_query, indent=2))
 
         category_response = es.search(
             index=",".join(available_indices),
@@ -358,9 +357,6 @@ def get_category_analytics(
             body=sentiment_category_query
         )
         
-        import json
-        #print(json.dumps(category_query, indent=2))
-        #print(json.dumps(sentiment_category_query, indent=2))
 
 
         # Proses data kategori
@@ -0,0 +1,198 @@
+"""
+Attribute Lookup
+
+Author avatars (`user_image_url`) and cluster descriptions
+(`cluster_description`) are attributes of an author or a cluster, not
+metrics of a filtered set of posts. Instead of a `top_hits`
+sub-aggregation on every bucket (which loads `_source` per bucket), the
+endpoints aggregate their metrics first and then look these attributes
+up in one batched request for the keys they actually return:
+
+- avatars: a `terms` aggregation on the `user_image_url` keyword doc
+  values per (channel, username);
+- descriptions: one search collapsed on `cluster.keyword` that returns a
+  single `cluster_description` per cluster.
+
+The full author paths do not need a lookup: the shared author metrics
+(utils.author_metrics) read `user_image_url` from doc values, with a
+`terms` size 1 on the raw posts (utils.kol_engine) and a `top_metrics`
+sorted by day on author_daily (utils.author_rollup).
+
+Both rarely change, so looked-up values are kept in an in-process LRU
+cache (ATTRIBUTE_CACHE_SIZE entries, ATTRIBUTE_CACHE_TTL seconds) and
+only the keys that are not cached yet go to Elasticsearch. A cluster
+without a description is not cached, so a description added later is
+picked up by the next request.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+ATTRIBUTE_CACHE_SIZE = int(os.getenv("ATTRIBUTE_CACHE_SIZE", "50000"))
+# Default 6 jam
+ATTRIBUTE_CACHE_TTL = int(os.getenv("ATTRIBUTE_CACHE_TTL", str(6 * 3600)))
+
+
+class AttributeCache:
+    """Thread-safe LRU cache with a time-to-live per entry"""
+
+    def __init__(self, max_size=ATTRIBUTE_CACHE_SIZE, ttl=ATTRIBUTE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        """Cached values of `keys` as a dict (missing and expired keys are left out)"""
+        now = time.time()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if now - entry[0] > self.ttl:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry[1]
+        return found
+
+    def set_many(self, values):
+        now = time.time()
+        with self._lock:
+            for key, value in values.items():
+                self._entries[key] = (now, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = AttributeCache()
+
+
+def _missing(namespace, keys):
+    keys = list(dict.fromkeys(keys))
+    cached = _cache.get_many([(namespace, key) for key in keys])
+    found = {key: cached[(namespace, key)] for key in keys if (namespace, key) in cached}
+    return found, [key for key in keys if key not in found]
+
+
+def author_avatars(es, indices, authors):
+    """
+    Avatar per author
+
+    Parameters:
+    -----------
+    es : Elasticsearch
+        Elasticsearch client
+    indices : list of str
+        Post indices of the authors
+    authors : iterable of tuple
+        (channel, username) pairs
+
+    Returns:
+    --------
+    dict
+        {(channel, username): user_image_url or None}
+    """
+    avatars, missing = _missing("user_image_url", authors)
+    if not missing:
+        return avatars
+
+    channels = sorted({channel for channel, _ in missing})
+    usernames = sorted({username for _, username in missing})
+    body = {
+        "size": 0,
+        "track_total_hits": False,
+        "query": {
+            "bool": {
+                "filter": [
+                    {"terms": {"channel": channels}},
+                    {"terms": {"username": usernames}}
+                ]
+            }
+        },
+        "aggs": {
+            "by_channel": {
+                "terms": {"field": "channel", "size": len(channels)},
+                "aggs": {
+                    "by_username": {
+                        "terms": {"field": "username", "size": len(usernames)},
+                        "aggs": {
+                            "image": {"terms": {"field": "user_image_url", "size": 1}}
+                        }
+                    }
+                }
+            }
+        }
+    }
+    looked_up = {key: None for key in missing}
+    try:
+        response = es.search(index=",".join(indices), body=body)
+        for channel_bucket in response["aggregations"]["by_channel"]["buckets"]:
+            for username_bucket in channel_bucket["by_username"]["buckets"]:
+                key = (channel_bucket["key"], username_bucket["key"])
+                image = username_bucket["image"]["buckets"]
+                if key in looked_up and image:
+                    looked_up[key] = image[0]["key"]
+    except Exception as e:
+        # Tanpa avatar lebih baik daripada gagal satu endpoint
+        print(f"Avatar lookup failed: {e}")
+        return {**avatars, **looked_up}
+
+    _cache.set_many({("user_image_url", key): value for key, value in looked_up.items()})
+    return {**avatars, **looked_up}
+
+
+def cluster_descriptions(es, indices, clusters):
+    """
+    Description per cluster
+
+    Parameters:
+    -----------
+    es : Elasticsearch
+        Elasticsearch client
+    indices : list of str
+        Post indices of the clusters
+    clusters : iterable of str
+        Cluster names (cluster.keyword)
+
+    Returns:
+    --------
+    dict
+        {cluster: description ("" when there is none)}
+    """
+    namespace = ("cluster_description", ",".join(sorted(indices)))
+    descriptions, missing = _missing(namespace, clusters)
+    if not missing:
+        return descriptions
+
+    # Deskripsi adalah atribut cluster, tidak bergantung pada filter request
+    filters = [{"terms": {"cluster.keyword": missing}}, {"exists": {"field": "cluster_description"}}]
+    body = {
+        "size": len(missing),
+        "track_total_hits": False,
+        "query": {"bool": {"filter": filters}},
+        "_source": ["cluster", "cluster_description"],
+        "collapse": {"field": "cluster.keyword"}
+    }
+    looked_up = {cluster: "" for cluster in missing}
+    try:
+        response = es.search(index=",".join(indices), body=body)
+        for hit in response["hits"]["hits"]:
+            cluster = (hit.get("fields", {}).get("cluster.keyword") or [hit["_source"].get("cluster")])[0]
+            if cluster in looked_up:
+                looked_up[cluster] = hit["_source"].get("cluster_description") or ""
+    except Exception as e:
+        print(f"Cluster description lookup failed: {e}")
+        return {**descriptions, **looked_up}
+
+    _cache.set_many({(namespace, cluster): value for cluster, value in looked_up.items() if value})
+    return {**descriptions, **looked_up}
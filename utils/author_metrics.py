@@ -0,0 +1,194 @@
+"""
+Unified Author Metrics
+
+KOL overview, most followers and share of voice all group mentions per
+author (username + channel). The Analysis page calls them back to back
+with the same filters, so their aggregations are shared and cached once
+per filter hash (filters and resolved date range, not page or other view
+parameters):
+
+- get_channel_top_authors: the top `limit` authors of every channel by
+  post count plus the total mentions, one `by_channel > by_username`
+  terms aggregation with the union of the most followers and share of
+  voice sub-aggregations (followers / connections / subscribers, reach,
+  influence, avatar). Both endpoints project their ranking from it.
+- get_author_metrics: every author, the composite query of
+  utils.kol_engine with the KOL sub-aggregations, for KOL overview only.
+
+Within one worker, concurrent requests for the same entry wait for the
+first query instead of running it again. When the filters allow it the
+data comes from the author_daily rollup (utils.author_rollup) instead of
+the raw post indices.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from utils.author_rollup import author_rollup_available, fetch_author_frame, fetch_channel_top_authors
+from utils.es_query_builder import build_elasticsearch_query
+from utils.kol_engine import AUTHOR_COLUMNS, fetch_channel_top_frame, fetch_kol_frame
+from utils.redis_client import redis_client
+
+AUTHOR_METRICS_PREFIX = "author_metrics"
+CHANNEL_TOP_AUTHORS_PREFIX = "channel_top_authors"
+AUTHOR_METRICS_TTL = int(os.getenv("AUTHOR_METRICS_TTL", "300"))
+
+# {cache key: [lock, jumlah thread yang memakai]}, dihapus saat tidak dipakai lagi
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _key_lock(key):
+    with _locks_guard:
+        entry = _locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _locks[key]
+
+
+def normalize_filters(keywords=None, search_keyword=None, search_exact_phrases=False, case_sensitive=False,
+                      sentiment=None, importance="all mentions", influence_score_min=None,
+                      influence_score_max=None, region=None, language=None, domain=None):
+    """
+    Filters in the form used for the query and the cache hash
+
+    The sentiment list is sorted but kept as a filter even when it lists
+    every sentiment: `terms` on sentiment leaves out posts with a missing
+    or unexpected sentiment, so it is not the same as no filter.
+    """
+    if sentiment:
+        sentiment = sorted(sentiment if isinstance(sentiment, list) else [sentiment])
+    return {
+        "keywords": keywords,
+        "search_keyword": search_keyword,
+        "search_exact_phrases": search_exact_phrases,
+        "case_sensitive": case_sensitive,
+        "sentiment": sentiment or None,
+        "importance": importance,
+        "influence_score_min": influence_score_min,
+        "influence_score_max": influence_score_max,
+        "region": region,
+        "language": language,
+        "domain": domain
+    }
+
+
+def _pack_frame(frame):
+    return {column: frame[column].tolist() for column in AUTHOR_COLUMNS}
+
+
+def _unpack_frame(packed):
+    return pd.DataFrame(packed, columns=AUTHOR_COLUMNS)
+
+
+def get_author_metrics(es, indices, channels, start_date, end_date, **filters):
+    """
+    Metrics of every author for a filter combination (cached, KOL overview)
+
+    Parameters:
+    -----------
+    es : Elasticsearch
+        Elasticsearch client
+    indices : list of str
+        Post indices to aggregate
+    channels : list of str or None
+        Channels of those indices (for the rollup)
+    start_date, end_date : str
+        Resolved date range
+    **filters
+        keywords, search_keyword, search_exact_phrases, case_sensitive,
+        sentiment, importance, influence_score_min/max, region, language,
+        domain
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per author with AUTHOR_COLUMNS (see utils.kol_engine)
+    """
+    filters = normalize_filters(**filters)
+    cache_key = redis_client.generate_cache_key(
+        AUTHOR_METRICS_PREFIX,
+        indices=sorted(indices),
+        start_date=start_date,
+        end_date=end_date,
+        **filters
+    )
+
+    with _key_lock(cache_key):
+        cached = redis_client.get(cache_key)
+        if cached is not None:
+            return _unpack_frame(cached)
+
+        if author_rollup_available(es, start_date, end_date, **filters):
+            frame = fetch_author_frame(es, start_date, end_date, channels)
+        else:
+            base_query = build_elasticsearch_query(start_date=start_date, end_date=end_date, size=0, **filters)
+            frame = fetch_kol_frame(es, ",".join(indices), base_query, top_n=0)
+
+        redis_client.set_with_ttl(cache_key, _pack_frame(frame), ttl_seconds=AUTHOR_METRICS_TTL)
+        return frame
+
+
+def get_channel_top_authors(es, indices, channels, start_date, end_date, limit, **filters):
+    """
+    Top `limit` authors per channel by post count for a filter combination
+    (cached, shared by most followers and share of voice)
+
+    Parameters:
+    -----------
+    es : Elasticsearch
+        Elasticsearch client
+    indices : list of str
+        Post indices to aggregate
+    channels : list of str
+        Channels of those indices
+    start_date, end_date : str
+        Resolved date range
+    limit : int
+        Authors per channel
+    **filters
+        Same filters as get_author_metrics
+
+    Returns:
+    --------
+    tuple
+        (DataFrame with AUTHOR_COLUMNS, of which link_post, reach_score,
+        user_followers, mean_user_influence_score and user_image_url are
+        filled; total mentions of all posts)
+    """
+    filters = normalize_filters(**filters)
+    cache_key = redis_client.generate_cache_key(
+        CHANNEL_TOP_AUTHORS_PREFIX,
+        indices=sorted(indices),
+        channels=sorted(channels),
+        start_date=start_date,
+        end_date=end_date,
+        limit=limit,
+        **filters
+    )
+
+    with _key_lock(cache_key):
+        cached = redis_client.get(cache_key)
+        if cached is not None:
+            return _unpack_frame(cached["authors"]), cached["total_mentions"]
+
+        if author_rollup_available(es, start_date, end_date, **filters):
+            frame, total_mentions = fetch_channel_top_authors(es, start_date, end_date, channels, limit)
+        else:
+            base_query = build_elasticsearch_query(start_date=start_date, end_date=end_date, size=0, **filters)
+            frame, total_mentions = fetch_channel_top_frame(es, ",".join(indices), base_query, len(channels), limit)
+
+        redis_client.set_with_ttl(cache_key, {"authors": _pack_frame(frame), "total_mentions": total_mentions},
+                                  ttl_seconds=AUTHOR_METRICS_TTL)
+        return frame, total_mentions
+
@@ -0,0 +1,311 @@
+"""
+Author Rollup
+
+Per-day, per-author rollup of the post indices in the `author_daily`
+index, so KOL overview (every author, fetch_author_frame) and most
+followers / share of voice (top authors per channel,
+fetch_channel_top_authors) can aggregate over days instead of posts when
+a request filters on nothing but the date range and channels.
+
+One document per (day, channel, username) holds the post count, reach,
+viral and engagement sums, influence sums, the maximum followers /
+connections / subscribers, sentiment counts, the top clusters of that day
+and the avatar and category.
+
+The rollup is filled by an incremental job (see utils.rollup) that only
+recomputes the days after its checkpoint:
+
+    python -m utils.author_rollup            # run from cron, e.g. every 15 minutes
+    python -m utils.author_rollup --days 30  # backfill window on the first run
+
+Requests fall back to the raw indices when a filter is not available in
+the rollup, the date range is older than the backfill or the rollup of
+today is older than ROLLUP_MAX_STALENESS.
+"""
+
+import argparse
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from utils.es_query_builder import get_indices_from_channels
+from utils.kol_engine import AUTHOR_COLUMNS, KOL_MAX_BUCKETS, KOL_PAGE_SIZE
+from utils.rollup import (
+    ROLLUP_BACKFILL_DAYS, ROLLUP_ENABLED, SENTIMENTS, composite_buckets, day_string, get_checkpoint,
+    only_date_and_channel_filters, rollup_covers, run_incremental
+)
+from utils.script_score import script_score
+
+AUTHOR_ROLLUP_NAME = "author_daily"
+AUTHOR_DAILY_INDEX = os.getenv("AUTHOR_DAILY_INDEX", "author_daily")
+AUTHOR_ROLLUP_ENABLED = ROLLUP_ENABLED and \
+    os.getenv("AUTHOR_ROLLUP_ENABLED", "true").lower() not in ("0", "false", "no", "off")
+# Cluster teratas yang disimpan per author per hari
+TOP_CLUSTERS_PER_DAY = 5
+
+FOLLOWER_FIELDS = {"user_followers": "followers_max", "user_connections": "connections_max",
+                   "subscriber": "subscriber_max"}
+
+AUTHOR_DAILY_MAPPINGS = {
+    "dynamic": "strict",
+    "properties": {
+        "day": {"type": "date", "format": "yyyy-MM-dd"},
+        "channel": {"type": "keyword"},
+        "username": {"type": "keyword"},
+        "post_count": {"type": "long"},
+        "reach_sum": {"type": "double"},
+        "viral_sum": {"type": "double"},
+        "engagement_rate_sum": {"type": "double"},
+        # Jumlah script_score per post (rata-rata = influence_sum / post_count)
+        "influence_sum": {"type": "double"},
+        "user_influence_score_sum": {"type": "double"},
+        "user_influence_score_count": {"type": "long"},
+        "followers_max": {"type": "double"},
+        "connections_max": {"type": "double"},
+        "subscriber_max": {"type": "double"},
+        "sentiment_positive": {"type": "long"},
+        "sentiment_negative": {"type": "long"},
+        "sentiment_neutral": {"type": "long"},
+        "clusters": {"type": "keyword"},
+        "user_image_url": {"type": "keyword", "index": False},
+        "user_category": {"type": "keyword"}
+    }
+}
+
+
+def _day_aggs():
+    aggs = {name: {"max": {"field": field}} for field, name in FOLLOWER_FIELDS.items()}
+    aggs.update({
+        "reach_sum": {"sum": {"field": "reach_score"}},
+        "viral_sum": {"sum": {"field": "viral_score"}},
+        "engagement_rate_sum": {"sum": {"field": "engagement_rate"}},
+        "influence_sum": {"sum": {"script": script_score}},
+        "user_influence_score_sum": {"sum": {"field": "user_influence_score"}},
+        "user_influence_score_count": {"value_count": {"field": "user_influence_score"}},
+        "sentiments": {"terms": {"field": "sentiment", "size": len(SENTIMENTS)}},
+        "clusters": {"terms": {"field": "cluster.keyword", "size": TOP_CLUSTERS_PER_DAY}},
+        "user_image_url": {"terms": {"field": "user_image_url", "size": 1}},
+        "user_category": {"terms": {"field": "user_category.keyword", "size": 1}}
+    })
+    return aggs
+
+
+def build_author_day(es, day):
+    """
+    Rollup documents of one day, aggregated from every post index
+
+    Returns:
+    --------
+    list of dict
+        One document (with "_id") per channel and username
+    """
+    next_day = (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    query = {"range": {"post_created_at": {"gte": day, "lt": next_day}}}
+    # Post tanpa username / channel ikut sebagai "unknown", seperti utils.kol_engine
+    sources = [
+        {"channel": {"terms": {"field": "channel", "missing_bucket": True}}},
+        {"username": {"terms": {"field": "username", "missing_bucket": True}}}
+    ]
+
+    documents = []
+    for bucket in composite_buckets(es, ",".join(get_indices_from_channels()), query, sources, _day_aggs()):
+        channel = bucket["key"]["channel"] if bucket["key"]["channel"] is not None else "unknown"
+        username = bucket["key"]["username"] if bucket["key"]["username"] is not None else "unknown"
+        sentiments = {item["key"]: item["doc_count"] for item in bucket["sentiments"]["buckets"]}
+        image = bucket["user_image_url"]["buckets"]
+        category = bucket["user_category"]["buckets"]
+        document = {
+            "_id": f"{day}|{channel}|{username}",
+            "day": day,
+            "channel": channel,
+            "username": username,
+            "post_count": bucket["doc_count"],
+            "clusters": [item["key"] for item in bucket["clusters"]["buckets"]],
+            "user_image_url": image[0]["key"] if image else None,
+            "user_category": category[0]["key"] if category else None
+        }
+        for name in ("reach_sum", "viral_sum", "engagement_rate_sum", "influence_sum",
+                     "user_influence_score_sum", "user_influence_score_count",
+                     *FOLLOWER_FIELDS.values()):
+            document[name] = bucket[name]["value"]
+        for sentiment in SENTIMENTS:
+            document[f"sentiment_{sentiment}"] = sentiments.get(sentiment, 0)
+        documents.append(document)
+    return documents
+
+
+def run_author_rollup(es, today=None, backfill_days=ROLLUP_BACKFILL_DAYS):
+    """Incremental author_daily update (see utils.rollup.run_incremental)"""
+    return run_incremental(es, AUTHOR_ROLLUP_NAME, AUTHOR_DAILY_INDEX, AUTHOR_DAILY_MAPPINGS,
+                           build_author_day, today=today, backfill_days=backfill_days)
+
+
+def author_rollup_available(es, start_date, end_date, **filters):
+    """
+    Whether a request can be answered from author_daily
+
+    Parameters:
+    -----------
+    start_date, end_date : str
+        Requested date range
+    **filters
+        The request filters (keywords, sentiment, region, ...)
+    """
+    if not AUTHOR_ROLLUP_ENABLED or not only_date_and_channel_filters(**filters):
+        return False
+    return rollup_covers(get_checkpoint(es, AUTHOR_ROLLUP_NAME), start_date, end_date)
+
+
+def _author_aggs():
+    aggs = {name: {"sum": {"field": name}} for name in (
+        "post_count", "reach_sum", "viral_sum", "engagement_rate_sum", "influence_sum",
+        "user_influence_score_sum", "user_influence_score_count",
+        *(f"sentiment_{sentiment}" for sentiment in SENTIMENTS))}
+    aggs.update({name: {"max": {"field": name}} for name in FOLLOWER_FIELDS.values()})
+    aggs.update({
+        "clusters": {"terms": {"field": "clusters", "size": 10}},
+        # Avatar hari terakhir, dibaca dari doc values (tanpa _source)
+        "user_image_url": {"top_metrics": {"metrics": {"field": "user_image_url"},
+                                           "sort": {"day": "desc"}}},
+        "user_category": {"terms": {"field": "user_category", "size": 1}}
+    })
+    return aggs
+
+
+def _add_author(columns, username, channel, bucket):
+    def value(name):
+        return bucket[name]["value"] or 0
+
+    posts = int(value("post_count"))
+    columns["username"].append(username)
+    columns["channel"].append(channel)
+    columns["link_post"].append(posts)
+    columns["viral_score"].append(value("viral_sum"))
+    columns["reach_score"].append(value("reach_sum"))
+    columns["engagement_rate"].append(value("engagement_rate_sum"))
+    columns["user_influence_score"].append(value("influence_sum") / posts if posts else 0)
+    count = value("user_influence_score_count")
+    columns["mean_user_influence_score"].append(value("user_influence_score_sum") / count if count else 0)
+
+    followers = 0
+    for name in FOLLOWER_FIELDS.values():
+        if bucket[name]["value"]:
+            followers = bucket[name]["value"]
+            break
+    columns["user_followers"].append(followers)
+
+    top = bucket["user_image_url"]["top"]
+    columns["user_image_url"].append((top[0]["metrics"].get("user_image_url") or "") if top else "")
+    category = bucket["user_category"]["buckets"]
+    columns["user_category"].append(category[0]["key"] if category else "")
+    columns["issue"].append([item["key"] for item in bucket["clusters"]["buckets"]])
+    for sentiment in SENTIMENTS:
+        columns[f"sentiment_{sentiment}"].append(int(value(f"sentiment_{sentiment}")))
+
+
+def _range_filters(start_date, end_date, channels):
+    filters = [{"range": {"day": {"gte": day_string(start_date), "lte": day_string(end_date)}}}]
+    if channels:
+        filters.append({"terms": {"channel": list(channels)}})
+    return filters
+
+
+def fetch_author_frame(es, start_date, end_date, channels=None):
+    """
+    Per-author metrics over a date range, aggregated from author_daily
+
+    Same paging, KOL_MAX_BUCKETS cap and "unknown" keys as the composite
+    path of utils.kol_engine, so both paths return the same authors.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        AUTHOR_COLUMNS (same meaning as utils.kol_engine.fetch_kol_frame).
+        `issue` lists the clusters that were among an author's top
+        clusters on the most days.
+    """
+    sources = [
+        {"username": {"terms": {"field": "username", "missing_bucket": True}}},
+        {"channel": {"terms": {"field": "channel", "missing_bucket": True}}}
+    ]
+    columns = {column: [] for column in AUTHOR_COLUMNS}
+    query = {"bool": {"filter": _range_filters(start_date, end_date, channels)}}
+    buckets = composite_buckets(es, AUTHOR_DAILY_INDEX, query, sources, _author_aggs(), page_size=KOL_PAGE_SIZE)
+    for count, bucket in enumerate(buckets, start=1):
+        username, channel = bucket["key"]["username"], bucket["key"]["channel"]
+        _add_author(columns, username if username is not None else "unknown",
+                    channel if channel is not None else "unknown", bucket)
+        # Berhenti di akhir halaman seperti kol_engine._fetch_all
+        if count >= KOL_MAX_BUCKETS and count % KOL_PAGE_SIZE == 0:
+            print(f"Author rollup: stopped at {count} authors (KOL_MAX_BUCKETS={KOL_MAX_BUCKETS})")
+            break
+
+    frame = pd.DataFrame(columns)
+    return frame.replace([np.inf, -np.inf], 0)
+
+
+def fetch_channel_top_authors(es, start_date, end_date, channels, limit):
+    """
+    Top `limit` authors by post count in every channel, from author_daily
+    (rollup version of utils.kol_engine.fetch_channel_top_frame)
+
+    Returns:
+    --------
+    tuple
+        (DataFrame with AUTHOR_COLUMNS, total post count of the range)
+    """
+    aggs = _author_aggs()
+    body = {
+        "size": 0,
+        "track_total_hits": False,
+        "query": {"bool": {"filter": _range_filters(start_date, end_date, channels)}},
+        "aggs": {
+            "by_channel": {
+                "terms": {"field": "channel", "size": max(len(channels or []), 50)},
+                "aggs": {
+                    "by_username": {
+                        # Satu dokumen per hari: urut berdasarkan jumlah post, bukan doc_count
+                        "terms": {"field": "username", "size": limit, "order": {"post_count": "desc"}},
+                        "aggs": aggs
+                    }
+                }
+            },
+            "total_mentions": {"sum": {"field": "post_count"}}
+        }
+    }
+    response = es.search(index=AUTHOR_DAILY_INDEX, body=body)
+    columns = {column: [] for column in AUTHOR_COLUMNS}
+    for channel_bucket in response["aggregations"]["by_channel"]["buckets"]:
+        for bucket in channel_bucket["by_username"]["buckets"]:
+            _add_author(columns, bucket["key"], channel_bucket["key"], bucket)
+
+    frame = pd.DataFrame(columns, columns=AUTHOR_COLUMNS)
+    return frame.replace([np.inf, -np.inf], 0), int(response["aggregations"]["total_mentions"]["value"] or 0)
+
+
+def top_authors_per_channel(frame, limit):
+    """
+    The `limit` authors with the most posts in each channel, like a terms
+    aggregation on username (size=limit) under a terms aggregation on channel
+    """
+    if frame.empty:
+        return frame
+    ranked = frame.sort_values(["channel", "link_post"], ascending=[True, False], kind="stable")
+    return ranked.groupby("channel", sort=False).head(limit)
+
+
+if __name__ == "__main__":
+    from utils.es_client import get_elasticsearch_client
+
+    parser = argparse.ArgumentParser(description="Incremental author_daily rollup")
+    parser.add_argument("--days", type=int, default=ROLLUP_BACKFILL_DAYS,
+                        help="Backfill window when the rollup has no checkpoint yet")
+    args = parser.parse_args()
+
+    es = get_elasticsearch_client()
+    if not es:
+        raise SystemExit("Elasticsearch is not reachable")
+    checkpoint = run_author_rollup(es, backfill_days=args.days)
+    print(f"author_daily up to {checkpoint['last_day']} (from {checkpoint['first_day']})")
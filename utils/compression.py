@@ -0,0 +1,172 @@
+"""
+Response Compression Middleware
+
+This module provides an ASGI middleware that compresses complete
+(non-streaming) responses with brotli or gzip, negotiated from the
+client's Accept-Encoding header.
+"""
+
+import gzip
+import os
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli bersifat opsional, fallback ke gzip
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "text/",
+    "application/javascript",
+    "application/xml",
+)
+
+
+def parse_accept_encoding(header_value):
+    """
+    Parse an Accept-Encoding header into a {encoding: q} mapping
+
+    Parameters:
+    -----------
+    header_value : str
+        Raw Accept-Encoding header value
+
+    Returns:
+    --------
+    dict
+        Mapping of lower-cased encoding name to its quality value
+    """
+    encodings = {}
+    for part in header_value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        encodings[name.strip().lower()] = q
+    return encodings
+
+
+def select_encoding(header_value):
+    """
+    Choose the best supported encoding ('br', 'gzip' or None)
+    """
+    if not header_value:
+        return None
+    encodings = parse_accept_encoding(header_value)
+    wildcard = encodings.get("*", 0.0)
+
+    candidates = []
+    if brotli is not None:
+        candidates.append("br")
+    candidates.append("gzip")
+
+    best, best_q = None, 0.0
+    for name in candidates:
+        q = encodings.get(name, wildcard)
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def compress_body(body, encoding, gzip_level=6, brotli_quality=4):
+    """Compress a response body with the given encoding"""
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, compresslevel=gzip_level)
+
+
+class CompressionMiddleware:
+    """
+    Negotiated brotli/gzip compression for responses above a size threshold
+
+    Streaming responses (e.g. the Moskal AI SSE stream) are passed through
+    untouched so chunks keep reaching the client as they are produced.
+    """
+
+    def __init__(self, app, minimum_size=None, gzip_level=6, brotli_quality=4):
+        self.app = app
+        self.minimum_size = int(
+            minimum_size if minimum_size is not None
+            else os.getenv("COMPRESSION_MIN_SIZE", 1024)
+        )
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = select_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder)
+
+
+class _CompressionResponder:
+    """Wraps `send` to compress a single-message response body"""
+
+    def __init__(self, middleware, encoding, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start_message = None
+        self.passthrough = False
+
+    async def __call__(self, message):
+        if self.passthrough:
+            await self.send(message)
+            return
+
+        if message["type"] == "http.response.start":
+            # Tahan start message sampai body pertama diketahui
+            self.start_message = message
+            return
+
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        content_type = headers.get("content-type", "")
+
+        compressible = (
+            not more_body
+            and "content-encoding" not in headers
+            and len(body) >= self.middleware.minimum_size
+            and content_type.startswith(COMPRESSIBLE_TYPES)
+            and not content_type.startswith("text/event-stream")
+        )
+
+        if not compressible:
+            self.passthrough = True
+            await self.send(self.start_message)
+            await self.send(message)
+            return
+
+        compressed = compress_body(
+            body,
+            self.encoding,
+            gzip_level=self.middleware.gzip_level,
+            brotli_quality=self.middleware.brotli_quality
+        )
+        headers["Content-Encoding"] = self.encoding
+        headers["Content-Length"] = str(len(compressed))
+        headers.add_vary_header("Accept-Encoding")
+
+        await self.send(self.start_message)
+        await self.send({"type": "http.response.body", "body": compressed})
@@ -6,7 +6,9 @@ from typing import Dict, List, Literal, Optional, Union
 from utils.es_client import get_elasticsearch_client
 from utils.es_query_builder import get_date_range
 from utils.redis_client import redis_client
+from utils.metrics import instrument
 
+@instrument()
 def get_context_of_discussion(
     es_host=None,
     es_username=None,
@@ -350,8 +352,6 @@ def get_context_of_discussion(
         alt_query["query"]["bool"]["filter"] = filter_conditions
     
     try:
-        import json
-        #print(json.dumps(alt_query, indent=2))
         # Execute query
         response = es.search(
             index=",".join(indices),
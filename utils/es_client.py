@@ -5,12 +5,18 @@ This module provides functions for establishing and managing
 connections to Elasticsearch.
 """
 
-from elasticsearch import Elasticsearch
+from elasticsearch import AsyncElasticsearch, Elasticsearch
+import asyncio
 import urllib3
 import warnings
 import os
+import time
 from dotenv import load_dotenv
 
+from utils.metrics import record_es_call
+from utils.profiling import current_profile, enable_es_profile, record_es_span
+from utils.slow_query_log import maybe_record as record_slow_query
+
 # Load environment variables
 load_dotenv()
 
@@ -18,23 +24,96 @@ load_dotenv()
 urllib3.disable_warnings()
 warnings.filterwarnings("ignore")
 
-def get_elasticsearch_client(
-            es_host=None,
-        es_username=None,
-        es_password=None,
-        use_ssl=None,
-        verify_certs=None,
-        ca_certs=None
-):
+class InstrumentedElasticsearch(Elasticsearch):
     """
-    Create connection to Elasticsearch using environment variables
-    
-    Returns:
-    --------
-    Elasticsearch
-        Elasticsearch client instance
+    Elasticsearch client that records wall time, 'took' and response size
+    of every search call in the metrics registry, logs calls above the
+    slow query threshold (utils.slow_query_log). In `debug=profile`
+    requests the search is sent with `"profile": true` and recorded as a span.
     """
-    # Get ES connection params from environment
+
+    def _instrumented(self, method, call, kwargs):
+        profile = current_profile()
+        if profile is not None:
+            kwargs = enable_es_profile(method, kwargs)
+        start = time.perf_counter()
+        try:
+            response = call(**kwargs)
+        except Exception as e:
+            end = time.perf_counter()
+            record_es_call(method, end - start, error=True)
+            record_slow_query(method, kwargs, end - start, error=type(e).__name__)
+            if profile is not None:
+                record_es_span(profile, method, kwargs, start, end, error=type(e).__name__)
+            raise
+        end = time.perf_counter()
+        record_es_call(method, end - start, response)
+        record_slow_query(method, kwargs, end - start, response)
+        if profile is not None:
+            record_es_span(profile, method, kwargs, start, end, response)
+        return response
+
+    def search(self, **kwargs):
+        return self._instrumented("search", super().search, kwargs)
+
+    def msearch(self, **kwargs):
+        return self._instrumented("msearch", super().msearch, kwargs)
+
+    def scroll(self, **kwargs):
+        return self._instrumented("scroll", super().scroll, kwargs)
+
+    def count(self, **kwargs):
+        return self._instrumented("count", super().count, kwargs)
+
+
+class InstrumentedAsyncElasticsearch(AsyncElasticsearch):
+    """
+    Async counterpart of InstrumentedElasticsearch (same metrics, slow
+    query log and profile spans), used by the async Moskal AI pipeline
+    """
+
+    async def _instrumented(self, method, call, kwargs):
+        profile = current_profile()
+        if profile is not None:
+            kwargs = enable_es_profile(method, kwargs)
+        start = time.perf_counter()
+        try:
+            response = await call(**kwargs)
+        except Exception as e:
+            end = time.perf_counter()
+            record_es_call(method, end - start, error=True)
+            record_slow_query(method, kwargs, end - start, error=type(e).__name__)
+            if profile is not None:
+                record_es_span(profile, method, kwargs, start, end, error=type(e).__name__)
+            raise
+        end = time.perf_counter()
+        record_es_call(method, end - start, response)
+        record_slow_query(method, kwargs, end - start, response)
+        if profile is not None:
+            record_es_span(profile, method, kwargs, start, end, response)
+        return response
+
+    async def search(self, **kwargs):
+        return await self._instrumented("search", super().search, kwargs)
+
+    async def msearch(self, **kwargs):
+        return await self._instrumented("msearch", super().msearch, kwargs)
+
+    async def count(self, **kwargs):
+        return await self._instrumented("count", super().count, kwargs)
+
+
+# Ukuran pool koneksi dan timeout default client async
+ES_ASYNC_MAX_CONNECTIONS = int(os.getenv("ES_ASYNC_MAX_CONNECTIONS", "20"))
+ES_ASYNC_REQUEST_TIMEOUT = float(os.getenv("ES_ASYNC_REQUEST_TIMEOUT", "30"))
+
+# Satu client async per event loop (session aiohttp terikat ke loop)
+_async_client = None
+_async_client_loop = None
+
+
+def _es_config():
+    """Connection settings from environment variables"""
     es_host = os.getenv('ES_HOST', 'localhost:9200')
     es_username = os.getenv('ES_USERNAME')
     es_password = os.getenv('ES_PASSWORD')
@@ -62,11 +141,67 @@ def get_elasticsearch_client(
     # Add CA certificates if provided
     if ca_certs:
         es_config["ca_certs"] = ca_certs
+    return es_config
+
+
+def get_async_elasticsearch_client():
+    """
+    Shared pooled async Elasticsearch client for the running event loop
+
+    Created on first use; up to ES_ASYNC_MAX_CONNECTIONS keep-alive
+    connections per node are reused by every caller.
+
+    Returns:
+    --------
+    InstrumentedAsyncElasticsearch or None
+    """
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        try:
+            _async_client = InstrumentedAsyncElasticsearch(
+                **_es_config(),
+                connections_per_node=ES_ASYNC_MAX_CONNECTIONS,
+                request_timeout=ES_ASYNC_REQUEST_TIMEOUT
+            )
+            _async_client_loop = loop
+        except Exception as e:
+            print(f"Async connection error: {e}")
+            return None
+    return _async_client
+
+
+async def close_async_elasticsearch_client():
+    """Close the shared async client (lifespan shutdown)"""
+    global _async_client, _async_client_loop
+    if _async_client is not None:
+        client, _async_client, _async_client_loop = _async_client, None, None
+        await client.close()
+
+
+def get_elasticsearch_client(
+            es_host=None,
+        es_username=None,
+        es_password=None,
+        use_ssl=None,
+        verify_certs=None,
+        ca_certs=None
+):
+    """
+    Create connection to Elasticsearch using environment variables
+    
+    Returns:
+    --------
+    Elasticsearch
+        Elasticsearch client instance
+    """
+    # Get ES connection params from environment
+    es_config = _es_config()
     
     # Create Elasticsearch instance
     try:
-        es = Elasticsearch(**es_config)
-        print(f"Successfully connected to {es_host}")
+        es = InstrumentedElasticsearch(**es_config)
+        print(f"Successfully connected to {es_config['hosts'][0]}")
         return es
     except Exception as e:
         print(f"Connection error: {e}")
@@ -1,65 +1,141 @@
 import io, re
-from google.oauth2 import service_account
-import vertexai
 from mimetypes import guess_type
 import time, os
 import random
+import threading
 from typing import Any, AsyncGenerator
 import logging
 import asyncio
-
-from vertexai.generative_models import (
-    GenerationConfig,
-    GenerativeModel,
-    HarmCategory,
-    HarmBlockThreshold,
-    Image
-)
+import concurrent.futures
 
 from dotenv import load_dotenv
 
+from utils.llm_cache import get_cached_response, store_response
+from utils.metrics import record_gemini_call
+
 load_dotenv() 
-print('✅ Moskal AI Gemini v2.0 - Streaming Enabled')
 
 # Vertex AI configuration
 project_id = os.getenv("GEMINI_PROJECT_ID")
 credentials_file_path = os.getenv("GEMINI_CREDS_LOCATION")
-print(f'📁 Credentials: {credentials_file_path}')
-print(f'🆔 Project ID: {project_id}')
 true = True
 false = False
 null = ''
-credentials = service_account.Credentials.from_service_account_file(credentials_file_path)
-vertexai.init(project=project_id, credentials=credentials)
 model = os.getenv("GEMINI_DEFAULT_MODEL", "gemini-pro")
-multimodal_model = GenerativeModel(model)
+# Parameter GenerationConfig; juga bagian dari key LLM cache
+GENERATION_CONFIG = {"temperature": 0.0, "top_p": 1, "top_k": 32}
+
+# Model, safety settings dan generation config dibuat saat pertama kali dipakai
+# (lihat get_gemini), bukan saat import: vertexai berat untuk di-import dan
+# endpoint yang hanya memakai Elasticsearch tetap jalan tanpa credentials Gemini.
+_gemini = None
+_gemini_lock = threading.Lock()
+
+# Batas panggilan Gemini bersamaan dari pipeline async (per worker)
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+# Batas waktu satu percobaan panggilan async (detik), 0 = tanpa batas
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "120"))
+
+_async_semaphore = None
+_async_semaphore_loop = None
+_executor = None
+
+
+def _init_gemini():
+    from google.oauth2 import service_account
+    import vertexai
+    from vertexai.generative_models import (
+        GenerationConfig,
+        GenerativeModel,
+        HarmCategory,
+        HarmBlockThreshold
+    )
+
+    print('✅ Moskal AI Gemini v2.0 - Streaming Enabled')
+    print(f'📁 Credentials: {credentials_file_path}')
+    print(f'🆔 Project ID: {project_id}')
+    credentials = service_account.Credentials.from_service_account_file(credentials_file_path)
+    vertexai.init(project=project_id, credentials=credentials)
+    multimodal_model = GenerativeModel(model)
+
+    safety_config = {
+        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+    }
+
+    # Generation Config
+    config = GenerationConfig(**GENERATION_CONFIG)
+    return multimodal_model, safety_config, config
+
+
+def get_gemini():
+    """
+    Return (model, safety_config, generation_config), initializing Vertex AI on first use
+
+    Thread-safe; a failed initialization is retried on the next call.
+    """
+    global _gemini
+    if _gemini is None:
+        with _gemini_lock:
+            if _gemini is None:
+                _gemini = _init_gemini()
+    return _gemini
+
 
-safety_config = {
-    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-}
+def is_gemini_initialized():
+    return _gemini is not None
 
-# Generation Config
-config = GenerationConfig(temperature=0.0, top_p=1, top_k=32)
+
+def _get_async_semaphore():
+    # Semaphore dibuat di dalam event loop yang sedang berjalan (Python 3.9
+    # mengikat semaphore ke loop saat dibuat)
+    global _async_semaphore, _async_semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _async_semaphore is None or _async_semaphore_loop is not loop:
+        _async_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+        _async_semaphore_loop = loop
+    return _async_semaphore
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _executor = ThreadPoolExecutor(max_workers=GEMINI_MAX_CONCURRENCY, thread_name_prefix="gemini")
+    return _executor
+
+
+def _is_retryable(error):
+    return "ServiceUnavailable: 503 Connection reset" in str(error) or "Connection reset" in str(error)
 
 def call_gemini(prompt, 
                 max_retries=2, 
                 initial_backoff=1.0, 
                 max_backoff=60.0, 
                 backoff_factor=2.0, 
-                jitter=0.1):
+                jitter=0.1,
+                use_cache=True):
     """
     Non-streaming version - collect all chunks into single response
+
+    Responses are served from / stored in the LLM cache unless use_cache is False.
     """
+    if use_cache:
+        cached = get_cached_response(prompt, model, GENERATION_CONFIG, "call_gemini")
+        if cached is not None:
+            return cached
+
     retries = 0
     backoff = initial_backoff
     last_exception = None
     
     while retries < max_retries:
+        start = time.perf_counter()
         try:
             # Generate content using the multimodal model
+            multimodal_model, safety_config, config = get_gemini()
             responses = multimodal_model.generate_content(
                 [prompt],
                 safety_settings=safety_config, 
@@ -69,12 +145,19 @@ def call_gemini(prompt,
             
             # Collect the full result
             full_result = ''
+            usage = None
             for response in responses:
                 full_result += response.text
+                usage = getattr(response, "usage_metadata", None) or usage
             
-            return full_result.strip()
+            record_gemini_call("call_gemini", time.perf_counter() - start, usage)
+            full_result = full_result.strip()
+            if use_cache:
+                store_response(prompt, model, GENERATION_CONFIG, full_result, usage)
+            return full_result
             
         except Exception as e:
+            record_gemini_call("call_gemini", time.perf_counter() - start, error=True)
             last_exception = e
             
             # Log the error
@@ -111,75 +194,161 @@ def call_gemini(prompt,
     
     raise Exception(error_msg)
 
+async def _stream_chunks(prompt, queue_size, coalesce=True):
+    """Yield (text, usage) per Gemini chunk without blocking the event loop"""
+    if not is_gemini_initialized():
+        await asyncio.to_thread(get_gemini)
+    multimodal_model, safety_config, config = get_gemini()
+
+    if hasattr(multimodal_model, "generate_content_async"):
+        responses = await multimodal_model.generate_content_async(
+            [prompt],
+            safety_settings=safety_config,
+            generation_config=config,
+            stream=True
+        )
+        async for response in responses:
+            yield response.text, getattr(response, "usage_metadata", None)
+        return
+
+    # SDK tanpa API async: thread membaca stream sync dan mengisi queue terbatas.
+    # Queue penuh membuat thread menunggu (backpressure ke Gemini stream).
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=queue_size)
+    stopped = threading.Event()
+    done = object()
+
+    def put(item):
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while not stopped.is_set():
+            try:
+                future.result(timeout=1.0)
+                return
+            except concurrent.futures.TimeoutError:
+                # Queue masih penuh: cek lagi apakah consumer sudah berhenti
+                continue
+        future.cancel()
+
+    def produce():
+        try:
+            responses = multimodal_model.generate_content(
+                [prompt],
+                safety_settings=safety_config,
+                generation_config=config,
+                stream=True
+            )
+            for response in responses:
+                if stopped.is_set():
+                    return
+                put((response.text, getattr(response, "usage_metadata", None)))
+            put(done)
+        except Exception as e:
+            put(e)
+
+    loop.run_in_executor(_get_executor(), produce)
+    try:
+        finished = False
+        while not finished:
+            item = await queue.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            text, usage = item
+            # Chunk yang sudah menunggu di queue digabung jadi satu event
+            while coalesce and not queue.empty():
+                item = queue.get_nowait()
+                if item is done:
+                    finished = True
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                text += item[0]
+                usage = item[1] or usage
+            yield text, usage
+    finally:
+        stopped.set()
+
+
 async def call_gemini_stream(prompt: str, 
                            max_retries: int = 2, 
                            initial_backoff: float = 1.0, 
                            max_backoff: float = 60.0, 
                            backoff_factor: float = 2.0, 
-                           jitter: float = 0.1) -> AsyncGenerator[str, None]:
+                           jitter: float = 0.1,
+                           coalesce: bool = True,
+                           queue_size: int = 32,
+                           use_cache: bool = True) -> AsyncGenerator[str, None]:
     """
-    NEW: Async streaming version that yields chunks as they arrive
+    Async streaming version that yields text chunks as Gemini produces them
+
+    The generator is pull-based: a slow consumer slows down reading of the
+    Gemini stream instead of buffering it without bound. With `coalesce`,
+    chunks that arrived while the consumer was busy are merged into one yield.
+    Retries (with asyncio.sleep backoff) only happen before the first chunk;
+    errors after that, or after the last retry, are raised. A cached
+    response is yielded as a single chunk; a complete streamed response is
+    stored in the LLM cache.
+
+    Parameters:
+    -----------
+    prompt : str
+        Prompt text
+    coalesce : bool
+        Merge chunks that are already waiting into a single yield (thread-pool fallback)
+    queue_size : int
+        Chunks buffered ahead of the consumer (thread-pool fallback only)
+    use_cache : bool
+        Read from / write to the LLM cache
     """
+    if use_cache:
+        cached = await asyncio.to_thread(get_cached_response, prompt, model, GENERATION_CONFIG, "call_gemini_stream")
+        if cached is not None:
+            yield cached
+            return
+
     retries = 0
     backoff = initial_backoff
-    last_exception = None
-    
-    while retries < max_retries:
+
+    while True:
+        start = time.perf_counter()
+        usage = None
+        yielded = False
+        parts = []
         try:
-            # Generate content using the multimodal model with streaming
-            responses = multimodal_model.generate_content(
-                [prompt],
-                safety_settings=safety_config, 
-                generation_config=config, 
-                stream=True
-            )
-            
-            # Yield each chunk as it arrives
-            for response in responses:
-                if response.text:
-                    yield response.text
-                    # Small delay to prevent overwhelming the client
-                    await asyncio.sleep(0.01)
-            
-            return  # Success, exit the retry loop
-            
+            async with _get_async_semaphore():
+                chunks = _stream_chunks(prompt, queue_size, coalesce)
+                try:
+                    async for text, chunk_usage in chunks:
+                        usage = chunk_usage or usage
+                        if text:
+                            yielded = True
+                            parts.append(text)
+                            yield text
+                finally:
+                    await chunks.aclose()
+            record_gemini_call("call_gemini_stream", time.perf_counter() - start, usage)
+            if use_cache:
+                await asyncio.to_thread(store_response, prompt, model, GENERATION_CONFIG, "".join(parts).strip(), usage)
+            return
+
+        except (asyncio.CancelledError, GeneratorExit):
+            record_gemini_call("call_gemini_stream", time.perf_counter() - start, error=True)
+            raise
+
         except Exception as e:
-            last_exception = e
-            
-            # Log the error
-            if logging:
-                logging.warning(f"Gemini streaming API error on attempt {retries+1}/{max_retries}: {str(e)}")
-            else:
-                print(f"Gemini streaming API error on attempt {retries+1}/{max_retries}: {str(e)}")
-            
-            # Check if we should retry based on the error type
-            if "ServiceUnavailable: 503 Connection reset" in str(e) or "Connection reset" in str(e):
-                # Calculate backoff with jitter
-                jitter_value = backoff * jitter * random.random()
-                wait_time = min(backoff + jitter_value, max_backoff)
-                
-                if logging:
-                    logging.info(f"Retrying streaming in {wait_time:.2f} seconds...")
-                else:
-                    print(f"Retrying streaming in {wait_time:.2f} seconds...")
-                
-                await asyncio.sleep(wait_time)
-                # Increase backoff exponentially
-                backoff = min(backoff * backoff_factor, max_backoff)
-                retries += 1
-            else:
-                # For other errors, try to yield error and break
-                yield f"Error in streaming: {str(e)}"
-                return
-    
-    # If all retries failed, yield error message
-    error_msg = f"Failed to call Gemini streaming API after {max_retries} attempts. Last error: {last_exception}"
-    if logging:
-        logging.error(error_msg)
-    else:
-        print(error_msg)
-    
-    yield f"Streaming error: {error_msg}"
+            record_gemini_call("call_gemini_stream", time.perf_counter() - start, error=True)
+            logging.warning(f"Gemini streaming API error on attempt {retries+1}/{max_retries}: {str(e)}")
+            retries += 1
+            if yielded or not _is_retryable(e) or retries >= max_retries:
+                raise
+
+        jitter_value = backoff * jitter * random.random()
+        wait_time = min(backoff + jitter_value, max_backoff)
+        logging.info(f"Retrying streaming in {wait_time:.2f} seconds...")
+        await asyncio.sleep(wait_time)
+        backoff = min(backoff * backoff_factor, max_backoff)
+
 
 # Compatibility function
 def call_gemini_sync_stream(prompt: str) -> str:
@@ -187,7 +356,9 @@ def call_gemini_sync_stream(prompt: str) -> str:
     Synchronous version that collects all streaming chunks
     (for backward compatibility)
     """
+    start = time.perf_counter()
     try:
+        multimodal_model, safety_config, config = get_gemini()
         responses = multimodal_model.generate_content(
             [prompt],
             safety_settings=safety_config, 
@@ -196,12 +367,132 @@ def call_gemini_sync_stream(prompt: str) -> str:
         )
         
         full_result = ''
+        usage = None
         for response in responses:
             full_result += response.text
+            usage = getattr(response, "usage_metadata", None) or usage
         
+        record_gemini_call("call_gemini_sync_stream", time.perf_counter() - start, usage)
         return full_result.strip()
         
     except Exception as e:
+        record_gemini_call("call_gemini_sync_stream", time.perf_counter() - start, error=True)
         print(f"Error in sync streaming: {e}")
         # Fallback to regular call_gemini
-        return call_gemini(prompt)
\ No newline at end of file
+        return call_gemini(prompt)
+
+async def _generate_async(prompt):
+    """One Gemini round trip without blocking the event loop; returns (text, usage)"""
+    if not is_gemini_initialized():
+        # Inisialisasi Vertex AI (baca credentials, dsb.) di thread terpisah
+        await asyncio.to_thread(get_gemini)
+    multimodal_model, safety_config, config = get_gemini()
+
+    if hasattr(multimodal_model, "generate_content_async"):
+        responses = await multimodal_model.generate_content_async(
+            [prompt],
+            safety_settings=safety_config,
+            generation_config=config,
+            stream=True
+        )
+        full_result = ''
+        usage = None
+        async for response in responses:
+            full_result += response.text
+            usage = getattr(response, "usage_metadata", None) or usage
+        return full_result, usage
+
+    # SDK tanpa API async: jalankan di executor terbatas
+    def collect():
+        responses = multimodal_model.generate_content(
+            [prompt],
+            safety_settings=safety_config,
+            generation_config=config,
+            stream=True
+        )
+        full_result = ''
+        usage = None
+        for response in responses:
+            full_result += response.text
+            usage = getattr(response, "usage_metadata", None) or usage
+        return full_result, usage
+
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), collect)
+
+
+async def call_gemini_async(prompt: str,
+                            max_retries: int = 2,
+                            initial_backoff: float = 1.0,
+                            max_backoff: float = 60.0,
+                            backoff_factor: float = 2.0,
+                            jitter: float = 0.1,
+                            timeout: float = None,
+                            use_cache: bool = True) -> str:
+    """
+    Async version of call_gemini for the Moskal AI pipeline
+
+    Uses the Vertex async API (or a bounded thread pool on SDKs without it),
+    limits concurrent calls per worker to GEMINI_MAX_CONCURRENCY and backs off
+    with asyncio.sleep, so other streams keep being served while Gemini runs.
+    Cancellation (e.g. the SSE client disconnected) propagates immediately.
+
+    Parameters:
+    -----------
+    prompt : str
+        Prompt text
+    timeout : float, optional
+        Seconds per attempt, defaults to GEMINI_TIMEOUT_SECONDS
+    use_cache : bool
+        Read from / write to the LLM cache
+
+    Returns:
+    --------
+    str
+        Generated text (stripped)
+    """
+    if use_cache:
+        cached = await asyncio.to_thread(get_cached_response, prompt, model, GENERATION_CONFIG, "call_gemini_async")
+        if cached is not None:
+            return cached
+
+    timeout = GEMINI_TIMEOUT_SECONDS if timeout is None else timeout
+    retries = 0
+    backoff = initial_backoff
+    last_exception = None
+
+    while retries < max_retries:
+        async with _get_async_semaphore():
+            start = time.perf_counter()
+            try:
+                if timeout:
+                    full_result, usage = await asyncio.wait_for(_generate_async(prompt), timeout)
+                else:
+                    full_result, usage = await _generate_async(prompt)
+                record_gemini_call("call_gemini_async", time.perf_counter() - start, usage)
+                full_result = full_result.strip()
+                if use_cache:
+                    await asyncio.to_thread(store_response, prompt, model, GENERATION_CONFIG, full_result, usage)
+                return full_result
+
+            except asyncio.CancelledError:
+                record_gemini_call("call_gemini_async", time.perf_counter() - start, error=True)
+                raise
+
+            except Exception as e:
+                record_gemini_call("call_gemini_async", time.perf_counter() - start, error=True)
+                last_exception = e
+                logging.warning(f"Gemini async API error on attempt {retries+1}/{max_retries}: {str(e) or type(e).__name__}")
+                if not (_is_retryable(e) or isinstance(e, asyncio.TimeoutError)):
+                    raise
+
+        # Backoff di luar semaphore agar slot bisa dipakai request lain
+        jitter_value = backoff * jitter * random.random()
+        wait_time = min(backoff + jitter_value, max_backoff)
+        logging.info(f"Retrying in {wait_time:.2f} seconds...")
+        await asyncio.sleep(wait_time)
+        backoff = min(backoff * backoff_factor, max_backoff)
+        retries += 1
+
+    error_msg = f"Failed to call Gemini API after {max_retries} attempts. Last error: {last_exception}"
+    logging.error(error_msg)
+    raise Exception(error_msg)
@@ -0,0 +1,253 @@
+"""
+Ingest Pipelines
+
+Fields derived from a post at index time, so the endpoints aggregate on
+a ready keyword instead of post-processing buckets in Python. Every
+enrichment adds processors to one pipeline (POST_PIPELINE) that is set
+as `index.final_pipeline` of the post indices, plus a backfill that runs
+the pipeline over the documents indexed before it existed:
+
+- link_normalized: link_post reduced with the per-channel rules of
+  utils.trending_links.normalize_link
+- region_tokens: the comma-joined region split into a keyword array
+  without placeholders ("Not Specified", "unknown", "Indonesia", ...),
+  plus intent_clean / emotions_clean, copies of intent / emotions that
+  are absent for placeholder values so "has a value" is an `exists`
+  check (the original fields are never modified)
+
+    python -m utils.ingest_pipelines --install                   # pipeline, mappings, final_pipeline
+    python -m utils.ingest_pipelines --backfill link_normalized  # update_by_query, waits for the task
+    python -m utils.ingest_pipelines --backfill region_tokens
+
+An endpoint only aggregates on an enriched field after its backfill has
+completed (enrichment_ready); until then it keeps its raw aggregation.
+"""
+
+import argparse
+import os
+import time
+
+from utils.es_query_builder import get_indices_from_channels
+from utils.rollup import get_checkpoint, save_checkpoint
+
+POST_PIPELINE = os.getenv("POST_PIPELINE", "moskal_post_enrichment")
+# Interval polling task backfill (detik)
+BACKFILL_POLL_SECONDS = 10
+
+# Painless versi normalize_link: split '/' manual supaya segmen kosong
+# tetap ada seperti str.split di Python
+LINK_NORMALIZED_SCRIPT = """
+def link = ctx.link_post;
+if (!(link instanceof String)) {
+    return;
+}
+String channel = ctx.channel instanceof String ? ctx.channel : 'other';
+List parts = new ArrayList();
+int offset = 0;
+while (true) {
+    int slash = link.indexOf('/', offset);
+    if (slash < 0) {
+        parts.add(link.substring(offset));
+        break;
+    }
+    parts.add(link.substring(offset, slash));
+    offset = slash + 1;
+}
+String normalized = link;
+if (parts.size() >= 3 && link.contains('://')) {
+    String base = parts.get(0) + '//' + parts.get(2);
+    if (channel == 'youtube' || channel == 'linkedin') {
+        normalized = base;
+    } else if (channel == 'reddit') {
+        normalized = parts.size() > 4 ? base + '/' + parts.get(3) + '/' + parts.get(4) : base;
+    } else {
+        normalized = parts.size() > 3 ? base + '/' + parts.get(3) : base;
+    }
+}
+ctx.link_normalized = normalized;
+"""
+
+# Nilai placeholder (lowercase) yang dianggap kosong; "indonesia" hanya untuk region
+PLACEHOLDER_VALUES = ["not specified", "unknown", "unspecified", ""]
+
+REGION_TOKENS_SCRIPT = """
+List placeholders = params.placeholders;
+for (String field : ['intent', 'emotions']) {
+    def value = ctx[field];
+    if (value instanceof String && !placeholders.contains(value.trim().toLowerCase())) {
+        ctx[field + '_clean'] = value;
+    } else {
+        ctx.remove(field + '_clean');
+    }
+}
+List values = new ArrayList();
+if (ctx.region instanceof String) {
+    values.add(ctx.region);
+} else if (ctx.region instanceof List) {
+    values.addAll(ctx.region);
+}
+List tokens = new ArrayList();
+for (def value : values) {
+    if (!(value instanceof String)) {
+        continue;
+    }
+    for (String part : value.splitOnToken(',')) {
+        String token = part.trim();
+        String lower = token.toLowerCase();
+        if (!placeholders.contains(lower) && lower != 'indonesia' && !tokens.contains(token)) {
+            tokens.add(token);
+        }
+    }
+}
+ctx.region_tokens = tokens.isEmpty() ? null : tokens;
+"""
+
+ENRICHMENTS = {
+    "link_normalized": {
+        "processors": [
+            {"script": {"tag": "link_normalized", "lang": "painless", "source": LINK_NORMALIZED_SCRIPT}}
+        ],
+        "properties": {
+            "link_normalized": {"type": "keyword"}
+        },
+        # Dokumen lama yang belum punya field ini
+        "backfill_query": {
+            "bool": {
+                "filter": [{"exists": {"field": "link_post"}}],
+                "must_not": [{"exists": {"field": "link_normalized"}}]
+            }
+        }
+    },
+    "region_tokens": {
+        "processors": [
+            {"script": {"tag": "region_tokens", "lang": "painless", "source": REGION_TOKENS_SCRIPT,
+                        "params": {"placeholders": PLACEHOLDER_VALUES}}}
+        ],
+        "properties": {
+            "region_tokens": {"type": "keyword"},
+            "intent_clean": {"type": "keyword"},
+            "emotions_clean": {"type": "keyword"}
+        },
+        # Dokumen tanpa nilai yang valid tetap tanpa field ini, jadi backfill
+        # ulang memproses mereka lagi (hasilnya sama)
+        "backfill_query": {
+            "bool": {
+                "should": [
+                    {"bool": {"must_not": [{"exists": {"field": field}}]}}
+                    for field in ("region_tokens", "intent_clean", "emotions_clean")
+                ],
+                "minimum_should_match": 1
+            }
+        }
+    }
+}
+
+
+def post_pipeline():
+    """Body of POST_PIPELINE: the processors of every enrichment in order"""
+    processors = []
+    for enrichment in ENRICHMENTS.values():
+        processors.extend(enrichment["processors"])
+    return {
+        "description": "Moskal post enrichment (" + ", ".join(ENRICHMENTS) + ")",
+        "processors": processors
+    }
+
+
+def install(es, indices=None):
+    """
+    Create/update POST_PIPELINE, add the enriched fields to the mappings and
+    set the pipeline as final_pipeline of the post indices
+
+    Indices that already have another final_pipeline are left untouched
+    (and reported), so an existing ingest setup is never replaced.
+    """
+    indices = indices or get_indices_from_channels()
+    es.ingest.put_pipeline(id=POST_PIPELINE, **post_pipeline())
+
+    properties = {}
+    for enrichment in ENRICHMENTS.values():
+        properties.update(enrichment["properties"])
+
+    for index in indices:
+        if not es.indices.exists(index=index):
+            print(f"Ingest: {index} does not exist, skipped")
+            continue
+        es.indices.put_mapping(index=index, properties=properties)
+        settings = es.indices.get_settings(index=index, name="index.final_pipeline")
+        current = next(iter(settings.values()), {}).get("settings", {}).get("index", {}).get("final_pipeline")
+        if current and current != POST_PIPELINE:
+            print(f"Ingest: {index} already uses final_pipeline {current}, not replaced")
+            continue
+        es.indices.put_settings(index=index, settings={"index.final_pipeline": POST_PIPELINE})
+        print(f"Ingest: {index} -> {POST_PIPELINE}")
+
+
+def _state_name(name):
+    return f"enrichment_{name}"
+
+
+def enrichment_ready(es, name):
+    """Whether the backfill of an enrichment has completed (checkpoint cached for 60 seconds)"""
+    return get_checkpoint(es, _state_name(name)) is not None
+
+
+def backfill(es, name, indices=None):
+    """
+    Run POST_PIPELINE over the documents that do not have an enrichment yet
+
+    Starts an update_by_query task (sliced, conflicts proceed), waits for
+    it and stores the completion in the rollup state index, after which
+    enrichment_ready(es, name) is True.
+
+    Returns:
+    --------
+    dict
+        Task status of the update_by_query
+    """
+    indices = indices or get_indices_from_channels()
+    response = es.update_by_query(
+        index=",".join(indices),
+        pipeline=POST_PIPELINE,
+        query=ENRICHMENTS[name]["backfill_query"],
+        conflicts="proceed",
+        slices="auto",
+        ignore_unavailable=True,
+        wait_for_completion=False
+    )
+    task_id = response["task"]
+    print(f"Ingest: backfill {name} started as task {task_id}")
+
+    while True:
+        task = es.tasks.get(task_id=task_id)
+        status = task.get("task", {}).get("status", {})
+        if task.get("completed"):
+            break
+        print(f"Ingest: backfill {name} {status.get('updated', 0)}/{status.get('total', 0)}")
+        time.sleep(BACKFILL_POLL_SECONDS)
+
+    if task.get("error") or task.get("response", {}).get("failures"):
+        raise RuntimeError(f"Backfill {name} failed: {task.get('error') or task['response']['failures'][:3]}")
+
+    save_checkpoint(es, _state_name(name), {"completed_at": time.time(), "indices": indices})
+    print(f"Ingest: backfill {name} done, {task.get('response', {}).get('updated', 0)} documents")
+    return task
+
+
+if __name__ == "__main__":
+    from utils.es_client import get_elasticsearch_client
+
+    parser = argparse.ArgumentParser(description="Post enrichment ingest pipeline")
+    parser.add_argument("--install", action="store_true",
+                        help="Create the pipeline, update mappings and set final_pipeline")
+    parser.add_argument("--backfill", choices=sorted(ENRICHMENTS), action="append", default=[],
+                        help="Enrich existing documents (repeatable)")
+    args = parser.parse_args()
+
+    es = get_elasticsearch_client()
+    if not es:
+        raise SystemExit("Elasticsearch is not reachable")
+    if args.install:
+        install(es)
+    for name in args.backfill:
+        backfill(es, name)
@@ -6,8 +6,30 @@ from typing import Dict, List, Literal, Optional, Union
 # Import utilitas dari paket utils
 from utils.es_client import get_elasticsearch_client
 from utils.es_query_builder import get_date_range, get_indices_from_channels
+from utils.ingest_pipelines import PLACEHOLDER_VALUES, enrichment_ready
 from utils.redis_client import redis_client
+from utils.metrics import instrument
 
+NOT_SPECIFIED = ["Not Specified", "not specified", "unknown", ""]
+
+
+def _split_region_counts(buckets):
+    """
+    Region counts from buckets of the raw comma-joined region field
+    (before the region_tokens backfill)
+    """
+    region_counts = {}
+    for bucket in buckets:
+        if bucket["key"] in NOT_SPECIFIED:
+            continue
+        for region in bucket["key"].split(","):
+            region = region.strip()
+            if region and region not in NOT_SPECIFIED:
+                region_counts[region] = region_counts.get(region, 0) + bucket["doc_count"]
+    return region_counts
+
+
+@instrument()
 def get_intents_emotions_region_share(
     es_host=None,
     es_username=None,
@@ -149,16 +171,31 @@ def get_intents_emotions_region_share(
                 "size": limit,
                 "missing": "unknown"
             }
-        },
+        }
+    }
+    
+    # Setelah backfill region_tokens (utils.ingest_pipelines) ada field turunan
+    # tanpa placeholder (region_tokens, intent_clean, emotions_clean): cukup terms + exists
+    use_tokens = enrichment_ready(es, "region_tokens")
+    if use_tokens:
+        aggs["intent_distribution"]["terms"] = {"field": "intent_clean", "size": limit}
+        aggs["emotions_distribution"]["terms"] = {"field": "emotions_clean", "size": limit}
+        # Post tanpa region_tokens tidak punya bucket, tanpa filter tambahan
+        aggs["regions_distribution"] = {
+            "terms": {
+                "field": "region_tokens",
+                "size": limit
+            }
+        }
+    else:
         # Region distribution - region sebagai keyword field
-        "regions_distribution": {
+        aggs["regions_distribution"] = {
             "terms": {
                 "field": "region",  # Field region adalah keyword dalam mapping
                 "size": 100,  # Get more regions to process manually
                 "missing": "unknown"
             }
         }
-    }
     
     # Bangun query kustom untuk mengakomodasi case_sensitive dan search_exact_phrases
     must_conditions = [
@@ -297,47 +334,38 @@ def get_intents_emotions_region_share(
     if "filter" not in query["query"]["bool"]:
         query["query"]["bool"]["filter"] = []
     
-    # Add filter to exclude "Not Specified" from intent
-    intent_not_specified_filter = {
-        "bool": {
-            "must_not": [
-                {"term": {"intent": "Not Specified"}},
-                {"term": {"intent": "not specified"}},
-                {"term": {"intent": "unknown"}},
-                {"term": {"intent": ""}}
-            ]
-        }
-    }
-    query["query"]["bool"]["filter"].append(intent_not_specified_filter)
-    
-    # Add filter to exclude "Not Specified" from emotions - gunakan emotions.keyword
-    emotions_not_specified_filter = {
-        "bool": {
-            "must_not": [
-                {"term": {"emotions.keyword": "Not Specified"}},
-                {"term": {"emotions.keyword": "not specified"}},
-                {"term": {"emotions.keyword": "unknown"}},
-                {"term": {"emotions.keyword": ""}}
-            ]
-        }
-    }
-    query["query"]["bool"]["filter"].append(emotions_not_specified_filter)
-    
-    # Add filter to exclude "Not Specified" from region
-    region_not_specified_filter = {
+    # Kedua jalur memfilter post yang sama: intent / emotions / region berisi
+    # placeholder dibuang, post tanpa field tersebut tetap dihitung
+    if use_tokens:
+        # Placeholder = field ada tetapi versi _clean tidak ada
+        for field in ("intent", "emotions"):
+            query["query"]["bool"]["filter"].append({
+                "bool": {
+                    "must_not": [{
+                        "bool": {
+                            "filter": [{"exists": {"field": field}}],
+                            "must_not": [{"exists": {"field": f"{field}_clean"}}]
+                        }
+                    }]
+                }
+            })
+    else:
+        # Placeholder yang sama dengan pipeline (tanpa membedakan huruf besar/kecil)
+        for field in ("intent", "emotions.keyword"):
+            query["query"]["bool"]["filter"].append({
+                "bool": {
+                    "must_not": [{"term": {field: {"value": value, "case_insensitive": True}}}
+                                 for value in PLACEHOLDER_VALUES]
+                }
+            })
+    # region_tokens juga membuang "Indonesia", jadi placeholder region tetap dari field mentah
+    query["query"]["bool"]["filter"].append({
         "bool": {
-            "must_not": [
-                {"term": {"region": "Not Specified"}},
-                {"term": {"region": "not specified"}},
-                {"term": {"region": "unknown"}},
-                {"term": {"region": ""}}
-            ]
+            "must_not": [{"term": {"region": value}} for value in NOT_SPECIFIED]
         }
-    }
-    query["query"]["bool"]["filter"].append(region_not_specified_filter)
+    })
     
     try:
-        #print(json.dumps(query, indent=2))
         # Execute query
         response = es.search(
             index=",".join(indices),
@@ -347,7 +375,6 @@ def get_intents_emotions_region_share(
         # Extract data
         total_mentions = response["aggregations"]["total_mentions"]["value"]
         
-        print('----->',total_mentions)
         # Process intents data
         intent_buckets = []
         
@@ -372,7 +399,7 @@ def get_intents_emotions_region_share(
         # Format intent share data
         intents_share = []
         for bucket in intent_buckets:
-            if bucket["key"] not in ["Not Specified", "not specified", "unknown", ""]:
+            if bucket["key"] not in NOT_SPECIFIED:
                 intents_share.append({
                     "name": bucket["key"],
                     "percentage": bucket["doc_count"]
@@ -381,49 +408,17 @@ def get_intents_emotions_region_share(
         # Format emotions share data
         emotions_share = []
         for bucket in emotions_buckets:
-            if bucket["key"] not in ["Not Specified", "not specified", "unknown", ""]:
-                
+            if bucket["key"] not in NOT_SPECIFIED:
                 emotions_share.append({
                     "name": bucket["key"],
                     "percentage": bucket["doc_count"]
                 })
         
-        # Process regions manually to handle comma separation
-        region_counts = {}
-        
-        # First process from aggregation buckets
-        for bucket in regions_buckets:
-            if bucket["key"] not in ["Not Specified", "not specified", "unknown", ""]:
-                region_value = bucket["key"]
-                
-                # Check if region contains comma
-                if "," in region_value:
-                    # Split by comma and count each region
-                    for region in region_value.split(","):
-                        region = region.strip()
-                        if region and region not in ["Not Specified", "not specified", "unknown"]:
-                            region_counts[region] = region_counts.get(region, 0) + bucket["doc_count"]
-                else:
-                    region_counts[region_value] = region_counts.get(region_value, 0) + bucket["doc_count"]
-        
-        # Now process from individual documents to get more accurate counts
-        for hit in response["hits"]["hits"]:
-            if "_source" in hit and "region" in hit["_source"] and hit["_source"]["region"]:
-                region_value = hit["_source"]["region"]
-                
-                # Skip not specified values
-                if region_value in ["Not Specified", "not specified", "unknown", "","Indonesia"]:
-                    continue
-                    
-                # Check if region contains comma
-                if "," in region_value:
-                    # Split by comma and count each region
-                    for region in region_value.split(","):
-                        region = region.strip()
-                        if region and region not in ["Not Specified", "not specified", "unknown","Indonesia"]:
-                            region_counts[region] = region_counts.get(region, 0) + 1
-                else:
-                    region_counts[region_value] = region_counts.get(region_value, 0) + 1
+        # Process regions: region_tokens sudah bersih, region mentah dipecah per koma
+        if use_tokens:
+            region_counts = {bucket["key"]: bucket["doc_count"] for bucket in regions_buckets}
+        else:
+            region_counts = _split_region_counts(regions_buckets)
         
         # Convert region counts to percentage and format
         regions_share = []
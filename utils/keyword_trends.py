@@ -9,8 +9,11 @@ from utils.es_query_builder import (
     build_elasticsearch_query,
     add_time_series_aggregation
 )
+from utils.mentions_rollup import daily_totals, mentions_rollup_set
 from utils.redis_client import redis_client
+from utils.metrics import instrument
 
+@instrument()
 def get_keyword_trends(
     es_host=None,
     es_username=None,
@@ -109,6 +112,21 @@ def get_keyword_trends(
             custom_end_date=custom_end_date
         )
     
+    # Tanpa filter selain tanggal, channel dan keywords: pakai rollup mentions_daily
+    set_id = mentions_rollup_set(
+        es, start_date, end_date, keywords=keywords, search_keyword=search_keyword,
+        search_exact_phrases=search_exact_phrases, case_sensitive=case_sensitive, sentiment=sentiment,
+        importance=importance, influence_score_min=influence_score_min, influence_score_max=influence_score_max,
+        region=region, language=language, domain=domain
+    )
+    if set_id:
+        try:
+            result = rollup_time_series_results(daily_totals(es, set_id, selected_channels, start_date, end_date))
+            redis_client.set_with_ttl(cache_key, result, ttl_seconds=600)
+            return result
+        except Exception as e:
+            print(f"Mentions rollup failed, using raw indices: {e}")
+    
     # Bangun query manual daripada menggunakan build_elasticsearch_query langsung
     # ini untuk mendukung fitur search_exact_phrases dan case_sensitive
     must_conditions = [
@@ -291,8 +309,6 @@ def get_keyword_trends(
     # Execute query
     try:
 
-        import json
-        #print(json.dumps(query, indent=2))
         response = es.search(
             index=",".join(indices),
             body=query
@@ -354,3 +370,14 @@ def process_time_series_results(response):
         print(f"Error processing time series results: {e}")
         print("Make sure the response contains 'time_series' aggregation")
         return []
+
+def rollup_time_series_results(totals):
+    """Same output as process_time_series_results, from mentions_rollup.daily_totals"""
+    return [{
+        'post_date': f"{day['date']} 00:00:00",
+        'total_mentions': int(day['mentions']),
+        'total_reach': round(day['reach_sum'], 3),
+        'total_positive': int(day['sentiment_positive']),
+        'total_negative': int(day['sentiment_negative']),
+        'total_neutral': int(day['sentiment_neutral'])
+    } for day in totals['days']]
@@ -0,0 +1,284 @@
+"""
+KOL Aggregation Engine
+
+Groups mentions per KOL (username + channel) for kol_overview.
+
+The full path pages through every KOL with a `composite` aggregation over
+the `username` and `channel` fields (after_key paging) and streams each
+page into a columnar accumulator, so ranking happens in Python on the
+complete population instead of the 1000 buckets a scripted terms key
+could return. Grouping uses the fields' doc values directly; no Painless
+runs per document except the influence score.
+
+When only the top N KOLs are needed (KOL_TOP_N > 0) a single
+`multi_terms` request with a `bucket_sort` pipeline returns them ordered
+by influence, followers and post count.
+
+Most followers and share of voice only need the top `limit` authors of
+every channel by post count: fetch_channel_top_frame runs one
+`by_channel > by_username` terms aggregation with the metrics both
+endpoints read (no influence script, sentiment or clusters).
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.script_score import script_score
+
+# Bucket per halaman composite
+KOL_PAGE_SIZE = int(os.getenv("KOL_PAGE_SIZE", "1000"))
+# Batas total KOL yang dikumpulkan (proteksi memori untuk project sangat besar)
+KOL_MAX_BUCKETS = int(os.getenv("KOL_MAX_BUCKETS", "50000"))
+# 0 = semua KOL (composite), > 0 = hanya top N (multi_terms + bucket_sort)
+KOL_TOP_N = int(os.getenv("KOL_TOP_N", "0"))
+
+# Urutan fallback jumlah followers per channel
+FOLLOWER_FIELDS = ("user_followers", "user_connections", "subscriber")
+SENTIMENTS = ("positive", "negative", "neutral")
+
+KOL_COLUMNS = [
+    "username", "channel", "link_post", "viral_score", "reach_score", "user_image_url",
+    "user_followers", "engagement_rate", "issue", "user_category", "user_influence_score",
+    "sentiment_positive", "sentiment_negative", "sentiment_neutral"
+]
+# Kolom tambahan untuk most followers (rata-rata field user_influence_score)
+AUTHOR_COLUMNS = KOL_COLUMNS + ["mean_user_influence_score"]
+
+
+def kol_metric_aggs(kol=True):
+    """
+    Per-KOL sub-aggregations shared by the composite and top-N paths
+
+    Followers are three plain `max` aggregations coalesced in Python and
+    sentiment is one `terms` aggregation, replacing the scripted max and
+    the three filter aggregations. Post count is the bucket doc_count.
+    With kol=False only the metrics of most followers and share of voice
+    are aggregated (the other columns stay 0 / empty).
+    """
+    aggs = {f"{field}_max": {"max": {"field": field}} for field in FOLLOWER_FIELDS}
+    aggs.update({
+        "reach_score_sum": {"sum": {"field": "reach_score"}},
+        "unique_user_image_url": {"terms": {"field": "user_image_url", "size": 1}},
+        "user_influence_score_field_avg": {"avg": {"field": "user_influence_score"}}
+    })
+    if kol:
+        aggs.update({
+            "viral_score_sum": {"sum": {"field": "viral_score"}},
+            "engagement_rate_sum": {"sum": {"field": "engagement_rate"}},
+            "unique_user_category": {"terms": {"field": "user_category.keyword", "size": 1}},
+            # Tetap script_score supaya nilai influence sama dengan endpoint lain
+            "user_influence_score_avg": {"avg": {"script": script_score}},
+            "sentiments": {"terms": {"field": "sentiment", "size": len(SENTIMENTS)}},
+            "unique_issues": {"terms": {"field": "cluster.keyword", "size": 10}}
+        })
+    return aggs
+
+
+def _value(bucket, name):
+    # Agregasi yang tidak diminta (kol=False) dianggap kosong
+    return bucket[name]["value"] if name in bucket else None
+
+
+def _keys(bucket, name):
+    return [item["key"] for item in bucket[name]["buckets"]] if name in bucket else []
+
+
+class KolAccumulator:
+    """Column lists filled bucket by bucket, turned into a DataFrame at the end"""
+
+    def __init__(self):
+        self.columns = {column: [] for column in AUTHOR_COLUMNS}
+
+    def __len__(self):
+        return len(self.columns["username"])
+
+    def add(self, username, channel, bucket):
+        columns = self.columns
+        columns["username"].append(username if username is not None else "unknown")
+        columns["channel"].append(channel if channel is not None else "unknown")
+        columns["link_post"].append(bucket["doc_count"])
+        columns["viral_score"].append(_value(bucket, "viral_score_sum"))
+        columns["reach_score"].append(_value(bucket, "reach_score_sum"))
+        columns["engagement_rate"].append(_value(bucket, "engagement_rate_sum"))
+        columns["user_influence_score"].append(_value(bucket, "user_influence_score_avg"))
+        columns["mean_user_influence_score"].append(_value(bucket, "user_influence_score_field_avg"))
+
+        # Followers: field pertama yang punya nilai (user_followers -> user_connections -> subscriber)
+        followers = 0
+        for field in FOLLOWER_FIELDS:
+            value = bucket[f"{field}_max"]["value"]
+            if value is not None:
+                followers = value
+                break
+        columns["user_followers"].append(followers)
+
+        image = _keys(bucket, "unique_user_image_url")
+        columns["user_image_url"].append(image[0] if image else "")
+        category = _keys(bucket, "unique_user_category")
+        columns["user_category"].append(category[0] if category else "")
+        columns["issue"].append(_keys(bucket, "unique_issues"))
+
+        sentiments = bucket["sentiments"]["buckets"] if "sentiments" in bucket else []
+        counts = {item["key"]: item["doc_count"] for item in sentiments}
+        for sentiment in SENTIMENTS:
+            columns[f"sentiment_{sentiment}"].append(counts.get(sentiment, 0))
+
+    def to_frame(self):
+        return pd.DataFrame(self.columns, columns=AUTHOR_COLUMNS)
+
+
+def _search_body(base_query, aggs):
+    body = {key: value for key, value in base_query.items() if key not in ("aggs", "aggregations", "sort")}
+    body.update({"size": 0, "track_total_hits": False, "aggs": aggs})
+    return body
+
+
+def _fetch_all(es, index, base_query, page_size, max_buckets):
+    accumulator = KolAccumulator()
+    composite = {
+        "size": page_size,
+        "sources": [
+            {"username": {"terms": {"field": "username", "missing_bucket": True}}},
+            {"channel": {"terms": {"field": "channel", "missing_bucket": True}}}
+        ]
+    }
+    pages = 0
+    while True:
+        aggs = {"kols": {"composite": composite, "aggs": kol_metric_aggs()}}
+        response = es.search(index=index, body=_search_body(base_query, aggs))
+        result = response.get("aggregations", {}).get("kols", {})
+        buckets = result.get("buckets", [])
+        pages += 1
+        for bucket in buckets:
+            accumulator.add(bucket["key"].get("username"), bucket["key"].get("channel"), bucket)
+
+        after_key = result.get("after_key")
+        if not buckets or not after_key or len(buckets) < page_size:
+            break
+        if len(accumulator) >= max_buckets:
+            print(f"KOL engine: stopped at {len(accumulator)} KOLs (KOL_MAX_BUCKETS={max_buckets})")
+            break
+        composite = {**composite, "after": after_key}
+
+    print(f"KOL engine: {len(accumulator)} KOLs in {pages} composite pages")
+    return accumulator
+
+
+def _fetch_top(es, index, base_query, top_n):
+    accumulator = KolAccumulator()
+    aggs = kol_metric_aggs()
+    aggs["top_kols_sort"] = {
+        "bucket_sort": {
+            "sort": [
+                {"user_influence_score_avg": {"order": "desc"}},
+                {"user_followers_max": {"order": "desc"}},
+                {"_count": {"order": "desc"}}
+            ],
+            "size": top_n
+        }
+    }
+    multi_terms = {
+        "terms": [
+            {"field": "username", "missing": "unknown"},
+            {"field": "channel", "missing": "unknown"}
+        ],
+        "size": top_n,
+        "order": [{"user_influence_score_avg": "desc"}, {"_count": "desc"}]
+    }
+    response = es.search(index=index, body=_search_body(
+        base_query, {"kols": {"multi_terms": multi_terms, "aggs": aggs}}))
+    for bucket in response.get("aggregations", {}).get("kols", {}).get("buckets", []):
+        username, channel = (list(bucket["key"]) + ["unknown", "unknown"])[:2]
+        accumulator.add(username, channel, bucket)
+    return accumulator
+
+
+def _numeric_frame(accumulator):
+    frame = accumulator.to_frame()
+    numeric = [column for column in AUTHOR_COLUMNS if column not in ("username", "channel", "user_image_url",
+                                                                     "issue", "user_category")]
+    frame[numeric] = frame[numeric].apply(pd.to_numeric, errors="coerce").replace([np.inf, -np.inf], 0).fillna(0)
+    return frame
+
+
+def fetch_channel_top_frame(es, index, base_query, channel_count, limit):
+    """
+    Top `limit` authors by post count in every channel
+
+    Parameters:
+    -----------
+    es : Elasticsearch
+        Elasticsearch client
+    index : str
+        Comma-separated indices
+    base_query : dict
+        Search body with the filters (aggs, sort and size are replaced)
+    channel_count : int
+        Number of channels (size of the channel terms aggregation)
+    limit : int
+        Authors per channel
+
+    Returns:
+    --------
+    tuple
+        (DataFrame with AUTHOR_COLUMNS, only the most followers / share of
+        voice metrics filled; total mentions of every post, value_count of
+        link_post)
+    """
+    accumulator = KolAccumulator()
+    aggs = {
+        "by_channel": {
+            "terms": {"field": "channel", "size": channel_count},
+            "aggs": {
+                "by_username": {
+                    "terms": {"field": "username", "size": limit},
+                    "aggs": kol_metric_aggs(kol=False)
+                }
+            }
+        },
+        "total_mentions": {"value_count": {"field": "link_post"}}
+    }
+    response = es.search(index=index, body=_search_body(base_query, aggs))
+    aggregations = response.get("aggregations", {})
+    for channel_bucket in aggregations.get("by_channel", {}).get("buckets", []):
+        for bucket in channel_bucket["by_username"]["buckets"]:
+            accumulator.add(bucket["key"], channel_bucket["key"], bucket)
+    return _numeric_frame(accumulator), aggregations.get("total_mentions", {}).get("value") or 0
+
+
+def fetch_kol_frame(es, index, base_query, top_n=None, page_size=None, max_buckets=None):
+    """
+    Per-KOL metrics as a DataFrame
+
+    Parameters:
+    -----------
+    es : Elasticsearch
+        Elasticsearch client
+    index : str
+        Comma-separated indices
+    base_query : dict
+        Search body with the filters (aggs, sort and size are replaced)
+    top_n : int, optional
+        Only the top N KOLs by influence, followers and posts; 0 for all
+        KOLs. Defaults to KOL_TOP_N
+    page_size : int, optional
+        Composite page size, defaults to KOL_PAGE_SIZE
+    max_buckets : int, optional
+        Upper bound on collected KOLs, defaults to KOL_MAX_BUCKETS
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per KOL with AUTHOR_COLUMNS; numeric columns are float/int
+        with missing metric values as 0
+    """
+    top_n = KOL_TOP_N if top_n is None else top_n
+    if top_n and top_n > 0:
+        accumulator = _fetch_top(es, index, base_query, top_n)
+    else:
+        accumulator = _fetch_all(es, index, base_query, page_size or KOL_PAGE_SIZE,
+                                 max_buckets or KOL_MAX_BUCKETS)
+
+    return _numeric_frame(accumulator)
@@ -1,31 +1,43 @@
 from utils.es_client import get_elasticsearch_client
 from utils.es_query_builder import build_elasticsearch_query, get_indices_from_channels, get_date_range
-from utils.script_score import script_score
+from utils.author_metrics import get_author_metrics
+from utils.kol_engine import KOL_COLUMNS, KOL_TOP_N, fetch_kol_frame
 import pandas as pd
 import uuid, numpy as np
 from elasticsearch import Elasticsearch
 from dotenv import load_dotenv
 from utils.redis_client import redis_client
+from utils.metrics import instrument
 
 # Load environment variables
 load_dotenv()
 
-# Buat koneksi ke Elasticsearch
-es = get_elasticsearch_client()
+# Prefix profil per channel; channel lain memakai username apa adanya
+LINK_USER_PREFIX = {
+    'twitter': 'https://x.com/',
+    'instagram': 'https://www.instagram.com/',
+    'tiktok': 'https://www.tiktok.com/@',
+    'linkedin': 'https://www.linkedin.com/in/',
+    'reddit': 'https://www.reddit.com/',
+}
+
+# Bobot komponen skor most_viral
+MOST_VIRAL_WEIGHTS = {
+    'user_influence_score': 0.35,  # Highest weight - our calculated influence score
+    'user_followers': 0.25,        # Follower count matters
+    'link_post': 0.15,             # Posting frequency
+    'reach_score': 0.15,           # Total reach achieved
+    'engagement_rate': 0.10        # Engagement rate
+}
 
 def create_link_user(df):
-    if df['channel'] == 'twitter':
-        return f"""https://x.com/{df['username'].strip('@ ')}"""
-    if df['channel'] == 'instagram':
-        return f"""https://www.instagram.com/{df['username'].strip('@ ')}"""
-    if df['channel'] == 'tiktok':
-        return f"""https://www.tiktok.com/@{df['username'].strip('@ ')}"""
-    if df['channel']=='linkedin':
-        return f"""https://www.linkedin.com/in/{df['username'].strip('@ ')}"""
-    if df['channel']=='reddit':
-        return f"""https://www.reddit.com/{df['username'].strip('@ ')}"""
-    
-    return df['username']
+    """Profile link per KOL (vectorized over the username and channel columns)"""
+    username = df['username'].astype(str)
+    prefix = df['channel'].map(LINK_USER_PREFIX)
+    return pd.Series(
+        np.where(prefix.notna(), prefix.fillna('') + username.str.strip('@ '), username),
+        index=df.index
+    )
     
 def add_negative_driver_flag(df):
     # Ensure all sentiment columns exist
@@ -50,15 +62,80 @@ def create_uuid(keyword):
     namespace = uuid.NAMESPACE_DNS
     return uuid.uuid5(namespace, keyword)
 
-def rule_base_user_category(string, category):
-    if pd.isna(string):
-        return ''
-    
-    if 'news' in string.lower():
-        return 'News Account'
+def rule_base_user_category(df):
+    """
+    user_category per KOL: 'News Account' for the news channel and for
+    usernames containing 'news', '' when the username is missing,
+    otherwise the indexed category
+    """
+    username = df['username']
+    is_news = (df['channel'] == 'news').to_numpy() | \
+        username.fillna('').astype(str).str.lower().str.contains('news', regex=False).to_numpy()
+    return pd.Series(
+        np.where(is_news, 'News Account', np.where(username.isna().to_numpy(), '', df['user_category'].astype(object))),
+        index=df.index
+    )
 
-    return category
-    
+def calculate_most_viral_score(df):
+    """
+    Composite KOL score scaled to 0-100
+
+    Each metric is normalized by its column maximum (computed once), the
+    weighted sum is multiplied by a sentiment factor (negative share * 0.3
+    plus positive share * 0.2 on top of 1) and the result is scaled so the
+    best KOL scores 100.
+    """
+    composite = np.zeros(len(df))
+    for column, weight in MOST_VIRAL_WEIGHTS.items():
+        values = df[column].to_numpy(dtype=float)
+        max_value = values.max() if len(values) and values.max() > 0 else 1
+        composite += values / max_value * weight
+
+    positive = df['sentiment_positive'].to_numpy(dtype=float)
+    negative = df['sentiment_negative'].to_numpy(dtype=float)
+    total = positive + df['sentiment_neutral'].to_numpy(dtype=float) + negative
+    safe_total = np.where(total > 0, total, 1)
+    sentiment_factor = np.where(total > 0, 1 + negative / safe_total * 0.3 + positive / safe_total * 0.2, 1)
+
+    composite = composite * sentiment_factor
+    composite[~np.isfinite(composite)] = 0
+    max_viral = composite.max() if len(composite) and composite.max() > 0 else 1
+    return composite / max_viral * 100
+
+def score_kols(final_kol):
+    """
+    Add category, link and scoring columns to the KOL frame
+
+    Adds user_category, link_user, is_negative_driver, unified_issue,
+    most_viral, share_of_voice and engagement_per_follower. All columns
+    are array expressions over the whole frame.
+    """
+    final_kol['user_category'] = rule_base_user_category(final_kol)
+    final_kol['link_user'] = create_link_user(final_kol)
+    final_kol = add_negative_driver_flag(final_kol)
+
+    # Issue mapping (kosong untuk saat ini); issue dari terms agg sudah unik
+    dict_issue = {}
+    if dict_issue:
+        final_kol['unified_issue'] = [list(dict.fromkeys(dict_issue.get(i, i) for i in issues))[:5]
+                                      for issues in final_kol['issue']]
+    else:
+        final_kol['unified_issue'] = [issues[:5] for issues in final_kol['issue']]
+
+    final_kol['most_viral'] = calculate_most_viral_score(final_kol)
+
+    # Share of voice with safe division
+    total_posts = final_kol['link_post'].sum()
+    final_kol['share_of_voice'] = (final_kol['link_post'] / total_posts) * 100 if total_posts > 0 else 0
+
+    # Engagement relative to followers (rising stars)
+    followers = final_kol['user_followers'].to_numpy(dtype=float)
+    engagement = final_kol['engagement_rate'].to_numpy(dtype=float)
+    valid = (followers > 0) & np.isfinite(followers) & np.isfinite(engagement)
+    final_kol['engagement_per_follower'] = np.where(valid, engagement / np.where(valid, followers, 1), 0)
+    return final_kol
+
+@instrument()
 def search_kol(
     owner_id = None,
     project_name = None,
@@ -149,325 +226,32 @@ def search_kol(
             custom_end_date=custom_end_date
         )
 
-    # Build base query menggunakan es_query_builder
-    base_query = build_elasticsearch_query(
-        keywords=keywords,
-        search_keyword=search_keyword,
-        search_exact_phrases=search_exact_phrases,
-        case_sensitive=case_sensitive,
-        sentiment=sentiment,
-        start_date=start_date,
-        end_date=end_date,
-        importance=importance,
-        influence_score_min=influence_score_min,
-        influence_score_max=influence_score_max,
-        region=region,
-        language=language,
-        domain=domain,
-        size=0  # Untuk aggregation saja
-    )
-
-    # Tambahkan aggregation untuk KOL analysis
-    aggregation_query = {
-        "by_username_channel": {
-            "terms": {
-                "script": {
-                    "source": """
-                        String username = doc.containsKey('username') && !doc['username'].empty ? doc['username'].value : 'unknown';
-                        String channel = doc.containsKey('channel') && !doc['channel'].empty ? doc['channel'].value : 'unknown';
-                        return username + '|' + channel;
-                    """
-                },
-                "size": 1000,  # Increase size to get more KOLs
-                "order": [
-                    {
-                        "user_influence_score_avg": "desc"
-                    },
-                    {
-                        "followers_count": "desc"
-                    },
-                    {
-                        "total_posts": "desc"
-                    }
-                ]
-            },
-            "aggs": {
-                "username": {
-                    "terms": {
-                        "field": "username",
-                        "size": 1
-                    }
-                },
-                "channel": {
-                    "terms": {
-                        "field": "channel",
-                        "size": 1
-                    }
-                },
-                "followers_count": {
-                    "max": {
-                        "script": {
-                            "source": """
-                                // Logic untuk followers dengan fallback - menggunakan max untuk mendapatkan nilai tertinggi per user
-                                if (doc.containsKey('user_followers') && !doc['user_followers'].empty) {
-                                    return doc['user_followers'].value;
-                                } else if (doc.containsKey('user_connections') && !doc['user_connections'].empty) {
-                                    return doc['user_connections'].value;
-                                } else if (doc.containsKey('subscriber') && !doc['subscriber'].empty) {
-                                    return doc['subscriber'].value;
-                                } else {
-                                    return 0;
-                                }
-                            """
-                        }
-                    }
-                },
-                "total_posts": {
-                    "value_count": {
-                        "field": "username"
-                    }
-                },
-                "viral_score_sum": {
-                    "sum": {
-                        "field": "viral_score"
-                    }
-                },
-                "reach_score_sum": {
-                    "sum": {
-                        "field": "reach_score"
-                    }
-                },
-                "unique_user_image_url": {
-                    "terms": {
-                        "field": "user_image_url",
-                        "size": 1
-                    }
-                },
-                "engagement_rate_sum": {
-                    "sum": {
-                        "field": "engagement_rate"
-                    }
-                },
-                "unique_user_category": {
-                    "terms": {
-                        "field": "user_category.keyword",
-                        "size": 1
-                    }
-                },
-                "user_influence_score_avg": {
-                    "avg": {
-                        "script": script_score
-                    }
-                },
-                "sentiment_positive": {
-                    "filter": {
-                        "term": {
-                            "sentiment": "positive"
-                        }
-                    }
-                },
-                "sentiment_negative": {
-                    "filter": {
-                        "term": {
-                            "sentiment": "negative"
-                        }
-                    }
-                },
-                "sentiment_neutral": {
-                    "filter": {
-                        "term": {
-                            "sentiment": "neutral"
-                        }
-                    }
-                },
-                "unique_issues": {
-                    "terms": {
-                        "field": "cluster.keyword",
-                        "size": 10
-                    }
-                }
-            }
-        }
-    }
-
-    # Tambahkan aggregation ke base query
-    base_query["aggs"] = aggregation_query
-
     try:
-        import json
-        # print(json.dumps(base_query, indent=2))
         
-        # Execute aggregation query
-        response = es_conn.search(
-            index=",".join(indices),
-            body=base_query
+        # Agregasi per author dibagi dengan most followers dan share of voice
+        # (lihat utils.author_metrics); top N saja kalau KOL_TOP_N > 0
+        filters = dict(
+            keywords=keywords, search_keyword=search_keyword, search_exact_phrases=search_exact_phrases,
+            case_sensitive=case_sensitive, sentiment=sentiment, importance=importance,
+            influence_score_min=influence_score_min, influence_score_max=influence_score_max,
+            region=region, language=language, domain=domain
         )
-        
-        # Process aggregation results
-        buckets = response["aggregations"]["by_username_channel"]["buckets"]
-        
-        if not buckets:
-            return []
-        
-        # Convert aggregation results to DataFrame format
-        kol_data = []
-        for bucket in buckets:
-            username_channel = bucket["key"]
-            username = bucket["username"]["buckets"][0]["key"] if bucket["username"]["buckets"] else "unknown"
-            channel = bucket["channel"]["buckets"][0]["key"] if bucket["channel"]["buckets"] else "unknown"
-            
-            # Extract issues list
-            issues_list = [issue_bucket["key"] for issue_bucket in bucket["unique_issues"]["buckets"]]
-            
-            # Get user_category
-            user_category = ""
-            if bucket["unique_user_category"]["buckets"]:
-                user_category = bucket["unique_user_category"]["buckets"][0]["key"]
-            
-            # Get user_image_url
-            user_image_url = ""
-            if bucket["unique_user_image_url"]["buckets"]:
-                user_image_url = bucket["unique_user_image_url"]["buckets"][0]["key"]
-            
-            if channel == "news":
-                user_image_url = f"https://logo.clearbit.com/{username}"
-                
-
-
-            kol_record = {
-                'username': username,
-                'channel': channel,
-                'link_post': bucket["total_posts"]["value"],
-                'viral_score': bucket["viral_score_sum"]["value"],
-                'reach_score': bucket["reach_score_sum"]["value"],
-                'user_image_url': user_image_url,
-                'user_followers': bucket["followers_count"]["value"],
-                'engagement_rate': bucket["engagement_rate_sum"]["value"],
-                'issue': issues_list,
-                'user_category': user_category,
-                'user_influence_score': bucket["user_influence_score_avg"]["value"],
-                'sentiment_positive': bucket["sentiment_positive"]["doc_count"],
-                'sentiment_negative': bucket["sentiment_negative"]["doc_count"],
-                'sentiment_neutral': bucket["sentiment_neutral"]["doc_count"]
-            }
-            kol_data.append(kol_record)
-        
-        # Convert to DataFrame and clean data
-        final_kol = pd.DataFrame(kol_data)
+        if KOL_TOP_N > 0:
+            base_query = build_elasticsearch_query(start_date=start_date, end_date=end_date, size=0, **filters)
+            final_kol = fetch_kol_frame(es_conn, ",".join(indices), base_query)
+        else:
+            final_kol = get_author_metrics(es_conn, indices, channels, start_date, end_date,
+                                           **filters)[KOL_COLUMNS].copy()
         
         if final_kol.empty:
             return []
 
-        # Clean DataFrame - replace inf/nan values
-        numeric_columns = ['link_post', 'viral_score', 'reach_score', 'user_followers', 
-                          'engagement_rate', 'user_influence_score', 'sentiment_positive', 
-                          'sentiment_negative', 'sentiment_neutral']
-        
-        for col in numeric_columns:
-            if col in final_kol.columns:
-                # Replace inf and -inf with 0
-                final_kol[col] = final_kol[col].replace([np.inf, -np.inf], 0)
-                # Fill NaN with 0
-                final_kol[col] = final_kol[col].fillna(0)
-                # Ensure numeric type
-                final_kol[col] = pd.to_numeric(final_kol[col], errors='coerce').fillna(0)
+        # Logo clearbit untuk akun news
+        is_news = final_kol['channel'] == 'news'
+        final_kol.loc[is_news, 'user_image_url'] = 'https://logo.clearbit.com/' + final_kol.loc[is_news, 'username'].astype(str)
 
-        # Apply business logic transformations
-        final_kol['user_category'] = final_kol.apply(lambda s: 'News Account' if s['channel'] == 'news' else rule_base_user_category(s['username'], s['user_category']), axis=1)
-        final_kol['link_user'] = final_kol.apply(lambda s: create_link_user(s), axis=1)
-        
-        # Apply negative driver flag
-        final_kol = add_negative_driver_flag(final_kol)
-        
-        # Get all unique issues for topic mapping
-        list_issue = [j for i in final_kol['issue'] for j in i]
-
-        # Check issue mapping (same logic as before)
-        MAP = False
-        dict_issue = {}
-        # Apply unified issue mapping
-        final_kol['unified_issue'] = final_kol['issue'].transform(lambda s: list(set([dict_issue.get(i, i) for i in s]))[:5])
-        final_kol['user_category'] = final_kol.apply(lambda s: 'News Account' if s['channel'] == 'news' else s['user_category'], axis=1)
-        # Calculate comprehensive "most_viral" score
-        def calculate_most_viral_score(row):
-            # Safe division function
-            def safe_divide(numerator, denominator, default=0.0):
-                if denominator == 0 or np.isnan(denominator) or np.isinf(denominator):
-                    return default
-                result = numerator / denominator
-                if np.isnan(result) or np.isinf(result):
-                    return default
-                return result
-            
-            # Normalize metrics to 0-1 scale for fair comparison
-            max_followers = final_kol['user_followers'].max() if final_kol['user_followers'].max() > 0 else 1
-            max_influence = final_kol['user_influence_score'].max() if final_kol['user_influence_score'].max() > 0 else 1
-            max_posts = final_kol['link_post'].max() if final_kol['link_post'].max() > 0 else 1
-            max_reach = final_kol['reach_score'].max() if final_kol['reach_score'].max() > 0 else 1
-            max_engagement = final_kol['engagement_rate'].max() if final_kol['engagement_rate'].max() > 0 else 1
-            
-            # Normalized scores (0-1) with safe division
-            followers_score = safe_divide(row['user_followers'], max_followers)
-            influence_score = safe_divide(row['user_influence_score'], max_influence)
-            activity_score = safe_divide(row['link_post'], max_posts)
-            reach_score = safe_divide(row['reach_score'], max_reach)
-            engagement_score = safe_divide(row['engagement_rate'], max_engagement)
-            
-            # Sentiment impact factor
-            total_sentiment = row['sentiment_positive'] + row['sentiment_negative'] + row['sentiment_neutral']
-            if total_sentiment > 0:
-                # Negative sentiment can increase influence (controversial = viral)
-                sentiment_factor = 1 + safe_divide(row['sentiment_negative'], total_sentiment) * 0.3
-                # But positive sentiment is also valuable
-                sentiment_factor += safe_divide(row['sentiment_positive'], total_sentiment) * 0.2
-            else:
-                sentiment_factor = 1
-            
-            # Weighted combination - you can adjust these weights based on your priorities
-            weights = {
-                'influence': 0.35,      # Highest weight - our calculated influence score
-                'followers': 0.25,     # Follower count matters
-                'activity': 0.15,      # Posting frequency
-                'reach': 0.15,         # Total reach achieved
-                'engagement': 0.10     # Engagement rate
-            }
-            
-            composite_score = (
-                influence_score * weights['influence'] +
-                followers_score * weights['followers'] +
-                activity_score * weights['activity'] +
-                reach_score * weights['reach'] +
-                engagement_score * weights['engagement']
-            ) * sentiment_factor
-            
-            # Ensure result is not inf/nan
-            if np.isnan(composite_score) or np.isinf(composite_score):
-                return 0.0
-            
-            return composite_score
-        
-        # Apply the scoring function
-        final_kol['most_viral'] = final_kol.apply(calculate_most_viral_score, axis=1)
-        
-        # Clean most_viral column
-        final_kol['most_viral'] = final_kol['most_viral'].replace([np.inf, -np.inf], 0).fillna(0)
-        
-        # Scale to 0-100 for easier interpretation
-        max_viral = final_kol['most_viral'].max() if final_kol['most_viral'].max() > 0 else 1
-        final_kol['most_viral'] = (final_kol['most_viral'] / max_viral) * 100
-        
-        # Clean scaled most_viral
-        final_kol['most_viral'] = final_kol['most_viral'].replace([np.inf, -np.inf], 0).fillna(0)
-
-        # Calculate share of voice with safe division
-        total_posts = final_kol["link_post"].sum()
-        if total_posts > 0:
-            final_kol["share_of_voice"] = (final_kol["link_post"] / total_posts) * 100
-        else:
-            final_kol["share_of_voice"] = 0
-        
-        # Clean share_of_voice
-        final_kol["share_of_voice"] = final_kol["share_of_voice"].replace([np.inf, -np.inf], 0).fillna(0)
+        # Kategori, link dan skor (vectorized)
+        final_kol = score_kols(final_kol)
         
         # Enhanced sorting strategy for different KOL categories
         
@@ -480,18 +264,7 @@ def search_kol(
         # 2. Most Viral/Influential KOLs (pure influence ranking)
         most_viral_kol = final_kol.sort_values(['most_viral'], ascending=False)[:50]
         
-        # 3. Rising Stars (high engagement rate relative to followers) with safe division
-        final_kol['engagement_per_follower'] = np.where(
-            (final_kol['user_followers'] > 0) & 
-            (np.isfinite(final_kol['user_followers'])) & 
-            (np.isfinite(final_kol['engagement_rate'])),
-            final_kol['engagement_rate'] / final_kol['user_followers'],
-            0
-        )
-        
-        # Clean engagement_per_follower
-        final_kol['engagement_per_follower'] = final_kol['engagement_per_follower'].replace([np.inf, -np.inf], 0).fillna(0)
-        
+        # 3. Rising Stars (high engagement rate relative to followers)
         rising_stars = final_kol[
             final_kol['user_followers'] < final_kol['user_followers'].quantile(0.7)  # Not mega influencers
         ].sort_values(['engagement_per_follower', 'most_viral'], ascending=False)[:30]
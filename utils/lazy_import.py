@@ -0,0 +1,87 @@
+"""
+Lazy Import Utilities
+
+Analytics modules pull in heavy dependencies (pandas, numpy, Vertex AI).
+Importing them only when an endpoint is first called keeps the API's cold
+start short; `warm_up` loads them ahead of traffic from the lifespan hook.
+"""
+
+import importlib
+import threading
+import time
+
+
+class LazyFunction:
+    """
+    Callable proxy that imports `module_name` on first call
+
+    Parameters:
+    -----------
+    module_name : str
+        Dotted module path, e.g. 'utils.kol_overview'
+    function_name : str
+        Attribute of the module to call
+    """
+
+    def __init__(self, module_name, function_name):
+        self.module_name = module_name
+        self.function_name = function_name
+        self.__name__ = function_name
+        self._target = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Import the module (once) and return the target function"""
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    module = importlib.import_module(self.module_name)
+                    self._target = getattr(module, self.function_name)
+        return self._target
+
+    @property
+    def loaded(self):
+        return self._target is not None
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<LazyFunction {self.module_name}.{self.function_name} ({state})>"
+
+
+def lazy_function(module_name, function_name):
+    return LazyFunction(module_name, function_name)
+
+
+def warm_up(functions, extra=()):
+    """
+    Load lazy functions (and run extra initializers) ahead of traffic
+
+    Failures are printed and skipped so one broken dependency (e.g. missing
+    Gemini credentials) does not block the others.
+
+    Parameters:
+    -----------
+    functions : iterable of LazyFunction
+        Proxies to load
+    extra : iterable of (name, callable)
+        Additional initializers, e.g. Redis connection or Gemini model
+
+    Returns:
+    --------
+    dict
+        Seconds spent per item, or the error message when it failed
+    """
+    timings = {}
+    items = [(f"{f.module_name}.{f.function_name}", f.load) for f in functions] + list(extra)
+    for name, initializer in items:
+        start = time.perf_counter()
+        try:
+            initializer()
+            timings[name] = round(time.perf_counter() - start, 3)
+        except Exception as e:
+            print(f"Warm-up of {name} failed: {e}")
+            timings[name] = f"error: {e}"
+    return timings
@@ -1,7 +1,6 @@
 import argparse
 import json
 import re
-import pandas as pd
 from datetime import datetime
 from typing import Dict, List, Literal, Optional, Union
 
@@ -13,8 +12,10 @@ from utils.es_query_builder import (
     get_date_range
 )
 from utils.redis_client import redis_client
+from utils.metrics import instrument
 from utils.script_score import script_score
 
+@instrument()
 def get_mentions(
     es_host=None,
     es_username=None,
@@ -0,0 +1,155 @@
+"""
+LLM Response Cache
+
+Content-addressed cache for Gemini responses. The key is a SHA-256 of the
+model name, the generation config and the normalized prompt, so the same
+prompt built by any caller (topics sentiment summaries, Moskal AI strategy
+and query generation, ...) is answered from Redis instead of calling Gemini
+again. Entries live much longer than the analytics result caches because
+the answer for an identical prompt does not change.
+
+An optional semantic hook can map near-identical prompts to an existing
+entry (e.g. with an embedding index); by default only exact (normalized)
+prompts match.
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+
+from utils.metrics import record_cache_lookup, record_llm_cache_hit
+from utils.redis_client import redis_client
+
+LLM_CACHE_PREFIX = "llm_cache"
+# Ubah versi ini kalau format prompt/entry berubah supaya entry lama tidak terpakai
+LLM_CACHE_VERSION = 1
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() not in ("0", "false", "no", "off")
+# Default 7 hari
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+
+_TRAILING_SPACES = re.compile(r"[ \t]+\n")
+_BLANK_LINES = re.compile(r"\n{3,}")
+_INLINE_SPACES = re.compile(r"[ \t]{2,}")
+
+# Hook semantic dedup: lookup(normalized_prompt, model) -> cache key atau None,
+# store(normalized_prompt, model, key) dipanggil setelah entry baru disimpan
+_semantic_lookup = None
+_semantic_store = None
+
+
+def normalize_prompt(prompt):
+    """
+    Normalize a prompt for hashing
+
+    Unicode NFC, unified line endings, no trailing spaces, runs of spaces
+    and blank lines collapsed. Only whitespace is touched, so prompts that
+    differ in content never share a key.
+    """
+    text = unicodedata.normalize("NFC", str(prompt)).replace("\r\n", "\n").replace("\r", "\n")
+    text = _TRAILING_SPACES.sub("\n", text)
+    text = _INLINE_SPACES.sub(" ", text)
+    text = _BLANK_LINES.sub("\n\n", text)
+    return text.strip()
+
+
+def cache_key(prompt, model, generation_config):
+    """Redis key for a (model, generation config, prompt) combination"""
+    payload = json.dumps({
+        "v": LLM_CACHE_VERSION,
+        "model": model,
+        "config": generation_config,
+        "prompt": normalize_prompt(prompt)
+    }, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{LLM_CACHE_PREFIX}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+def set_semantic_hooks(lookup=None, store=None):
+    """
+    Register semantic-dedup callbacks (pass None to remove them)
+
+    Parameters:
+    -----------
+    lookup : callable, optional
+        lookup(normalized_prompt, model) -> existing cache key or None,
+        consulted when the exact key misses
+    store : callable, optional
+        store(normalized_prompt, model, key), called after a new entry is cached
+    """
+    global _semantic_lookup, _semantic_store
+    _semantic_lookup = lookup
+    _semantic_store = store
+
+
+def get_cached_response(prompt, model, generation_config, function="call_gemini"):
+    """
+    Cached text for the prompt, or None
+
+    Parameters:
+    -----------
+    prompt : str
+        Prompt as sent to Gemini
+    model : str
+        Model name
+    generation_config : dict
+        Generation parameters (temperature, top_p, ...)
+    function : str
+        Calling Gemini function, used as metric label
+
+    Returns:
+    --------
+    str or None
+    """
+    if not LLM_CACHE_ENABLED:
+        return None
+
+    key = cache_key(prompt, model, generation_config)
+    entry = redis_client.get(key)
+
+    if entry is None and _semantic_lookup is not None:
+        try:
+            similar_key = _semantic_lookup(normalize_prompt(prompt), model)
+        except Exception as e:
+            print(f"LLM cache semantic lookup failed: {e}")
+            similar_key = None
+        if similar_key:
+            entry = redis_client.get(similar_key)
+            record_cache_lookup(f"{LLM_CACHE_PREFIX}_semantic:", "hit" if entry else "miss")
+
+    if not isinstance(entry, dict) or not entry.get("text"):
+        return None
+
+    record_llm_cache_hit(function, entry.get("prompt_tokens", 0), entry.get("completion_tokens", 0))
+    return entry["text"]
+
+
+def store_response(prompt, model, generation_config, text, usage=None):
+    """
+    Cache a Gemini response (empty responses are not cached)
+
+    Parameters:
+    -----------
+    text : str
+        Generated text as returned to the caller
+    usage : object, optional
+        Gemini usage_metadata, kept so hits can report the tokens saved
+    """
+    if not LLM_CACHE_ENABLED or not text:
+        return
+
+    key = cache_key(prompt, model, generation_config)
+    redis_client.set_with_ttl(key, {
+        "text": text,
+        "model": model,
+        "prompt_tokens": getattr(usage, "prompt_token_count", 0) or 0,
+        "completion_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+        "created": int(time.time())
+    }, ttl_seconds=LLM_CACHE_TTL)
+
+    if _semantic_store is not None:
+        try:
+            _semantic_store(normalize_prompt(prompt), model, key)
+        except Exception as e:
+            print(f"LLM cache semantic store failed: {e}")
@@ -0,0 +1,448 @@
+"""
+Mentions Rollup
+
+Per-day mention totals in the `mentions_daily` index, so the dashboard
+time series (keyword trends, summary stats) aggregate a few documents
+per day instead of every post of a 30-365 day range.
+
+One document per (keyword set, channel, day) holds the post count,
+link count, reach / likes / comments / shares sums, sentiment counts,
+the presence score sum and the video mention count. A keyword set is the
+normalized `keywords` of a request (with its exact-phrase and case
+flags); the set "all" (no keywords) is always materialized.
+
+Keyword sets are registered in the rollup state index, either from the
+CLI or automatically the first time a request asks for them. Each set
+has its own checkpoint (see utils.rollup), so a new set is backfilled by
+the next run of the incremental job. The registry holds at most
+MENTIONS_ROLLUP_MAX_SETS sets; automatically registered sets only get a
+MENTIONS_AUTO_BACKFILL_DAYS backfill and are dropped (registry,
+checkpoint and rollup documents) after MENTIONS_SET_IDLE_DAYS days
+without a request served from them:
+
+    python -m utils.mentions_rollup                                # cron, e.g. every 15 minutes
+    python -m utils.mentions_rollup --add-keywords "prabowo,gibran" --days 365
+    python -m utils.mentions_rollup --days 90                      # backfill window of CLI sets
+
+The router (mentions_rollup_set) only serves a request from the rollup
+when it filters on nothing but the date range, channels and a keyword
+set whose rollup covers the range; everything else keeps the raw
+indices.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from utils.es_query_builder import build_elasticsearch_query, get_indices_from_channels
+from utils.rollup import (
+    ROLLUP_BACKFILL_DAYS, ROLLUP_ENABLED, ROLLUP_STATE_INDEX, SENTIMENTS, day_string, get_checkpoint,
+    only_date_and_channel_filters, rollup_covers, run_incremental
+)
+from utils.script_score import script_score
+
+MENTIONS_ROLLUP_NAME = "mentions_daily"
+MENTIONS_DAILY_INDEX = os.getenv("MENTIONS_DAILY_INDEX", "mentions_daily")
+MENTIONS_ROLLUP_ENABLED = ROLLUP_ENABLED and \
+    os.getenv("MENTIONS_ROLLUP_ENABLED", "true").lower() not in ("0", "false", "no", "off")
+# Batas jumlah keyword set yang dimaterialisasi
+MENTIONS_ROLLUP_MAX_SETS = int(os.getenv("MENTIONS_ROLLUP_MAX_SETS", "500"))
+# Backfill keyword set yang didaftarkan otomatis oleh request (cukup untuk
+# "last 30 days" beserta periode sebelumnya)
+MENTIONS_AUTO_BACKFILL_DAYS = int(os.getenv("MENTIONS_AUTO_BACKFILL_DAYS", "62"))
+# Keyword set otomatis yang tidak dipakai selama ini dihapus
+MENTIONS_SET_IDLE_DAYS = int(os.getenv("MENTIONS_SET_IDLE_DAYS", "30"))
+
+ALL_POSTS_SET = "all"
+_SET_PREFIX = "mentions_daily_set:"
+
+# Sama dengan total_shares di summary_stats
+SHARES_SCRIPT = {
+    "source": """
+        long shares = 0;
+        if (doc.containsKey('shares') && !doc['shares'].empty) {
+            shares += doc['shares'].value;
+        }
+        if (doc.containsKey('retweets') && !doc['retweets'].empty) {
+            shares += doc['retweets'].value;
+        }
+        if (doc.containsKey('reposts') && !doc['reposts'].empty) {
+            shares += doc['reposts'].value;
+        }
+        return shares;
+    """
+}
+
+# Presence score per post seperti di presence_score (skor 0-100)
+PRESENCE_SCRIPT = {
+    **script_score,
+    "source": script_score["source"].replace("return Math.min(score, 10.0);", "return Math.min(score, 10.0)*10;")
+}
+
+METRIC_FIELDS = ("mentions", "link_count", "reach_sum", "likes_sum", "comments_sum", "shares_sum",
+                 "presence_sum", "video_mentions", *(f"sentiment_{sentiment}" for sentiment in SENTIMENTS))
+
+MENTIONS_DAILY_MAPPINGS = {
+    "dynamic": "strict",
+    "properties": {
+        "set_id": {"type": "keyword"},
+        "day": {"type": "date", "format": "yyyy-MM-dd"},
+        "channel": {"type": "keyword"},
+        "mentions": {"type": "long"},
+        # Post dengan link_post (value_count yang dipakai summary stats)
+        "link_count": {"type": "long"},
+        "reach_sum": {"type": "double"},
+        "likes_sum": {"type": "double"},
+        "comments_sum": {"type": "double"},
+        "shares_sum": {"type": "double"},
+        "presence_sum": {"type": "double"},
+        # Post dengan link_post yang mengandung "/" (video mentions summary stats)
+        "video_mentions": {"type": "long"},
+        "sentiment_positive": {"type": "long"},
+        "sentiment_negative": {"type": "long"},
+        "sentiment_neutral": {"type": "long"}
+    }
+}
+
+# Register / touch terakhir per keyword set di worker ini (detik), supaya
+# request berikutnya tidak menulis ke registry lagi
+_SET_WRITE_INTERVAL = 3600
+_recent_writes = {}
+# (waktu, jumlah) keyword set terdaftar, dibaca ulang tiap 60 detik
+_registry_size = (0, 0)
+
+
+def keyword_set(keywords=None, search_exact_phrases=False, case_sensitive=False):
+    """
+    Normalized keyword set of a request
+
+    Keyword order and duplicates do not change the query (the keywords are
+    OR-ed), and without case_sensitive neither does letter case.
+
+    Returns:
+    --------
+    tuple
+        (set_id, spec dict)
+    """
+    if not keywords:
+        return ALL_POSTS_SET, {"keywords": [], "search_exact_phrases": False, "case_sensitive": False}
+    keyword_list = keywords if isinstance(keywords, list) else [keywords]
+    if not case_sensitive:
+        keyword_list = [keyword.lower() for keyword in keyword_list]
+    spec = {
+        "keywords": sorted(set(keyword.strip() for keyword in keyword_list if keyword.strip())),
+        "search_exact_phrases": bool(search_exact_phrases),
+        "case_sensitive": bool(case_sensitive)
+    }
+    if not spec["keywords"]:
+        return keyword_set()
+    digest = hashlib.sha1(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return digest, spec
+
+
+def _recently_written(set_id):
+    now = time.time()
+    for key, written_at in list(_recent_writes.items()):
+        if now - written_at > _SET_WRITE_INTERVAL:
+            del _recent_writes[key]
+    return set_id in _recent_writes
+
+
+def registry_size(es):
+    """Number of registered keyword sets (without "all"), cached for 60 seconds"""
+    global _registry_size
+    if time.time() - _registry_size[0] > 60:
+        try:
+            count = es.count(index=ROLLUP_STATE_INDEX, query={"prefix": {"_id": _SET_PREFIX}})["count"]
+        except Exception:
+            count = 0
+        _registry_size = (time.time(), count)
+    return _registry_size[1]
+
+
+def register_keyword_set(es, set_id, spec, backfill_days=MENTIONS_AUTO_BACKFILL_DAYS, auto=True):
+    """
+    Add a keyword set to the registry (materialized by the next job run)
+
+    Parameters:
+    -----------
+    backfill_days : int
+        Days aggregated by the first run of this set
+    auto : bool
+        Registered by a request (pruned when idle) instead of the CLI
+
+    Returns:
+    --------
+    bool
+        False when the registry already holds MENTIONS_ROLLUP_MAX_SETS sets
+    """
+    if set_id == ALL_POSTS_SET or _recently_written(set_id):
+        return True
+    # Beberapa worker bisa sedikit melewati batas; registered_keyword_sets tetap membatasi
+    if registry_size(es) >= MENTIONS_ROLLUP_MAX_SETS:
+        print(f"Mentions rollup: registry full ({MENTIONS_ROLLUP_MAX_SETS} sets), {set_id} not registered")
+        return False
+    now = time.time()
+    try:
+        es.index(index=ROLLUP_STATE_INDEX, id=_SET_PREFIX + set_id, op_type="create", document={
+            **spec, "set_id": set_id, "auto": auto, "backfill_days": backfill_days,
+            "registered_at": now, "last_used_at": now
+        })
+    except Exception:
+        # Sudah terdaftar (conflict) atau state index tidak tersedia
+        pass
+    _recent_writes[set_id] = now
+    return True
+
+
+def touch_keyword_set(es, set_id):
+    """Record that a request was served from a keyword set (at most once per hour per worker)"""
+    if set_id == ALL_POSTS_SET or _recently_written(set_id):
+        return
+    try:
+        es.update(index=ROLLUP_STATE_INDEX, id=_SET_PREFIX + set_id, doc={"last_used_at": time.time()})
+    except Exception as e:
+        print(f"Mentions rollup: could not touch {set_id} ({e})")
+    _recent_writes[set_id] = time.time()
+
+
+def remove_keyword_set(es, set_id):
+    """Drop a keyword set: registry entry, checkpoint and its mentions_daily documents"""
+    for doc_id in (_SET_PREFIX + set_id, _checkpoint_name(set_id)):
+        try:
+            es.delete(index=ROLLUP_STATE_INDEX, id=doc_id)
+        except Exception:
+            pass
+    try:
+        es.delete_by_query(index=MENTIONS_DAILY_INDEX, query={"term": {"set_id": set_id}}, conflicts="proceed")
+    except Exception as e:
+        print(f"Mentions rollup: could not delete documents of {set_id} ({e})")
+
+
+def registered_keyword_sets(es):
+    """
+    Every registered keyword set as {set_id: entry}, including "all"
+
+    An entry is the keyword spec plus auto, backfill_days and
+    last_used_at ("all" is never pruned).
+    """
+    sets = {ALL_POSTS_SET: keyword_set()[1]}
+    try:
+        response = es.search(index=ROLLUP_STATE_INDEX, body={
+            "size": MENTIONS_ROLLUP_MAX_SETS,
+            "query": {"prefix": {"_id": _SET_PREFIX}},
+            "sort": [{"registered_at": "asc"}]
+        })
+    except Exception as e:
+        print(f"Mentions rollup: no keyword set registry ({e})")
+        return sets
+    for hit in response["hits"]["hits"]:
+        source = hit["_source"]
+        sets[source["set_id"]] = {key: value for key, value in source.items() if key != "set_id"}
+    return sets
+
+
+def _checkpoint_name(set_id):
+    return f"{MENTIONS_ROLLUP_NAME}:{set_id}"
+
+
+def _day_aggs():
+    aggs = {
+        "link_count": {"value_count": {"field": "link_post"}},
+        "reach_sum": {"sum": {"field": "reach_score"}},
+        "likes_sum": {"sum": {"field": "likes"}},
+        "comments_sum": {"sum": {"field": "comments"}},
+        "shares_sum": {"sum": {"script": SHARES_SCRIPT}},
+        "presence_sum": {"sum": {"script": PRESENCE_SCRIPT}},
+        "video_mentions": {"filter": {"wildcard": {"link_post": "*/*"}}},
+        "sentiments": {"terms": {"field": "sentiment", "size": 10}}
+    }
+    return aggs
+
+
+def build_mentions_day(es, day, set_id, spec):
+    """
+    Rollup documents of one keyword set and day, one per channel
+
+    Returns:
+    --------
+    list of dict
+        Documents with "_id"
+    """
+    next_day = (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    query = build_elasticsearch_query(
+        keywords=spec["keywords"] or None,
+        search_exact_phrases=spec["search_exact_phrases"],
+        case_sensitive=spec["case_sensitive"],
+        start_date=day,
+        end_date=day
+    )["query"]
+    # Hari penuh [day, next_day) untuk field date dengan jam
+    query["bool"]["must"][0] = {"range": {"post_created_at": {"gte": day, "lt": next_day}}}
+
+    response = es.search(index=",".join(get_indices_from_channels()), body={
+        "size": 0,
+        "track_total_hits": False,
+        "query": query,
+        "aggs": {"channels": {"terms": {"field": "channel", "size": 50}, "aggs": _day_aggs()}}
+    })
+
+    documents = []
+    for bucket in response["aggregations"]["channels"]["buckets"]:
+        sentiments = {}
+        for item in bucket["sentiments"]["buckets"]:
+            key = str(item["key"]).lower()
+            sentiments[key] = sentiments.get(key, 0) + item["doc_count"]
+        document = {
+            "_id": f"{set_id}|{day}|{bucket['key']}",
+            "set_id": set_id,
+            "day": day,
+            "channel": bucket["key"],
+            "mentions": bucket["doc_count"],
+            "video_mentions": bucket["video_mentions"]["doc_count"]
+        }
+        for name in ("link_count", "reach_sum", "likes_sum", "comments_sum", "shares_sum", "presence_sum"):
+            document[name] = bucket[name]["value"] or 0
+        for sentiment in SENTIMENTS:
+            document[f"sentiment_{sentiment}"] = sentiments.get(sentiment, 0)
+        documents.append(document)
+    return documents
+
+
+def run_mentions_rollup(es, today=None, backfill_days=ROLLUP_BACKFILL_DAYS):
+    """
+    Incremental mentions_daily update of every registered keyword set
+
+    Idle automatically registered sets are removed first. backfill_days
+    applies to sets registered without their own backfill window.
+
+    Returns:
+    --------
+    dict
+        {set_id: checkpoint}
+    """
+    checkpoints = {}
+    idle_before = time.time() - MENTIONS_SET_IDLE_DAYS * 86400
+    for set_id, spec in registered_keyword_sets(es).items():
+        if spec.get("auto") and spec.get("last_used_at", 0) < idle_before:
+            print(f"Mentions rollup: removing idle keyword set {set_id} {spec['keywords']}")
+            remove_keyword_set(es, set_id)
+            continue
+
+        def build_day(es, day, set_id=set_id, spec=spec):
+            return build_mentions_day(es, day, set_id, spec)
+
+        checkpoints[set_id] = run_incremental(es, _checkpoint_name(set_id), MENTIONS_DAILY_INDEX,
+                                              MENTIONS_DAILY_MAPPINGS, build_day, today=today,
+                                              backfill_days=spec.get("backfill_days") or backfill_days)
+    return checkpoints
+
+
+def mentions_rollup_set(es, start_date, end_date, keywords=None, search_keyword=None, search_exact_phrases=False,
+                        case_sensitive=False, **filters):
+    """
+    Query router: the keyword set that can answer a request from
+    mentions_daily, or None for the raw indices
+
+    A keyword set that is not materialized yet is registered (while the
+    registry has room) so the next rollup run backfills it; a set that
+    serves the request is marked as used.
+
+    Parameters:
+    -----------
+    start_date, end_date : str
+        Requested date range (include the previous period when a
+        comparison is needed)
+    keywords, search_exact_phrases, case_sensitive
+        Keyword filter of the request
+    **filters
+        The other request filters (search_keyword must be empty)
+    """
+    if not MENTIONS_ROLLUP_ENABLED or search_keyword or not only_date_and_channel_filters(**filters):
+        return None
+    set_id, spec = keyword_set(keywords, search_exact_phrases, case_sensitive)
+    checkpoint = get_checkpoint(es, _checkpoint_name(set_id))
+    if checkpoint is None:
+        register_keyword_set(es, set_id, spec)
+        return None
+    if not rollup_covers(checkpoint, start_date, end_date):
+        return None
+    touch_keyword_set(es, set_id)
+    return set_id
+
+
+def daily_totals(es, set_id, channels, start_date, end_date):
+    """
+    Metrics per day and in total from mentions_daily
+
+    Parameters:
+    -----------
+    set_id : str
+        Keyword set (from mentions_rollup_set)
+    channels : list of str
+        Channels to sum
+
+    Returns:
+    --------
+    dict
+        {"days": [{"date": "YYYY-MM-DD", <METRIC_FIELDS>...}, ...],
+         "totals": {<METRIC_FIELDS>...}}; days between the first and the
+        last day with data are included with zeros, like a date_histogram
+        on the raw posts
+    """
+    sums = {name: {"sum": {"field": name}} for name in METRIC_FIELDS}
+    response = es.search(index=MENTIONS_DAILY_INDEX, body={
+        "size": 0,
+        "track_total_hits": False,
+        "query": {
+            "bool": {
+                "filter": [
+                    {"term": {"set_id": set_id}},
+                    {"terms": {"channel": list(channels)}},
+                    {"range": {"day": {"gte": day_string(start_date), "lte": day_string(end_date)}}}
+                ]
+            }
+        },
+        "aggs": {
+            "days": {
+                "date_histogram": {"field": "day", "calendar_interval": "day", "format": "yyyy-MM-dd"},
+                "aggs": sums
+            },
+            **sums
+        }
+    })
+    aggregations = response["aggregations"]
+    days = []
+    for bucket in aggregations["days"]["buckets"]:
+        day = {"date": bucket["key_as_string"]}
+        day.update({name: bucket[name]["value"] or 0 for name in METRIC_FIELDS})
+        days.append(day)
+    totals = {name: aggregations[name]["value"] or 0 for name in METRIC_FIELDS}
+    return {"days": days, "totals": totals}
+
+
+if __name__ == "__main__":
+    from utils.es_client import get_elasticsearch_client
+
+    parser = argparse.ArgumentParser(description="Incremental mentions_daily rollup")
+    parser.add_argument("--days", type=int, default=ROLLUP_BACKFILL_DAYS,
+                        help="Backfill window of new CLI keyword sets (and of a set registered with --add-keywords)")
+    parser.add_argument("--add-keywords", help="Register a comma-separated keyword set and exit")
+    parser.add_argument("--exact", action="store_true", help="Keyword set uses exact phrases")
+    parser.add_argument("--case-sensitive", action="store_true", help="Keyword set is case sensitive")
+    args = parser.parse_args()
+
+    es = get_elasticsearch_client()
+    if not es:
+        raise SystemExit("Elasticsearch is not reachable")
+    if args.add_keywords:
+        set_id, spec = keyword_set(args.add_keywords.split(","), args.exact, args.case_sensitive)
+        if not register_keyword_set(es, set_id, spec, backfill_days=args.days, auto=False):
+            raise SystemExit(f"Keyword set registry is full (MENTIONS_ROLLUP_MAX_SETS={MENTIONS_ROLLUP_MAX_SETS})")
+        print(f"Registered keyword set {set_id}: {spec['keywords']}")
+    else:
+        for set_id, checkpoint in run_mentions_rollup(es, backfill_days=args.days).items():
+            print(f"mentions_daily {set_id} up to {checkpoint['last_day']} (from {checkpoint['first_day']})")
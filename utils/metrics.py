@@ -0,0 +1,396 @@
+"""
+Metrics Utilities
+
+This module provides an in-process metrics registry (counters, gauges and
+histograms) rendered in the Prometheus text exposition format, plus the
+helpers used to instrument requests, Elasticsearch queries, the Redis
+cache and Gemini calls. No external collector is required: the registry
+lives in the worker process and is exposed at /metrics.
+"""
+
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+
+from utils.profiling import current_profile, span
+
+# Nama operasi (fungsi utils) yang sedang berjalan, dipakai sebagai label query ES
+_current_operation = contextvars.ContextVar("current_operation", default=None)
+# Argumen fungsi utils yang sedang berjalan (untuk fingerprint slow query)
+_current_params = contextvars.ContextVar("current_params", default=None)
+# Scope ASGI request yang sedang dilayani (route diisi router setelah matching)
+_current_scope = contextvars.ContextVar("current_scope", default=None)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base class for labelled metrics"""
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}"
+        ]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+    metric_type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+    metric_type = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed buckets"""
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def _render_sample(self, key, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state["counts"]):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+        lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Render all metrics in the Prometheus text format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# HTTP
+http_request_duration = registry.histogram(
+    "moskal_http_request_duration_seconds", "HTTP request latency per route",
+    ("route", "method", "status"))
+http_response_size = registry.histogram(
+    "moskal_http_response_size_bytes", "HTTP response body size per route",
+    ("route",), buckets=SIZE_BUCKETS)
+http_requests_in_flight = registry.gauge(
+    "moskal_http_requests_in_flight", "HTTP requests currently being served")
+
+# Fungsi utils
+function_duration = registry.histogram(
+    "moskal_function_duration_seconds", "Wall time of instrumented utils functions",
+    ("function", "status"))
+
+# Elasticsearch
+es_query_duration = registry.histogram(
+    "moskal_es_query_duration_seconds", "Elasticsearch wall time per query name (client side)",
+    ("query", "method"))
+es_query_took = registry.histogram(
+    "moskal_es_query_took_seconds", "Elasticsearch reported 'took' per query name",
+    ("query", "method"))
+es_query_errors = registry.counter(
+    "moskal_es_query_errors_total", "Failed Elasticsearch calls per query name", ("query", "method"))
+es_response_size = registry.histogram(
+    "moskal_es_response_size_bytes", "Elasticsearch response size per query name",
+    ("query", "method"), buckets=SIZE_BUCKETS)
+
+# Cache
+cache_requests = registry.counter(
+    "moskal_cache_requests_total", "Cache lookups per cache prefix and result (hit/miss/unavailable)",
+    ("prefix", "result"))
+
+# Gemini
+gemini_request_duration = registry.histogram(
+    "moskal_gemini_request_duration_seconds", "Gemini call latency", ("function", "status"))
+gemini_tokens = registry.counter(
+    "moskal_gemini_tokens_total", "Gemini token usage", ("function", "type"))
+llm_cache_tokens_saved = registry.counter(
+    "moskal_llm_cache_tokens_saved_total", "Gemini tokens not spent thanks to LLM cache hits",
+    ("function", "type"))
+
+
+def current_operation():
+    """Name of the instrumented utils function currently running (or None)"""
+    return _current_operation.get()
+
+
+def current_params():
+    """Keyword arguments of the instrumented utils function currently running (or None)"""
+    return _current_params.get()
+
+
+def current_route():
+    """Route template of the request currently being served (or None outside a request)"""
+    scope = _current_scope.get()
+    if scope is None:
+        return None
+    return route_label(scope)
+
+
+def instrument(name=None):
+    """
+    Decorator that records the wall time of a utils function (and a
+    profile span when the request runs with `debug=profile`)
+
+    The function name is also published as the current operation so the
+    Elasticsearch queries it issues are labelled with it.
+
+    Parameters:
+    -----------
+    name : str, optional
+        Metric label, defaults to the function name
+    """
+    def decorator(func):
+        label = name or func.__name__
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                token = _current_operation.set(label)
+                params_token = _current_params.set(kwargs)
+                start = time.perf_counter()
+                status = "ok"
+                try:
+                    with span(label):
+                        return await func(*args, **kwargs)
+                except BaseException:
+                    status = "error"
+                    raise
+                finally:
+                    function_duration.observe(time.perf_counter() - start, function=label, status=status)
+                    _current_params.reset(params_token)
+                    _current_operation.reset(token)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            token = _current_operation.set(label)
+            params_token = _current_params.set(kwargs)
+            start = time.perf_counter()
+            status = "ok"
+            try:
+                with span(label):
+                    return func(*args, **kwargs)
+            except BaseException:
+                status = "error"
+                raise
+            finally:
+                function_duration.observe(time.perf_counter() - start, function=label, status=status)
+                _current_params.reset(params_token)
+                _current_operation.reset(token)
+        return wrapper
+
+    return decorator
+
+
+def record_es_call(method, wall_seconds, response=None, error=False):
+    """Record one Elasticsearch call made by the instrumented client"""
+    query = current_operation() or "unknown"
+    es_query_duration.observe(wall_seconds, query=query, method=method)
+    if error:
+        es_query_errors.inc(query=query, method=method)
+        return
+
+    body = getattr(response, "body", response)
+    if isinstance(body, dict) and body.get("took") is not None:
+        es_query_took.observe(body["took"] / 1000.0, query=query, method=method)
+
+    meta = getattr(response, "meta", None)
+    headers = getattr(meta, "headers", None)
+    if headers is not None:
+        content_length = headers.get("content-length")
+        if content_length and str(content_length).isdigit():
+            es_response_size.observe(int(content_length), query=query, method=method)
+
+
+def record_cache_lookup(key, result):
+    """Record a cache lookup; result is 'hit', 'miss' or 'unavailable'"""
+    prefix = key.split(":", 1)[0] if key else "unknown"
+    cache_requests.inc(prefix=prefix, result=result)
+
+
+def record_gemini_call(function, wall_seconds, usage=None, error=False):
+    """Record a Gemini call and, when available, its token usage metadata"""
+    gemini_request_duration.observe(wall_seconds, function=function, status="error" if error else "ok")
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    completion_tokens = getattr(usage, "candidates_token_count", 0) or 0
+
+    profile = current_profile()
+    if profile is not None:
+        end = time.perf_counter()
+        profile.add_span(
+            "gemini", end - wall_seconds, end, function=function, error=error,
+            prompt_tokens=prompt_tokens, completion_tokens=completion_tokens
+        )
+    if prompt_tokens:
+        gemini_tokens.inc(prompt_tokens, function=function, type="prompt")
+    if completion_tokens:
+        gemini_tokens.inc(completion_tokens, function=function, type="completion")
+
+
+def record_llm_cache_hit(function, prompt_tokens=0, completion_tokens=0):
+    """Record the tokens a cached Gemini response saved (hit/miss counts come from the cache lookup)"""
+    if prompt_tokens:
+        llm_cache_tokens_saved.inc(prompt_tokens, function=function, type="prompt")
+    if completion_tokens:
+        llm_cache_tokens_saved.inc(completion_tokens, function=function, type="completion")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency, response size and in-flight requests per route
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        state = {"status": 500, "bytes": 0}
+        http_requests_in_flight.inc()
+        scope_token = _current_scope.set(scope)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                state["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            _current_scope.reset(scope_token)
+            route = route_label(scope)
+            http_request_duration.observe(
+                time.perf_counter() - start,
+                route=route, method=scope.get("method", ""), status=state["status"]
+            )
+            http_response_size.observe(state["bytes"], route=route)
+
+
+def route_label(scope):
+    """Route template for a request scope, or '<unmatched>' for unknown paths"""
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    if scope.get("endpoint") is not None:
+        return scope.get("path", "")
+    return "<unmatched>"
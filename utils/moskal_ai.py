@@ -1,9 +1,13 @@
-from utils.gemini import call_gemini
+from utils.gemini import call_gemini_async, call_gemini_stream
+from utils.prompt_context import build_post_context, compact_aggregations
+from utils.query_plan_cache import get_plan, store_plan, plan_cache_stats
+from utils.query_guard import MAX_SIZE, guard_query
 import os
 import re
 import json
 from typing import Dict, List, Any, Optional, AsyncGenerator
 import asyncio
+import functools
 from enum import Enum
 
 false = False
@@ -65,18 +69,30 @@ mcp_config = {
   }
 }
 
-# MCP Elasticsearch Client (unchanged)
+# MCP Elasticsearch Client
 class MCPElasticsearchClient:
-    """MCP Elasticsearch Client untuk berinteraksi dengan ES melalui MCP"""
-    def __init__(self, mcp_server_config: Dict = None):
+    """
+    MCP Elasticsearch Client untuk berinteraksi dengan ES melalui MCP
+
+    Requests go through the shared pooled async client
+    (utils.es_client.get_async_elasticsearch_client), each bounded by
+    `timeout` seconds, and only the parts of the response that
+    process_elasticsearch_results reads are transferred (filter_path).
+    """
+
+    # Bagian response yang dipakai process_elasticsearch_results
+    FILTER_PATH = ["took", "timed_out", "hits.total", "hits.hits._id", "hits.hits._source", "aggregations"]
+
+    def __init__(self, mcp_server_config: Dict = None, timeout: float = None):
         self.mcp_config = mcp_server_config or {
             "server": "elasticsearch",
             "url": os.getenv("ELASTICSEARCH_URL", "http://localhost:9200"),
             "username": os.getenv("ELASTICSEARCH_USERNAME"),
             "password": os.getenv("ELASTICSEARCH_PASSWORD")
         }
+        self.timeout = timeout if timeout is not None else float(os.getenv("MOSKAL_ES_TIMEOUT", "15"))
     
-    async def search(self, index: str, body: Dict, size: int = 1000) -> Dict:
+    async def search(self, index: str, body: Dict, size: int = MAX_SIZE) -> Dict:
         try:
             query_body = body.copy()
             if "size" not in query_body:
@@ -110,20 +126,57 @@ class MCPElasticsearchClient:
         except Exception as e:
             print(f"Error executing MCP ES aggregation: {e}")
             return {"error": str(e), "aggregations": {}}
+
+    async def search_and_aggregate(self, index: str, body: Dict, size: int = MAX_SIZE) -> Dict:
+        """
+        Run the hits part and the aggregation part of a query concurrently
+
+        The aggregation request (size 0) is cacheable by the shard request
+        cache and the hits request no longer carries the aggregations.
+        Results are merged into one response.
+        """
+        aggs = body.get("aggs") or body.get("aggregations")
+        if not aggs:
+            return await self.search(index, body, size)
+
+        hits_body = {k: v for k, v in body.items() if k not in ("aggs", "aggregations")}
+        agg_body = {k: v for k, v in body.items() if k not in ("size", "from", "sort", "_source", "terminate_after")}
+        # Total hits sudah dihitung oleh request hits
+        agg_body["track_total_hits"] = False
+        search_result, agg_result = await asyncio.gather(
+            self.search(index, hits_body, size),
+            self.aggregate(index, agg_body)
+        )
+
+        if "error" in search_result and "error" in agg_result:
+            return search_result
+        merged = dict(search_result)
+        merged.pop("error", None)
+        merged["aggregations"] = agg_result.get("aggregations", {})
+        return merged
     
     async def _execute_mcp_search(self, query: Dict) -> Dict:
         try:
             # TODO: Implementasi actual MCP call
-            # Untuk sekarang, gunakan fallback ke ES langsung
-            from utils.es_client import get_elasticsearch_client
-            es = get_elasticsearch_client()
-            
-            result = es.search(
-                index=query["index"], 
-                body=query["body"]
+            # Untuk sekarang, gunakan client ES async langsung
+            from utils.es_client import get_async_elasticsearch_client
+            es = get_async_elasticsearch_client()
+            if es is None:
+                raise ConnectionError("Elasticsearch client is not available")
+
+            response = await asyncio.wait_for(
+                es.options(request_timeout=self.timeout).search(
+                    index=query["index"],
+                    body=query["body"],
+                    filter_path=self.FILTER_PATH
+                ),
+                timeout=self.timeout + 1
             )
-            return result
+            return dict(getattr(response, "body", response))
             
+        except asyncio.TimeoutError:
+            print(f"MCP search timed out after {self.timeout}s")
+            raise TimeoutError(f"Elasticsearch search timed out after {self.timeout}s")
         except Exception as e:
             print(f"MCP search execution error: {e}")
             raise
@@ -131,14 +184,16 @@ class MCPElasticsearchClient:
 # Inisialisasi MCP ES Client
 mcp_es = MCPElasticsearchClient()
 
-with open('utils/api_query.md') as f:
-    self_query = f.read()
-
+@functools.lru_cache(maxsize=None)
 def read_api_docs(file_path="utils/api_docs.md") -> str:
-    """Membaca dokumentasi query patterns untuk ES"""
+    """Membaca dokumentasi query patterns untuk ES (dibaca sekali, saat pertama dipakai)"""
     with open(file_path, "r", encoding="utf-8") as f:
         return f.read()
 
+def read_query_reference() -> str:
+    """Referensi struktur query (utils/api_query.md), dibaca saat pertama dipakai"""
+    return read_api_docs("utils/api_query.md")
+
 async def stream_generate_search_strategy(user_query: str, extracted_keywords: List[str] = None) -> AsyncGenerator[Dict, None]:
     """Generate search strategy dengan streaming response"""
     
@@ -210,7 +265,7 @@ Jika pertanyaan user tidak membutuhkan data media social dari Elasticsearch, mak
         "progress": 20
     }
 
-    result = call_gemini(prompt)
+    result = await call_gemini_async(prompt)
     
     try:
         strategy_match = re.findall(r'\{.*\}', result, flags=re.I | re.S)
@@ -255,7 +310,8 @@ Jika pertanyaan user tidak membutuhkan data media social dari Elasticsearch, mak
             
             yield {
                 "type": "result",
-                "data": default_strategy
+                "data": default_strategy,
+                "fallback": True
             }
             
     except Exception as e:
@@ -268,6 +324,7 @@ Jika pertanyaan user tidak membutuhkan data media social dari Elasticsearch, mak
         
         yield {
             "type": "result",
+            "fallback": True,
             "data": {
                 "query_type": "search",
                 "analysis_type": "mentions", 
@@ -326,7 +383,7 @@ Analysis Type: {strategy.get("analysis_type", "mentions")}
 Parameters: {params}
 User Query: {user_query}
 
-Referensi struktur query: {self_query}
+Referensi struktur query: {read_query_reference()}
 
 Aturan:
 1. Gunakan keywords dari parameters untuk filter post_caption
@@ -340,7 +397,7 @@ Aturan:
 Output harus berupa valid Elasticsearch query JSON dengan field "size" di dalam body.
 """
 
-    query_response = call_gemini(prompt)
+    query_response = await call_gemini_async(prompt)
     
 
 
@@ -391,7 +448,8 @@ Output harus berupa valid Elasticsearch query JSON dengan field "size" di dalam
             
             yield {
                 "type": "result",
-                "data": default_query
+                "data": default_query,
+                "fallback": True
             }
             
     except Exception as e:
@@ -404,6 +462,7 @@ Output harus berupa valid Elasticsearch query JSON dengan field "size" di dalam
         
         yield {
             "type": "result",
+            "fallback": True,
             "data": {
                 "size": limit,
                 "query": {"match_all": {}}
@@ -423,12 +482,32 @@ async def stream_search_elasticsearch_data(strategy: Dict, query_es: Dict) -> As
     index = 'reddit_data,youtube_data,linkedin_data,twitter_data,tiktok_data,instagram_data,facebook_data,news_data,threads_data'
     query_type = strategy.get("query_type", "search")
     
-    print(json.dumps(query_es, indent=4))
-
+    # Query dari Gemini dibatasi dulu (size, agg, script, wildcard, rentang tanggal)
+    query_es, guard_report = guard_query(query_es, query_type)
+    if guard_report["rejected"]:
+        limit = min(strategy.get("parameters", {}).get("limit", 20) or 20, MAX_SIZE)
+        query_es, _ = guard_query({"size": limit, "query": {"match_all": {}}}, "search")
+        yield {
+            "type": "stream",
+            "step": StreamStepType.DATA_SEARCH.value,
+            "message": f"Query terlalu berat ({guard_report['rejected']}), memakai query default",
+            "data": {"query_guard": guard_report},
+            "progress": 65
+        }
+    elif guard_report["rewrites"]:
+        yield {
+            "type": "stream",
+            "step": StreamStepType.DATA_SEARCH.value,
+            "message": f"Query disesuaikan: {len(guard_report['rewrites'])} perubahan",
+            "data": {"query_guard": guard_report},
+            "progress": 65
+        }
 
     try:
         if query_type == "aggregation":
             result = await mcp_es.aggregate(index=index, body=query_es)
+        elif query_type == "both":
+            result = await mcp_es.search_and_aggregate(index=index, body=query_es)
         else:
             result = await mcp_es.search(index=index, body=query_es)
         
@@ -444,7 +523,9 @@ async def stream_search_elasticsearch_data(strategy: Dict, query_es: Dict) -> As
         
         yield {
             "type": "result",
-            "data": result
+            "data": result,
+            "query": query_es,
+            "query_guard": guard_report
         }
         
     except Exception as e:
@@ -457,11 +538,17 @@ async def stream_search_elasticsearch_data(strategy: Dict, query_es: Dict) -> As
         
         yield {
             "type": "result",
-            "data": {"error": str(e), "hits": {"hits": [], "total": {"value": 0}}}
+            "data": {"error": str(e), "hits": {"hits": [], "total": {"value": 0}}},
+            "query": query_es,
+            "query_guard": guard_report
         }
 
 def process_elasticsearch_results(es_result: Dict, strategy: Dict) -> Dict:
-    """Process hasil ES dan extract informasi yang relevan (unchanged)"""
+    """Process hasil ES dan extract informasi yang relevan
+
+    Field _source yang dibaca di sini harus sama dengan ANSWER_SOURCE_FIELDS
+    (utils/query_guard.py).
+    """
     analysis_type = strategy.get("analysis_type", "mentions")
     
     if "error" in es_result:
@@ -482,16 +569,16 @@ def process_elasticsearch_results(es_result: Dict, strategy: Dict) -> Dict:
             source = hit.get("_source", {})
             doc = {
                 "id": hit.get("_id"),
-                "platform": source.get("platform", "unknown"),
+                "platform": source.get("channel", "unknown"),
                 "caption": source.get("post_caption", ""),
                 "created_at": source.get("post_created_at"),
-                "author": source.get("author_name", ""),
+                "author": source.get("username", ""),
                 "link": source.get("link_post", ""),
                 "sentiment": source.get("sentiment"),
                 "engagement": {
-                    "likes": source.get("likes_count", 0),
-                    "comments": source.get("comments_count", 0),
-                    "shares": source.get("shares_count", 0)
+                    "likes": source.get("likes", 0),
+                    "comments": source.get("comments", 0),
+                    "shares": source.get("shares", 0)
                 }
             }
             processed_data["documents"].append(doc)
@@ -512,7 +599,7 @@ async def stream_generate_final_response(processed_data: Dict, strategy: Dict, u
         "progress": 80
     }
     
-    answer = call_gemini(f"""
+    prompt = f"""
 Kamu adalah Moskal AI, asisten AI yang bertugas menjawab pertanyaan user berdasarkan data media sosial dari Elasticsearch.
 
 🎯 TUJUAN:
@@ -558,11 +645,33 @@ Kamu adalah Moskal AI, asisten AI yang bertugas menjawab pertanyaan user berdasa
 Pertanyaan User: {user_query}
 Strategy: {strategy}
 Data Analysis Type: {processed_data['analysis_type']}
-Processed Data: {processed_data}
+Total Documents: {processed_data['total_hits']}
+Aggregations: {compact_aggregations(processed_data.get('aggregations'))}
+Documents:
+{build_post_context(processed_data.get('documents'), extra_fields=("sentiment", "author", "created_at", "link"))}
 
 🎯 OUTPUT:
 JSON response dengan analisis mendalam data media sosial.
-""")
+"""
+    
+    # Teks dikirim ke client per chunk (event "delta") sambil dikumpulkan untuk di-parse
+    chunks = []
+    try:
+        async for chunk in call_gemini_stream(prompt):
+            chunks.append(chunk)
+            yield {
+                "type": "delta",
+                "step": StreamStepType.RESPONSE_GENERATION.value,
+                "text": chunk
+            }
+    except Exception as e:
+        yield {
+            "type": "stream",
+            "step": StreamStepType.ERROR.value,
+            "message": f"Error streaming final answer: {e}",
+            "progress": 85
+        }
+    answer = "".join(chunks)
     
     try:
         answer_match = re.findall(r'\{.*\}', answer, flags=re.I | re.S)
@@ -630,25 +739,47 @@ JSON response dengan analisis mendalam data media sosial.
 async def pipeline_ai_streaming(user_query: str, extracted_keywords: List[str] = None) -> AsyncGenerator[Dict, None]:
     """
     Main streaming pipeline untuk QnA dengan step-by-step progress
+
+    Strategy dan query untuk pertanyaan yang maksudnya sama (keyword boleh
+    berbeda) diambil dari plan cache, sehingga langsung ke pencarian data.
     """
     
+    # Plan tersimpan untuk pertanyaan serupa (lihat utils/query_plan_cache.py)
+    cached_plan = await asyncio.to_thread(get_plan, user_query, extracted_keywords)
+    plan_cache = {"hit": cached_plan is not None, **plan_cache_stats()}
+    
     # Step 1: Initialize
     yield {
         "type": "stream",
         "step": StreamStepType.INIT.value,
         "message": f"Memulai analisis untuk: {user_query}",
-        "data": {"query": user_query, "keywords": extracted_keywords},
+        "data": {"query": user_query, "keywords": extracted_keywords, "plan_cache": plan_cache},
         "progress": 0
     }
     
     try:
-        # Step 2-3: Generate search strategy
         strategy = None
-        async for stream_response in stream_generate_search_strategy(user_query, extracted_keywords):
-            if stream_response["type"] == "stream":
-                yield stream_response
-            elif stream_response["type"] == "result":
-                strategy = stream_response["data"]
+        query_es = None
+        # Plan hasil fallback (gagal parse) tidak disimpan
+        plan_fallback = False
+        if cached_plan is not None:
+            strategy, query_es = cached_plan
+            yield {
+                "type": "stream",
+                "step": StreamStepType.QUERY_GENERATION.value,
+                "message": "Menggunakan strategi dan query tersimpan",
+                "data": {"strategy": strategy, "elasticsearch_query": query_es, "plan_cache": plan_cache},
+                "progress": 50
+            }
+        
+        # Step 2-3: Generate search strategy
+        if strategy is None:
+            async for stream_response in stream_generate_search_strategy(user_query, extracted_keywords):
+                if stream_response["type"] == "stream":
+                    yield stream_response
+                elif stream_response["type"] == "result":
+                    strategy = stream_response["data"]
+                    plan_fallback = plan_fallback or stream_response.get("fallback", False)
         
         if not strategy:
             yield {
@@ -679,12 +810,13 @@ async def pipeline_ai_streaming(user_query: str, extracted_keywords: List[str] =
             return
         
         # Step 4: Generate Elasticsearch query
-        query_es = None
-        async for stream_response in stream_generate_elasticsearch_query(strategy, user_query, extracted_keywords):
-            if stream_response["type"] == "stream":
-                yield stream_response
-            elif stream_response["type"] == "result":
-                query_es = stream_response["data"]
+        if query_es is None:
+            async for stream_response in stream_generate_elasticsearch_query(strategy, user_query, extracted_keywords or []):
+                if stream_response["type"] == "stream":
+                    yield stream_response
+                elif stream_response["type"] == "result":
+                    query_es = stream_response["data"]
+                    plan_fallback = plan_fallback or stream_response.get("fallback", False)
         
         if not query_es:
             yield {
@@ -697,11 +829,15 @@ async def pipeline_ai_streaming(user_query: str, extracted_keywords: List[str] =
         
         # Step 5: Search Elasticsearch
         es_result = None
+        guard_report = {}
         async for stream_response in stream_search_elasticsearch_data(strategy, query_es):
             if stream_response["type"] == "stream":
                 yield stream_response
             elif stream_response["type"] == "result":
                 es_result = stream_response["data"]
+                # Query yang benar-benar dijalankan (sudah lewat guard)
+                query_es = stream_response.get("query", query_es)
+                guard_report = stream_response.get("query_guard") or {}
         
         if not es_result:
             yield {
@@ -712,6 +848,12 @@ async def pipeline_ai_streaming(user_query: str, extracted_keywords: List[str] =
             }
             return
         
+        # Plan baru yang lolos guard dan pencariannya berhasil disimpan sebagai template
+        # (query yang ditolak guard dijalankan sebagai match_all, jangan di-cache)
+        if (cached_plan is None and not plan_fallback and not guard_report.get("rejected")
+                and "error" not in es_result):
+            await asyncio.to_thread(store_plan, user_query, extracted_keywords, strategy, query_es)
+        
         # Step 6: Process data
         yield {
             "type": "stream",
@@ -736,7 +878,7 @@ async def pipeline_ai_streaming(user_query: str, extracted_keywords: List[str] =
         # Step 7: Generate final response
         final_response = None
         async for stream_response in stream_generate_final_response(processed_data, strategy, user_query):
-            if stream_response["type"] == "stream":
+            if stream_response["type"] in ("stream", "delta"):
                 yield stream_response
             elif stream_response["type"] == "result":
                 final_response = stream_response["data"]
@@ -3,10 +3,132 @@ from datetime import datetime
 from typing import Dict, List, Literal, Optional, Union
 
 # Import utilitas dari paket utils
+from utils.attribute_lookup import author_avatars
+from utils.author_metrics import get_channel_top_authors
+from utils.author_rollup import author_rollup_available, top_authors_per_channel
 from utils.es_client import get_elasticsearch_client
-from utils.es_query_builder import get_date_range
+from utils.es_query_builder import build_elasticsearch_query, get_date_range
 from utils.redis_client import redis_client
+from utils.metrics import instrument
+from utils.ranked_pages import (
+    RANKED_LIST_TTL, capped_author_count, is_shallow, pack_rows, page_bounds, pagination, slice_page
+)
 
+FOLLOWERS_COLUMNS = ["channel", "username", "followers", "influence_score", "total_mentions", "total_reach",
+                     "user_image_url"]
+
+
+def _followers_item(channel, username, followers, influence_score, mentions, reach, user_image_url):
+    # Buat fallback user_image_url untuk channel news jika tidak ada
+    if channel == "news" and not user_image_url:
+        domain_name = username.replace("www.", "")
+        user_image_url = f"https://logo.clearbit.com/{domain_name}"
+
+    return {
+        "channel": channel,
+        "username": username,
+        "followers": followers,
+        "influence_score": influence_score,
+        "total_mentions": mentions,
+        "total_reach": reach,
+        "user_image_url": user_image_url
+    }
+
+
+def _followers_items(channel_buckets):
+    """Items of the by_channel > by_username aggregation"""
+    followers_data = []
+    for channel_bucket in channel_buckets:
+        channel = channel_bucket["key"]
+        for username_bucket in channel_bucket["by_username"]["buckets"]:
+            followers = username_bucket["followers"]["value"]
+            connections = username_bucket["connections"]["value"]
+            subscribers = username_bucket["subscribers"]["value"]
+            followers_data.append(_followers_item(
+                channel,
+                username_bucket["key"],
+                followers or connections or subscribers or 0,
+                username_bucket["influence_score"]["value"] or 0,
+                username_bucket["doc_count"],
+                username_bucket["total_reach"]["value"],
+                None
+            ))
+    return followers_data
+
+
+def _followers_aggs(channel_count, limit):
+    """by_channel > by_username aggregation of the shallow page path"""
+    return {
+        "by_channel": {
+            "terms": {
+                "field": "channel",
+                "size": channel_count
+            },
+            "aggs": {
+                "by_username": {
+                    "terms": {
+                        "field": "username",
+                        "size": limit
+                    },
+                    "aggs": {
+                        "subscribers": {
+                            "max": {
+                                "field": "subscriber"
+                            }
+                        },
+                        "followers": {
+                            "max": {
+                                "field": "user_followers"
+                            }
+                        },
+                        "connections": {
+                            "max": {
+                                "field": "user_connections"
+                            }
+                        },
+                        "influence_score": {
+                            "avg": {
+                                "field": "user_influence_score"
+                            }
+                        },
+                        "total_reach": {
+                            "sum": {
+                                "field": "reach_score"
+                            }
+                        }
+                    }
+                }
+            }
+        },
+        "total_mentions": {
+            "value_count": {
+                "field": "link_post"
+            }
+        }
+    }
+
+
+def _rank_most_followers(authors, limit, total_mentions):
+    """
+    Most followers view of the top `limit` authors per channel by
+    mentions (utils.author_metrics.get_channel_top_authors), sorted by
+    followers, packed with ranked_pages.pack_rows plus total_mentions
+    """
+    followers_data = [
+        _followers_item(row.channel, row.username, float(row.user_followers),
+                        float(row.mean_user_influence_score), int(row.link_post), float(row.reach_score),
+                        row.user_image_url or None)
+        for row in top_authors_per_channel(authors, limit).itertuples()
+    ]
+
+    # Sortir berdasarkan jumlah followers
+    followers_data.sort(key=lambda x: x["followers"], reverse=True)
+    ranked = pack_rows(followers_data, FOLLOWERS_COLUMNS)
+    ranked["total_mentions"] = total_mentions
+    return ranked
+
+
+@instrument()
 def get_most_followers(
     es_host=None,
     es_username=None,
@@ -74,6 +196,30 @@ def get_most_followers(
         print('Returning cached result')
         return cached_result
 
+    # Daftar lengkap yang sudah diranking, tanpa page/page_size di key
+    ranked_key = redis_client.generate_cache_key(
+        "get_most_followers_ranked",
+        keywords=keywords,
+        search_keyword=search_keyword,
+        search_exact_phrases=search_exact_phrases,
+        case_sensitive=case_sensitive,
+        sentiment=sentiment,
+        start_date=start_date,
+        end_date=end_date,
+        date_filter=date_filter,
+        custom_start_date=custom_start_date,
+        custom_end_date=custom_end_date,
+        channels=channels,
+        importance=importance,
+        influence_score_min=influence_score_min,
+        influence_score_max=influence_score_max,
+        region=region,
+        language=language,
+        domain=domain,
+        limit=limit
+    )
+    ranked = redis_client.get(ranked_key)
+
     # Buat koneksi Elasticsearch
     es = get_elasticsearch_client(
         es_host=es_host,
@@ -128,297 +274,71 @@ def get_most_followers(
             custom_end_date=custom_end_date
         )
     
-    # Bangun query untuk mendapatkan akun dengan followers terbanyak
-    must_conditions = [
-        {
-            "range": {
-                "post_created_at": {
-                    "gte": start_date,
-                    "lte": end_date
-                }
-            }
-        }
-    ]
+    # Filter request; top author per channel dibagi dengan share of voice
+    # (lihat utils.author_metrics)
+    filters = dict(
+        keywords=keywords, search_keyword=search_keyword, search_exact_phrases=search_exact_phrases,
+        case_sensitive=case_sensitive, sentiment=sentiment, importance=importance,
+        influence_score_min=influence_score_min, influence_score_max=influence_score_max,
+        region=region, language=language, domain=domain
+    )
     
-    # Add keyword and search_keyword filters
-    if keywords or search_keyword:
-        must_conditions_inner = []
-        
-        # Handle regular keywords
-        if keywords:
-            # Konversi keywords ke list jika belum
-            keyword_list = keywords if isinstance(keywords, list) else [keywords]
-            keyword_should_conditions = []
-            
-            # Tentukan field yang akan digunakan berdasarkan case_sensitive
-            caption_field = "post_caption.keyword" if case_sensitive else "post_caption"
-            issue_field = "cluster.keyword" if case_sensitive else "cluster"
-            
-            if search_exact_phrases:
-                # Gunakan match_phrase untuk exact matching
-                for kw in keyword_list:
-                    keyword_should_conditions.extend([
-                        {"match_phrase": {caption_field: kw}},
-                        {"match_phrase": {issue_field: kw}}
-                    ])
-            else:
-                # Gunakan match dengan operator AND
-                for kw in keyword_list:
-                    keyword_should_conditions.extend([
-                        {"match": {caption_field: {"query": kw, "operator": "AND"}}},
-                        {"match": {issue_field: {"query": kw, "operator": "AND"}}}
-                    ])
-            
-            must_conditions_inner.append({
-                "bool": {
-                    "should": keyword_should_conditions,
-                    "minimum_should_match": 1
-                }
-            })
-        
-        # Handle search_keyword with same logic as keywords
-        if search_keyword:
-            # Konversi search_keyword ke list jika belum
-            search_keyword_list = search_keyword if isinstance(search_keyword, list) else [search_keyword]
-            search_keyword_should_conditions = []
-            
-            # Tentukan field yang akan digunakan berdasarkan case_sensitive
-            caption_field = "post_caption.keyword" if case_sensitive else "post_caption"
-            issue_field = "cluster.keyword" if case_sensitive else "cluster"
-            
-            if search_exact_phrases:
-                # Gunakan match_phrase untuk exact matching
-                for sk in search_keyword_list:
-                    search_keyword_should_conditions.extend([
-                        {"match_phrase": {caption_field: sk}},
-                        {"match_phrase": {issue_field: sk}}
-                    ])
-            else:
-                # Gunakan match dengan operator AND
-                for sk in search_keyword_list:
-                    search_keyword_should_conditions.extend([
-                        {"match": {caption_field: {"query": sk, "operator": "AND"}}},
-                        {"match": {issue_field: {"query": sk, "operator": "AND"}}}
-                    ])
-            
-            must_conditions_inner.append({
-                "bool": {
-                    "should": search_keyword_should_conditions,
-                    "minimum_should_match": 1
-                }
-            })
-        
-        # Add the combined conditions to must_conditions
-        must_conditions.append({
-            "bool": {
-                "must": must_conditions_inner
-            }
-        })
+    try:
 
-    # Bangun filter untuk query
-    filter_conditions = []
-    
-    # Filter untuk sentiment
-    if sentiment:
-        sentiment_condition = {
-            "terms": {
-                "sentiment": sentiment if isinstance(sentiment, list) else [sentiment]
-            }
-        }
-        filter_conditions.append(sentiment_condition)
-    
-    # Filter untuk importance
-    if importance == "important mentions":
-        filter_conditions.append({
-            "range": {
-                "influence_score": {
-                    "gt": 50
-                }
-            }
-        })
-        
-    # Filter untuk influence score
-    if influence_score_min is not None or influence_score_max is not None:
-        influence_condition = {"range": {"influence_score": {}}}
-        if influence_score_min is not None:
-            influence_condition["range"]["influence_score"]["gte"] = influence_score_min
-        if influence_score_max is not None:
-            influence_condition["range"]["influence_score"]["lte"] = influence_score_max
-        filter_conditions.append(influence_condition)
-        
-    # Filter untuk region menggunakan wildcard
-    if region:
-        region_conditions = []
-        region_list = region if isinstance(region, list) else [region]
-        
-        for r in region_list:
-            region_conditions.append({"wildcard": {"region": f"*{r}*"}})
-        
-        region_filter = {
-            "bool": {
-                "should": region_conditions,
-                "minimum_should_match": 1
-            }
-        }
-        filter_conditions.append(region_filter)
-        
-    # Filter untuk language menggunakan wildcard
-    if language:
-        language_conditions = []
-        language_list = language if isinstance(language, list) else [language]
-        
-        for l in language_list:
-            language_conditions.append({"wildcard": {"language": f"*{l}*"}})
-        
-        language_filter = {
-            "bool": {
-                "should": language_conditions,
-                "minimum_should_match": 1
-            }
-        }
-        filter_conditions.append(language_filter)
-        
-    # Filter untuk domain
-    if domain:
-        domain_condition = {
-            "bool": {
-                "should": [{"wildcard": {"link_post": f"*{d}*"}} for d in (domain if isinstance(domain, list) else [domain])],
-                "minimum_should_match": 1
-            }
-        }
-        filter_conditions.append(domain_condition)
-    
-    # Gabungkan semua kondisi ke dalam query utama
-    query = {
-        "size": 0,  # Kita hanya perlu agregasi
-        "query": {
-            "bool": {
-                "must": must_conditions
-            }
-        },
-        "aggs": {
-            "by_channel": {
-                "terms": {
-                    "field": "channel",
-                    "size": len(selected_channels)
-                },
-                "aggs": {
-                    "by_username": {
-                        "terms": {
-                            "field": "username",
-                            "size": limit
+        if ranked is None and is_shallow(page, page_size) and \
+                not author_rollup_available(es, start_date, end_date, **filters):
+            # Halaman dangkal: tiap channel hanya mengembalikan author teratas
+            # (bucket_sort pada followers), jumlah author dari cardinality
+            start_index, end_index = page_bounds(page, page_size)
+            query = build_elasticsearch_query(start_date=start_date, end_date=end_date, size=0, **filters)
+            query["aggs"] = _followers_aggs(len(selected_channels), limit)
+            channel_aggs = query["aggs"]["by_channel"]["aggs"]
+            channel_aggs["by_username"]["aggs"].update({
+                "followers_value": {
+                    "bucket_script": {
+                        "buckets_path": {
+                            "f": "followers",
+                            "c": "connections",
+                            "s": "subscribers"
                         },
-                        "aggs": {
-                            "subscribers": {
-                                "max": {
-                                    "field": "subscriber"
-                                }
-                            },
-                            "followers": {
-                                "max": {
-                                    "field": "user_followers"
-                                }
-                            },
-                            "connections": {
-                                "max": {
-                                    "field": "user_connections"
-                                }
-                            },
-                            "influence_score": {
-                                "avg": {
-                                    "field": "user_influence_score"
-                                }
-                            },
-                            "total_reach": {
-                                "sum": {
-                                    "field": "reach_score"
-                                }
-                            },
-                            "top_hits": {
-                                "top_hits": {
-                                    "size": 1,
-                                    "_source": ["user_image_url"]
-                                }
-                            }
-                        }
+                        "gap_policy": "insert_zeros",
+                        "script": "params.f > 0 ? params.f : (params.c > 0 ? params.c : params.s)"
+                    }
+                },
+                "page_sort": {
+                    "bucket_sort": {
+                        "sort": [{"followers_value": {"order": "desc"}}],
+                        "size": end_index
                     }
                 }
-            },
-            "total_mentions": {
-                "value_count": {
-                    "field": "link_post"
+            })
+            channel_aggs["authors"] = {
+                "cardinality": {
+                    "field": "username"
                 }
             }
-        }
-    }
-    
-    # Tambahkan filter jika ada
-    if filter_conditions:
-        query["query"]["bool"]["filter"] = filter_conditions
-    
-    try:
-
-        import json
-        #print(json.dumps(query, indent=2))
-        # Jalankan query
-        response = es.search(
-            index=",".join(indices),
-            body=query
-        )
-        
-        # Proses hasil untuk mendapatkan akun dengan followers terbanyak
-        channel_buckets = response["aggregations"]["by_channel"]["buckets"]
-        total_mentions = response["aggregations"]["total_mentions"]["value"]
-        
-        # Kumpulkan data dari semua channel
-        followers_data = []
-        
-        for channel_bucket in channel_buckets:
-            channel = channel_bucket["key"]
-            username_buckets = channel_bucket["by_username"]["buckets"]
-            
-            for username_bucket in username_buckets:
-                username = username_bucket["key"]
-                mentions = username_bucket["doc_count"]
-                subscribers = username_bucket["subscribers"]["value"]
-                followers = username_bucket["followers"]["value"]
-                connections = username_bucket["connections"]["value"]
-                influence_score = username_bucket["influence_score"]["value"] or 0
-                reach = username_bucket["total_reach"]["value"]
-                
-                # Ambil user_image_url dari top_hits
-                user_image_url = None
-                if "top_hits" in username_bucket and username_bucket["top_hits"]["hits"]["hits"]:
-                    hit = username_bucket["top_hits"]["hits"]["hits"][0]
-                    if "_source" in hit and "user_image_url" in hit["_source"]:
-                        user_image_url = hit["_source"]["user_image_url"]
-                
-                # Buat fallback user_image_url untuk channel news jika tidak ada
-                if channel == "news" and not user_image_url:
-                    domain_name = username.replace("www.", "")
-                    user_image_url = f"https://logo.clearbit.com/{domain_name}"
-                
-                followers_data.append({
-                    "channel": channel,
-                    "username": username,
-                    "followers": followers or connections or subscribers or 0,
-                    "influence_score": influence_score,
-                    "total_mentions": mentions,
-                    "total_reach": reach,
-                    "user_image_url": user_image_url
-                })
-        
-        # Sortir berdasarkan jumlah followers
-        followers_data.sort(key=lambda x: x["followers"], reverse=True)
-        
-        # Pagination
-        total_items = len(followers_data)
-        total_pages = (total_items + page_size - 1) // page_size  # ceiling division
-        
-        start_index = (page - 1) * page_size
-        end_index = min(start_index + page_size, total_items)
-        
-        paginated_data = followers_data[start_index:end_index]
+            response = es.search(
+                index=",".join(indices),
+                body=query
+            )
+            channel_buckets = response["aggregations"]["by_channel"]["buckets"]
+            total_mentions = response["aggregations"]["total_mentions"]["value"]
+            followers_data = _followers_items(channel_buckets)
+            followers_data.sort(key=lambda x: x["followers"], reverse=True)
+            paginated_data = followers_data[start_index:end_index]
+            # Avatar hanya untuk author di halaman ini (lihat utils.attribute_lookup)
+            avatars = author_avatars(es, indices, [(item["channel"], item["username"]) for item in paginated_data])
+            for item in paginated_data:
+                item["user_image_url"] = avatars.get((item["channel"], item["username"])) or item["user_image_url"]
+            page_info = pagination(page, page_size, capped_author_count(channel_buckets, limit))
+        else:
+            if ranked is None:
+                authors, total_mentions = get_channel_top_authors(es, indices, selected_channels,
+                                                                  start_date, end_date, limit, **filters)
+                ranked = _rank_most_followers(authors, limit, total_mentions)
+                redis_client.set_with_ttl(ranked_key, ranked, ttl_seconds=RANKED_LIST_TTL)
+            paginated_data, page_info = slice_page(ranked, page, page_size)
+            total_mentions = ranked["total_mentions"]
         
         # Format username
         for item in paginated_data:
@@ -428,12 +348,7 @@ def get_most_followers(
         # Buat hasil dengan informasi pagination
         result = {
             "data": paginated_data,
-            "pagination": {
-                "page": page,
-                "page_size": page_size,
-                "total_pages": total_pages,
-                "total_items": total_items
-            }
+            "pagination": page_info
         }
         
         # Tambahkan daftar channel yang digunakan
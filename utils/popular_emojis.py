@@ -8,6 +8,7 @@ from typing import Dict, List, Literal, Optional, Union
 from utils.es_client import get_elasticsearch_client
 from utils.es_query_builder import get_date_range
 from utils.redis_client import redis_client
+from utils.metrics import instrument
 from utils.list_of_mentions import get_mentions
 
 def extract_emojis(text):
@@ -46,6 +47,7 @@ def extract_emojis(text):
     
     return result
 
+@instrument()
 def get_popular_emojis(
     es_host=None,
     es_username=None,
@@ -8,8 +8,6 @@ serta perbandingan dengan topik lainnya.
 
 import argparse
 import json
-import pandas as pd
-import numpy as np
 from datetime import datetime, timedelta
 from typing import Dict, List, Literal, Optional, Union, Tuple
 
@@ -17,7 +15,9 @@ from typing import Dict, List, Literal, Optional, Union, Tuple
 from utils.es_client import get_elasticsearch_client
 from utils.es_query_builder import get_date_range
 from utils.redis_client import redis_client
+from utils.metrics import instrument
 from utils.script_score import script_score
+@instrument()
 def get_presence_score(
     es_host=None,
     es_username=None,
@@ -363,8 +363,6 @@ def get_presence_score(
         # Jalankan query untuk topik utama
         main_query = build_presence_score_query(keywords,search_keyword)
 
-        import json
-        #print(json.dumps(main_query, indent=2))
 
         main_response = es.search(
             index=",".join(available_indices),
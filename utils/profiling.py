@@ -0,0 +1,254 @@
+"""
+Request Profiling Utilities
+
+This module implements the opt-in `debug=profile` mode. When a request
+carries `?debug=profile` or the `X-Debug: profile` header, a Profile is
+attached to the request context; instrumented code then records spans
+(utils function, cache lookup, Elasticsearch with `"profile": true`,
+Gemini, serialization) and the compact profile tree is returned next to
+the response data.
+
+When the flag is absent every hook reduces to a single ContextVar lookup.
+"""
+
+import contextvars
+import time
+from contextlib import nullcontext
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers
+
+_current_profile = contextvars.ContextVar("current_profile", default=None)
+
+_NULL_SPAN = nullcontext()
+
+# Nama fase untuk jeda (waktu "self") sebelum child span tertentu
+_GAP_BEFORE = {
+    "cache_lookup": "param_normalization",
+    "es": "query_build",
+    "gemini": "prompt_build",
+    "serialization": "response_build",
+}
+# Jeda di bawah ambang ini tidak ditampilkan agar tree tetap ringkas
+_MIN_GAP_MS = 0.05
+_MAX_ES_AGGS = 10
+
+
+class _Span:
+    __slots__ = ("name", "start", "end", "attrs", "children")
+
+    def __init__(self, name, start, attrs=None):
+        self.name = name
+        self.start = start
+        self.end = None
+        self.attrs = attrs or {}
+        self.children = []
+
+    def to_dict(self, now):
+        end = self.end if self.end is not None else now
+        node = {"name": self.name, "ms": round((end - self.start) * 1000, 3)}
+        node.update(self.attrs)
+        if self.children:
+            node["children"] = _with_gaps(self, end, now)
+        return node
+
+
+def _gap(name, start, end):
+    ms = (end - start) * 1000
+    if ms < _MIN_GAP_MS:
+        return None
+    return {"name": name, "ms": round(ms, 3)}
+
+
+def _with_gaps(span, end, now):
+    """Children of a span interleaved with labelled self-time gaps"""
+    nodes = []
+    cursor = span.start
+    for index, child in enumerate(span.children):
+        default = "param_normalization" if index == 0 else "self"
+        gap = _gap(_GAP_BEFORE.get(child.name, default), cursor, child.start)
+        if gap:
+            nodes.append(gap)
+        nodes.append(child.to_dict(now))
+        cursor = child.end if child.end is not None else now
+    gap = _gap("post_processing", cursor, end)
+    if gap:
+        nodes.append(gap)
+    return nodes
+
+
+class Profile:
+    """Span tree collected for a single profiled request"""
+
+    def __init__(self, name):
+        self.root = _Span(name, time.perf_counter())
+        self._stack = [self.root]
+
+    def span(self, name, **attrs):
+        return _SpanContext(self, name, attrs)
+
+    def add_span(self, name, start, end, **attrs):
+        """Attach an already finished span to the currently open span"""
+        span = _Span(name, start, attrs)
+        span.end = end
+        self._stack[-1].children.append(span)
+        return span
+
+    def to_dict(self):
+        return self.root.to_dict(time.perf_counter())
+
+
+class _SpanContext:
+    __slots__ = ("profile", "span")
+
+    def __init__(self, profile, name, attrs):
+        self.profile = profile
+        self.span = _Span(name, 0.0, attrs)
+
+    def __enter__(self):
+        self.span.start = time.perf_counter()
+        self.profile._stack[-1].children.append(self.span)
+        self.profile._stack.append(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.end = time.perf_counter()
+        if exc_type is not None:
+            self.span.attrs["error"] = exc_type.__name__
+        self.profile._stack.pop()
+        return False
+
+
+def current_profile():
+    """Profile of the current request, or None when profiling is off"""
+    return _current_profile.get()
+
+
+def span(name, **attrs):
+    """Context manager recording a span when profiling is on (no-op otherwise)"""
+    profile = _current_profile.get()
+    if profile is None:
+        return _NULL_SPAN
+    return profile.span(name, **attrs)
+
+
+def enable_es_profile(method, kwargs):
+    """
+    Return a copy of Elasticsearch call kwargs with `"profile": true` set
+
+    Parameters:
+    -----------
+    method : str
+        Client method name ('search', 'msearch', ...)
+    kwargs : dict
+        Keyword arguments passed to the client method
+
+    Returns:
+    --------
+    dict
+        Updated keyword arguments
+    """
+    kwargs = dict(kwargs)
+    if method == "search":
+        if isinstance(kwargs.get("body"), dict):
+            kwargs["body"] = {**kwargs["body"], "profile": True}
+        else:
+            kwargs["profile"] = True
+    elif method == "msearch":
+        key = "searches" if "searches" in kwargs else "body"
+        searches = kwargs.get(key)
+        if isinstance(searches, list):
+            # Format msearch: pasangan header, body
+            kwargs[key] = [
+                {**item, "profile": True} if i % 2 == 1 and isinstance(item, dict) else item
+                for i, item in enumerate(searches)
+            ]
+    return kwargs
+
+
+def _collect_aggs(aggs, totals, prefix=""):
+    for agg in aggs:
+        name = f"{prefix}{agg.get('description', '?')}"
+        key = (agg.get("type", "?"), name)
+        totals[key] = totals.get(key, 0) + agg.get("time_in_nanos", 0)
+        _collect_aggs(agg.get("children", []), totals, prefix=f"{name} > ")
+
+
+def summarize_es_profile(body):
+    """
+    Compress an Elasticsearch `profile` section into per-phase timings
+
+    Query and aggregation times are summed over shards; only the slowest
+    aggregations are kept.
+    """
+    shards = (body or {}).get("profile", {}).get("shards", [])
+    if not shards:
+        return None
+
+    query_nanos = 0
+    fetch_nanos = 0
+    agg_totals = {}
+    for shard in shards:
+        for search in shard.get("searches", []):
+            query_nanos += sum(q.get("time_in_nanos", 0) for q in search.get("query", []))
+        fetch_nanos += shard.get("fetch", {}).get("time_in_nanos", 0)
+        _collect_aggs(shard.get("aggregations", []), agg_totals)
+
+    slowest = sorted(agg_totals.items(), key=lambda item: item[1], reverse=True)[:_MAX_ES_AGGS]
+    return {
+        "shards": len(shards),
+        "query_ms": round(query_nanos / 1e6, 3),
+        "fetch_ms": round(fetch_nanos / 1e6, 3),
+        "aggregations": [
+            {"type": agg_type, "name": name, "ms": round(nanos / 1e6, 3)}
+            for (agg_type, name), nanos in slowest
+        ]
+    }
+
+
+def record_es_span(profile, method, kwargs, start, end, response=None, error=None):
+    """Attach an Elasticsearch call (with its ES-side profile summary) to the tree"""
+    attrs = {"method": method}
+    if kwargs.get("index"):
+        attrs["index"] = kwargs["index"]
+    if error is not None:
+        attrs["error"] = error
+
+    body = getattr(response, "body", response)
+    if isinstance(body, dict):
+        if body.get("took") is not None:
+            attrs["took_ms"] = body["took"]
+        es_profile = summarize_es_profile(body)
+        if es_profile:
+            attrs["es_profile"] = es_profile
+        elif method == "msearch":
+            attrs["es_profile"] = [
+                summarize_es_profile(item) for item in body.get("responses", [])
+            ]
+    profile.add_span("es", start, end, **attrs)
+
+
+def is_profile_requested(scope):
+    """True when a request asks for `debug=profile` (query param or X-Debug header)"""
+    if Headers(scope=scope).get("x-debug", "").lower() == "profile":
+        return True
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    return "profile" in query.get("debug", [])
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that attaches a Profile to requests asking for one"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not is_profile_requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        token = _current_profile.set(Profile(scope.get("path", "")))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_profile.reset(token)
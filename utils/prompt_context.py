@@ -0,0 +1,197 @@
+"""
+Prompt Context Builder
+
+Turns Elasticsearch posts into a compact text block for Gemini prompts:
+only caption, channel and engagement (plus optional extra fields), one
+line per post, near-duplicate captions merged, long captions truncated and
+the whole block capped by a token budget. Posts are expected in priority
+order (e.g. sorted by viral_score); whatever does not fit the budget is
+dropped from the end.
+"""
+
+import json
+import os
+import re
+
+# Estimasi kasar token Gemini: ~4 karakter per token
+CHARS_PER_TOKEN = 4
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+MAX_CAPTION_CHARS = int(os.getenv("PROMPT_MAX_CAPTION_CHARS", "400"))
+
+# Source field -> label di prompt
+ENGAGEMENT_FIELDS = {
+    "likes": "likes",
+    "comments": "comments",
+    "replies": "replies",
+    "shares": "shares",
+    "retweets": "retweets",
+    "views": "views",
+    "likes_count": "likes",
+    "comments_count": "comments",
+    "shares_count": "shares",
+}
+
+_URL = re.compile(r"https?://\S+")
+_MENTION = re.compile(r"[@#]\w+")
+_WORD = re.compile(r"\w+", re.UNICODE)
+_SPACES = re.compile(r"\s+")
+
+
+def estimate_tokens(text):
+    """Rough token count of a string (characters / CHARS_PER_TOKEN)"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate(text, max_chars):
+    """Shorten text to max_chars on a word boundary, marking the cut with '…'"""
+    text = _SPACES.sub(" ", text or "").strip()
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars].rsplit(" ", 1)[0] or text[:max_chars]
+    return cut + "…"
+
+
+def _caption_tokens(caption):
+    # Token untuk deteksi duplikat: tanpa URL, mention dan hashtag
+    text = _MENTION.sub(" ", _URL.sub(" ", caption.lower()))
+    return frozenset(_WORD.findall(text))
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 1.0 if a == b else 0.0
+    return len(a & b) / len(a | b)
+
+
+def _engagement(post):
+    values = {}
+    sources = [post, post.get("engagement") or {}]
+    for source in sources:
+        for field, label in ENGAGEMENT_FIELDS.items():
+            value = source.get(field)
+            if isinstance(value, (int, float)) and value and label not in values:
+                values[label] = int(value) if float(value).is_integer() else round(value, 2)
+    return values
+
+
+def compact_post(post, max_caption_chars=MAX_CAPTION_CHARS, extra_fields=()):
+    """
+    Project a post to the fields a prompt needs
+
+    Accepts both raw `_source` documents (post_caption, channel, likes, ...)
+    and the documents built by Moskal AI (caption, platform, engagement{}).
+
+    Returns:
+    --------
+    dict
+        channel, caption, engagement and the requested extra fields
+    """
+    compact = {
+        "channel": post.get("channel") or post.get("platform") or "unknown",
+        "caption": truncate(post.get("post_caption") or post.get("caption") or "", max_caption_chars),
+        "engagement": _engagement(post),
+    }
+    for field in extra_fields:
+        if post.get(field) not in (None, ""):
+            compact[field] = post[field]
+    return compact
+
+
+def _render(compact, duplicates):
+    meta = [compact["channel"]]
+    meta.extend(f"{label} {value}" for label, value in compact["engagement"].items())
+    meta.extend(f"{field} {value}" for field, value in compact.items()
+                if field not in ("channel", "caption", "engagement"))
+    if duplicates:
+        meta.append(f"+{duplicates} similar posts")
+    return f"- [{', '.join(map(str, meta))}] {compact['caption']}"
+
+
+def build_post_context(posts, token_budget=PROMPT_TOKEN_BUDGET, max_caption_chars=MAX_CAPTION_CHARS,
+                       similarity_threshold=0.8, extra_fields=()):
+    """
+    Compact, deduplicated, budgeted text block of posts for a prompt
+
+    Parameters:
+    -----------
+    posts : list of dict
+        Posts in priority order
+    token_budget : int
+        Maximum estimated tokens of the returned block
+    max_caption_chars : int
+        Captions longer than this are truncated
+    similarity_threshold : float
+        Jaccard similarity of caption words above which a post counts as a
+        near duplicate of an earlier one; duplicates are folded into the
+        earlier line as "+n similar posts"
+    extra_fields : tuple of str
+        Additional post fields to include (e.g. 'sentiment', 'link')
+
+    Returns:
+    --------
+    str
+        One line per kept post ("- [channel, likes 10, ...] caption"), or
+        "(no posts)" when there is nothing to show
+    """
+    kept = []  # (caption tokens, compact post, jumlah duplikat)
+    for post in posts or []:
+        compact = compact_post(post, max_caption_chars, extra_fields)
+        if not compact["caption"]:
+            continue
+        tokens = _caption_tokens(compact["caption"])
+        for entry in kept:
+            if _jaccard(tokens, entry[0]) >= similarity_threshold:
+                entry[2] += 1
+                break
+        else:
+            kept.append([tokens, compact, 0])
+
+    lines = []
+    used = 0
+    for _, compact, duplicates in kept:
+        line = _render(compact, duplicates)
+        cost = estimate_tokens(line) + 1
+        if used + cost > token_budget:
+            break
+        lines.append(line)
+        used += cost
+
+    if len(lines) < len(kept):
+        lines.append(f"- ({len(kept) - len(lines)} more posts omitted)")
+    return "\n".join(lines) if lines else "(no posts)"
+
+
+def compact_aggregations(aggregations, max_buckets=20):
+    """
+    Aggregation results reduced to keys, counts and metric values
+
+    Bucket lists are cut to `max_buckets`, dates use key_as_string and
+    hits inside top_hits are replaced by their count. Returns a compact
+    JSON string.
+    """
+    def reduce(node):
+        if isinstance(node, dict):
+            if "buckets" in node:
+                buckets = node["buckets"]
+                if isinstance(buckets, dict):
+                    return {key: reduce(bucket) for key, bucket in list(buckets.items())[:max_buckets]}
+                return [reduce(bucket) for bucket in buckets[:max_buckets]]
+            if "hits" in node and isinstance(node["hits"], dict):
+                return {"hits": len(node["hits"].get("hits", []))}
+            reduced = {}
+            for key, value in node.items():
+                if key in ("doc_count_error_upper_bound", "sum_other_doc_count", "key_as_string", "meta"):
+                    continue
+                reduced[key] = reduce(value)
+            # Tanggal date_histogram lebih ringkas sebagai string
+            if "key_as_string" in node:
+                reduced["key"] = node["key_as_string"]
+            # {"value": x} cukup ditulis sebagai x
+            if list(reduced) == ["value"]:
+                return reduced["value"]
+            return reduced
+        if isinstance(node, list):
+            return [reduce(item) for item in node[:max_buckets]]
+        return node
+
+    return json.dumps(reduce(aggregations or {}), ensure_ascii=False, separators=(",", ":"), default=str)
@@ -0,0 +1,320 @@
+"""
+Query Guard for LLM-generated Elasticsearch queries
+
+Moskal AI executes the DSL produced by Gemini against all channel indices.
+guard_query analyzes such a query statically and rewrites it into a
+bounded one before it reaches the cluster:
+
+- `size` clamped (0 for aggregation-only queries), `terms`-like bucket
+  sizes and `top_hits` sizes clamped;
+- leading wildcards in `wildcard` / `regexp` clauses stripped, leading
+  wildcards disabled in `query_string`;
+- scripts removed (script queries, script_score, `_script` sorts,
+  script_fields, runtime_mappings, scripted aggregations); bucket_script /
+  bucket_selector / bucket_sort only read bucket values and are kept;
+- a default date range on post_created_at when the query has none;
+- `timeout` always set, and `terminate_after` for queries without
+  aggregations (on aggregations it would silently truncate the counts);
+- `_source` limited to the fields the answer step reads.
+
+Every rewrite is recorded in the report so it can be shown in the stream.
+Queries whose estimated cost is still above MOSKAL_MAX_QUERY_COST after
+the rewrites are rejected.
+"""
+
+import copy
+import os
+import re
+
+MAX_SIZE = int(os.getenv("MOSKAL_MAX_SIZE", "100"))
+MAX_TERMS_SIZE = int(os.getenv("MOSKAL_MAX_TERMS_SIZE", "50"))
+MAX_TOP_HITS_SIZE = int(os.getenv("MOSKAL_MAX_TOP_HITS_SIZE", "10"))
+DEFAULT_RANGE_DAYS = int(os.getenv("MOSKAL_DEFAULT_RANGE_DAYS", "30"))
+QUERY_TIMEOUT = os.getenv("MOSKAL_QUERY_TIMEOUT", "10s")
+TERMINATE_AFTER = int(os.getenv("MOSKAL_TERMINATE_AFTER", "100000"))
+MAX_QUERY_COST = int(os.getenv("MOSKAL_MAX_QUERY_COST", "100000"))
+
+DATE_FIELD = "post_created_at"
+# Field _source yang dibaca process_elasticsearch_results (utils/moskal_ai.py)
+ANSWER_SOURCE_FIELDS = [
+    "channel", "post_caption", "post_created_at", "username", "link_post",
+    "sentiment", "likes", "comments", "shares"
+]
+
+# Aggregation dengan parameter ukuran bucket
+_SIZED_AGGS = ("terms", "significant_terms", "multi_terms", "rare_terms", "composite")
+# Pipeline agg dengan script yang hanya membaca nilai bucket (murah)
+_BUCKET_SCRIPT_AGGS = ("bucket_script", "bucket_selector", "bucket_sort")
+_FINE_INTERVAL = re.compile(r"^\d+(ms|s|m)$")
+_LEADING_REGEX_WILDCARD = re.compile(r"^(\.[*+?]|\.\{[^}]*\})+")
+
+
+def _rewrite_wildcard(clause_type, body, report):
+    field, value = next(iter(body.items()))
+    pattern = value.get("value", value.get("wildcard")) if isinstance(value, dict) else value
+    if not isinstance(pattern, str):
+        return {clause_type: body}
+
+    if clause_type == "wildcard":
+        stripped = pattern.lstrip("*?")
+        empty = stripped.strip("*?") == ""
+    else:
+        stripped = _LEADING_REGEX_WILDCARD.sub("", pattern)
+        empty = stripped.strip(".*+?") == ""
+        # Regexp selalu di-anchor: ".*abc" menjadi "abc.*" (prefix), bukan "abc"
+        if stripped != pattern and not stripped.endswith(".*"):
+            stripped += ".*"
+
+    if stripped == pattern:
+        return {clause_type: body}
+    if empty:
+        report.append(f"removed {clause_type} on {field} matching everything ({pattern!r})")
+        return None
+
+    report.append(f"stripped leading wildcard from {clause_type} on {field}: {pattern!r} -> {stripped!r}")
+    if isinstance(value, dict):
+        value = dict(value)
+        value["value" if "value" in value else "wildcard"] = stripped
+        return {clause_type: {field: value}}
+    return {clause_type: {field: stripped}}
+
+
+def _rewrite_query(node, report):
+    """Rewritten query clause, or None when the clause must be dropped"""
+    if not isinstance(node, dict) or len(node) != 1:
+        return node
+    clause_type, body = next(iter(node.items()))
+
+    if clause_type == "bool" and isinstance(body, dict):
+        body = dict(body)
+        for occur in ("must", "filter", "should", "must_not"):
+            if occur not in body:
+                continue
+            clauses = body[occur] if isinstance(body[occur], list) else [body[occur]]
+            rewritten = [c for c in (_rewrite_query(c, report) for c in clauses) if c is not None]
+            if rewritten:
+                body[occur] = rewritten
+            else:
+                del body[occur]
+        return {"bool": body}
+
+    if clause_type == "script":
+        report.append("removed script query")
+        return None
+
+    if clause_type == "script_score" and isinstance(body, dict):
+        report.append("replaced script_score with its inner query")
+        return _rewrite_query(body.get("query", {"match_all": {}}), report)
+
+    if clause_type == "function_score" and isinstance(body, dict):
+        body = dict(body)
+        functions = body.get("functions", [])
+        kept = [f for f in functions if "script_score" not in f]
+        if len(kept) != len(functions) or "script_score" in body:
+            report.append("removed script functions from function_score")
+            body.pop("script_score", None)
+            body["functions"] = kept
+        if "query" in body:
+            body["query"] = _rewrite_query(body["query"], report) or {"match_all": {}}
+        return {"function_score": body}
+
+    if clause_type in ("constant_score",) and isinstance(body, dict):
+        body = dict(body)
+        body["filter"] = _rewrite_query(body.get("filter"), report) or {"match_all": {}}
+        return {clause_type: body}
+
+    if clause_type in ("nested", "has_child", "has_parent") and isinstance(body, dict):
+        body = dict(body)
+        body["query"] = _rewrite_query(body.get("query"), report) or {"match_all": {}}
+        return {clause_type: body}
+
+    if clause_type == "dis_max" and isinstance(body, dict):
+        body = dict(body)
+        body["queries"] = [q for q in (_rewrite_query(q, report) for q in body.get("queries", [])) if q is not None]
+        return {clause_type: body}
+
+    if clause_type in ("wildcard", "regexp") and isinstance(body, dict) and body:
+        return _rewrite_wildcard(clause_type, body, report)
+
+    if clause_type == "query_string" and isinstance(body, dict) and body.get("allow_leading_wildcard", True):
+        body = dict(body)
+        body["allow_leading_wildcard"] = False
+        report.append("disabled leading wildcards in query_string")
+        return {clause_type: body}
+
+    return node
+
+
+def _has_date_range(node):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "range" and isinstance(value, dict) and DATE_FIELD in value:
+                bounds = value[DATE_FIELD]
+                return isinstance(bounds, dict) and ("gte" in bounds or "gt" in bounds)
+            if _has_date_range(value):
+                return True
+    elif isinstance(node, list):
+        return any(_has_date_range(item) for item in node)
+    return False
+
+
+def _add_date_range(query, report):
+    date_filter = {"range": {DATE_FIELD: {"gte": f"now-{DEFAULT_RANGE_DAYS}d/d", "lte": "now"}}}
+    original = query.get("query")
+    if original is None:
+        query["query"] = {"bool": {"filter": [date_filter]}}
+    elif isinstance(original, dict) and "bool" in original:
+        bool_body = original["bool"]
+        filters = bool_body.get("filter", [])
+        bool_body["filter"] = (filters if isinstance(filters, list) else [filters]) + [date_filter]
+    else:
+        query["query"] = {"bool": {"must": [original], "filter": [date_filter]}}
+    report.append(f"added default date range (last {DEFAULT_RANGE_DAYS} days)")
+
+
+def _agg_type(body):
+    for key in body:
+        if key not in ("aggs", "aggregations", "meta"):
+            return key
+    return None
+
+
+def _rewrite_aggs(aggs, report, path=""):
+    """Rewrite aggregations in place; returns the estimated bucket count"""
+    total = 0
+    for name in list(aggs):
+        body = aggs[name]
+        if not isinstance(body, dict):
+            continue
+        agg_type = _agg_type(body)
+        params = body.get(agg_type) if agg_type else None
+        label = f"{path}{name}"
+
+        if agg_type == "scripted_metric" or (
+            isinstance(params, dict) and "script" in params and agg_type not in _BUCKET_SCRIPT_AGGS
+        ):
+            report.append(f"removed scripted aggregation '{label}'")
+            del aggs[name]
+            continue
+
+        buckets = 1
+        if isinstance(params, dict):
+            if agg_type in _SIZED_AGGS:
+                size = params.get("size", 10)
+                if not isinstance(size, int) or size > MAX_TERMS_SIZE:
+                    report.append(f"clamped {agg_type} size of '{label}' from {size} to {MAX_TERMS_SIZE}")
+                    params["size"] = size = MAX_TERMS_SIZE
+                if isinstance(params.get("shard_size"), int) and params["shard_size"] > MAX_TERMS_SIZE * 5:
+                    params["shard_size"] = MAX_TERMS_SIZE * 5
+                buckets = size
+            elif agg_type == "top_hits":
+                size = params.get("size", 3)
+                if not isinstance(size, int) or size > MAX_TOP_HITS_SIZE:
+                    report.append(f"clamped top_hits size of '{label}' from {size} to {MAX_TOP_HITS_SIZE}")
+                    params["size"] = size = MAX_TOP_HITS_SIZE
+                sort = params.get("sort")
+                if isinstance(sort, list) and any(isinstance(s, dict) and "_script" in s for s in sort):
+                    params["sort"] = [s for s in sort if not (isinstance(s, dict) and "_script" in s)]
+                    report.append(f"removed script sort in top_hits '{label}'")
+                params["_source"] = params.get("_source", ANSWER_SOURCE_FIELDS)
+                buckets = size
+            elif agg_type in ("date_histogram", "histogram"):
+                interval = params.get("fixed_interval") or params.get("interval") or params.get("calendar_interval")
+                if isinstance(interval, str) and (_FINE_INTERVAL.match(interval) or interval in ("minute", "second")):
+                    for key in ("fixed_interval", "interval", "calendar_interval"):
+                        params.pop(key, None)
+                    params["calendar_interval"] = "hour"
+                    report.append(f"coarsened interval of '{label}' from {interval} to hour")
+                    interval = "hour"
+                buckets = DEFAULT_RANGE_DAYS * (24 if interval in ("hour", "1h") else 1)
+            elif agg_type == "filter":
+                body["filter"] = _rewrite_query(params, report) or {"match_all": {}}
+            elif agg_type == "filters" and isinstance(params.get("filters"), dict):
+                params["filters"] = {k: _rewrite_query(v, report) or {"match_all": {}} for k, v in params["filters"].items()}
+                buckets = len(params["filters"])
+            elif agg_type == "filters" and isinstance(params.get("filters"), list):
+                params["filters"] = [_rewrite_query(v, report) or {"match_all": {}} for v in params["filters"]]
+                buckets = len(params["filters"])
+
+        sub_key = "aggs" if "aggs" in body else "aggregations" if "aggregations" in body else None
+        sub_buckets = _rewrite_aggs(body[sub_key], report, f"{label} > ") if sub_key else 0
+        total += buckets * max(sub_buckets, 1)
+    return total
+
+
+def guard_query(query, query_type="search", source_fields=None):
+    """
+    Bound an LLM-generated query before it is executed
+
+    Parameters:
+    -----------
+    query : dict
+        Elasticsearch request body (not modified)
+    query_type : str
+        Strategy query_type: 'search', 'aggregation' or 'both'
+    source_fields : list of str, optional
+        Fields kept in `_source`, defaults to ANSWER_SOURCE_FIELDS
+
+    Returns:
+    --------
+    tuple
+        (rewritten query, report) where report is
+        {"rewrites": [...], "estimated_cost": int, "rejected": str or None}
+    """
+    query = copy.deepcopy(query) if isinstance(query, dict) else {}
+    rewrites = []
+
+    # Ukuran hasil
+    size = query.get("size", 10)
+    if query_type == "aggregation" and size != 0:
+        rewrites.append(f"set size to 0 for aggregation query (was {size})")
+        query["size"] = size = 0
+    elif not isinstance(size, int) or size > MAX_SIZE:
+        rewrites.append(f"clamped size from {size} to {MAX_SIZE}")
+        query["size"] = size = MAX_SIZE
+    if isinstance(query.get("from"), int) and query["from"] + size > MAX_SIZE * 10:
+        rewrites.append(f"reset from {query['from']} to 0")
+        query["from"] = 0
+
+    # Script di luar query
+    for key in ("script_fields", "runtime_mappings"):
+        if key in query:
+            del query[key]
+            rewrites.append(f"removed {key}")
+    sort = query.get("sort")
+    if isinstance(sort, list) and any(isinstance(s, dict) and "_script" in s for s in sort):
+        query["sort"] = [s for s in sort if not (isinstance(s, dict) and "_script" in s)]
+        if not query["sort"]:
+            del query["sort"]
+        rewrites.append("removed script sort")
+
+    if "query" in query:
+        query["query"] = _rewrite_query(query["query"], rewrites) or {"match_all": {}}
+    if not _has_date_range(query.get("query")):
+        _add_date_range(query, rewrites)
+
+    agg_key = "aggs" if "aggs" in query else "aggregations" if "aggregations" in query else None
+    buckets = _rewrite_aggs(query[agg_key], rewrites) if agg_key and isinstance(query[agg_key], dict) else 0
+
+    # Batas eksekusi
+    if "timeout" not in query:
+        query["timeout"] = QUERY_TIMEOUT
+    if not agg_key and "terminate_after" not in query:
+        query["terminate_after"] = TERMINATE_AFTER
+    if query.get("track_total_hits") is True:
+        query["track_total_hits"] = 10000
+        rewrites.append("limited track_total_hits to 10000")
+
+    if size:
+        fields = source_fields or ANSWER_SOURCE_FIELDS
+        if query.get("_source") != fields:
+            query["_source"] = fields
+            rewrites.append(f"limited _source to {len(fields)} fields")
+
+    # Estimasi kasar: dokumen yang dikembalikan + bucket yang dibentuk
+    cost = size + buckets
+    rejected = None
+    if cost > MAX_QUERY_COST:
+        rejected = f"estimated cost {cost} exceeds {MAX_QUERY_COST}"
+
+    return query, {"rewrites": rewrites, "estimated_cost": cost, "rejected": rejected}
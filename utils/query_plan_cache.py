@@ -0,0 +1,155 @@
+"""
+Moskal AI Query-Plan Cache
+
+pipeline_ai_streaming spends two Gemini calls (search strategy and
+Elasticsearch query) before it can search. Questions repeat with small
+wording changes or only another keyword, so the validated plan (strategy
+plus query) is stored as a template:
+
+- the key is the normalized intent: the question lowercased, punctuation
+  and filler words removed, the request keywords replaced by slots, and
+  the remaining words sorted;
+- every occurrence of a request keyword in the strategy and the query is
+  replaced by a slot placeholder, filled with the new keywords on a hit.
+
+Only plans whose search succeeded are stored. Entries expire after
+MOSKAL_PLAN_CACHE_TTL seconds (default 1 day), because generated queries
+contain absolute dates.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+
+from utils.redis_client import redis_client
+
+PLAN_CACHE_PREFIX = "moskal_plan"
+PLAN_CACHE_TTL = int(os.getenv("MOSKAL_PLAN_CACHE_TTL", "86400"))
+PLAN_CACHE_ENABLED = os.getenv("MOSKAL_PLAN_CACHE_ENABLED", "true").lower() not in ("0", "false", "no", "off")
+
+# Kata pengisi yang tidak mengubah maksud pertanyaan
+FILLER_WORDS = {
+    "apa", "apakah", "bagaimana", "gimana", "tolong", "mohon", "coba", "dong", "ya", "sih", "kah",
+    "saya", "aku", "kami", "kita", "bisa", "bisakah", "berikan", "kasih", "tunjukkan", "tampilkan",
+    "tentang", "mengenai", "soal", "terkait", "yang", "di", "ke", "dari", "untuk", "dan", "atau",
+    "ini", "itu", "nya", "seperti", "adalah", "please", "show", "me", "tell", "give", "what",
+    "how", "is", "are", "the", "a", "an", "of", "about", "for", "on", "in", "and", "or", "can", "you"
+}
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+_stats = {"lookups": 0, "hits": 0}
+_stats_lock = threading.Lock()
+
+
+def _slot(index):
+    return f"__kw{index}__"
+
+
+def _keyword_pattern(keyword):
+    # Batas kata supaya keyword "pan" tidak mengganti "span"
+    return re.compile(r"(?<!\w)" + re.escape(keyword) + r"(?!\w)", re.IGNORECASE)
+
+
+def normalize_intent(user_query, keywords=None):
+    """
+    Order-insensitive form of a question with the keywords turned into slots
+
+    Parameters:
+    -----------
+    user_query : str
+        Question as typed by the user
+    keywords : list of str, optional
+        Request keywords (slot values), in order
+
+    Returns:
+    --------
+    str
+        e.g. "__kw0__ minggu sentimen" for "Bagaimana sentimen Prabowo minggu ini?"
+    """
+    text = user_query.lower()
+    for index, keyword in enumerate(keywords or []):
+        text = _keyword_pattern(keyword.lower()).sub(f" {_slot(index)} ", text)
+    words = {word for word in _WORD.findall(text) if word not in FILLER_WORDS}
+    return " ".join(sorted(words))
+
+
+def plan_key(user_query, keywords=None):
+    intent = normalize_intent(user_query, keywords)
+    payload = json.dumps({"intent": intent, "slots": len(keywords or [])}, sort_keys=True)
+    return f"{PLAN_CACHE_PREFIX}:{hashlib.sha1(payload.encode('utf-8')).hexdigest()}"
+
+
+def _to_template(value, keywords):
+    text = json.dumps(value, ensure_ascii=False)
+    # Keyword terpanjang dulu supaya "harga beras" tidak terpotong oleh "beras"
+    order = sorted(range(len(keywords)), key=lambda i: len(keywords[i]), reverse=True)
+    for index in order:
+        escaped = json.dumps(keywords[index], ensure_ascii=False)[1:-1]
+        text = _keyword_pattern(escaped).sub(_slot(index), text)
+    return text
+
+
+def _fill_template(text, keywords):
+    for index, keyword in enumerate(keywords):
+        text = text.replace(_slot(index), json.dumps(keyword, ensure_ascii=False)[1:-1])
+    return json.loads(text)
+
+
+def get_plan(user_query, keywords=None):
+    """
+    Cached (strategy, query) for the question, with the slots filled in
+
+    Returns:
+    --------
+    tuple or None
+        (strategy, elasticsearch_query), or None on a miss
+    """
+    if not PLAN_CACHE_ENABLED:
+        return None
+
+    keywords = list(keywords or [])
+    entry = redis_client.get(plan_key(user_query, keywords))
+    plan = None
+    if isinstance(entry, dict):
+        try:
+            plan = (_fill_template(entry["strategy"], keywords), _fill_template(entry["query"], keywords))
+        except (KeyError, ValueError) as e:
+            print(f"Invalid query plan in cache: {e}")
+
+    with _stats_lock:
+        _stats["lookups"] += 1
+        if plan is not None:
+            _stats["hits"] += 1
+    return plan
+
+
+def store_plan(user_query, keywords, strategy, query):
+    """
+    Store a validated plan as a template
+
+    Plans are only stored when every keyword slot appears in the query,
+    otherwise a hit could not apply the new keyword.
+    """
+    if not PLAN_CACHE_ENABLED:
+        return
+
+    keywords = list(keywords or [])
+    query_template = _to_template(query, keywords)
+    if any(_slot(index) not in query_template for index in range(len(keywords))):
+        return
+
+    redis_client.set_with_ttl(plan_key(user_query, keywords), {
+        "intent": normalize_intent(user_query, keywords),
+        "strategy": _to_template(strategy, keywords),
+        "query": query_template
+    }, ttl_seconds=PLAN_CACHE_TTL)
+
+
+def plan_cache_stats():
+    """Lookups, hits and hit rate of this worker since start"""
+    with _stats_lock:
+        lookups, hits = _stats["lookups"], _stats["hits"]
+    return {"lookups": lookups, "hits": hits, "hit_rate": round(hits / lookups, 3) if lookups else 0.0}
@@ -0,0 +1,80 @@
+"""
+Ranked List Paging
+
+Paged author endpoints (share of voice, most followers) rank every
+author once per filter combination. The ranked list is cached as a
+compact column/row array under a key without page and page_size, so
+any page is a slice of the cached list instead of a new aggregation.
+
+The ranked list itself is projected from the shared per-channel top
+authors (utils.author_metrics). For a shallow page (page * page_size up
+to RANKED_SHALLOW_MAX) the endpoints instead let Elasticsearch cut the
+page with `bucket_sort` and count the authors with a `cardinality`
+aggregation.
+"""
+
+import os
+
+RANKED_LIST_TTL = int(os.getenv("RANKED_LIST_TTL", "300"))
+# Halaman dengan offset + page_size sampai batas ini memakai jalur bucket_sort (0 = nonaktif)
+RANKED_SHALLOW_MAX = int(os.getenv("RANKED_SHALLOW_MAX", "50"))
+
+
+def pack_rows(items, columns):
+    """List of dicts -> {"columns": [...], "rows": [[...], ...]} (compact for Redis)"""
+    return {"columns": list(columns), "rows": [[item.get(column) for column in columns] for item in items]}
+
+
+def unpack_rows(packed, start=0, end=None):
+    """Rows start..end of a packed list back as dicts"""
+    columns = packed["columns"]
+    return [dict(zip(columns, row)) for row in packed["rows"][start:end]]
+
+
+def page_bounds(page, page_size):
+    start = (max(page, 1) - 1) * page_size
+    return start, start + page_size
+
+
+def pagination(page, page_size, total_items):
+    return {
+        "page": page,
+        "page_size": page_size,
+        "total_pages": (total_items + page_size - 1) // page_size if page_size else 0,  # ceiling division
+        "total_items": total_items
+    }
+
+
+def slice_page(packed, page, page_size):
+    """
+    One page of a packed ranked list
+
+    Returns:
+    --------
+    tuple
+        (list of dict for the page, pagination dict)
+    """
+    start, end = page_bounds(page, page_size)
+    total_items = len(packed["rows"])
+    return unpack_rows(packed, start, min(end, total_items)), pagination(page, page_size, total_items)
+
+
+def is_shallow(page, page_size, limit=None):
+    """
+    Whether a page is shallow enough for the bucket_sort path
+
+    The page must end within RANKED_SHALLOW_MAX and, when given, within
+    the per-channel `limit` of the full ranking.
+    """
+    _, end = page_bounds(page, page_size)
+    if RANKED_SHALLOW_MAX <= 0 or end > RANKED_SHALLOW_MAX:
+        return False
+    return limit is None or end <= limit
+
+
+def capped_author_count(channel_buckets, limit):
+    """
+    Authors in the full ranking: per channel the cardinality of username,
+    capped at `limit` (the size of the per-channel terms aggregation)
+    """
+    return sum(min(bucket["authors"]["value"], limit) for bucket in channel_buckets)
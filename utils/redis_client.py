@@ -1,32 +1,53 @@
 import os
 import json
 import logging
+import threading
 from redis import Redis
 from redis.exceptions import ConnectionError, RedisError
 from typing import Optional, Any, Tuple
 
+from utils.metrics import record_cache_lookup
+from utils.profiling import span
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class RedisClient:
     def __init__(self):
+        # Koneksi dibuat saat pertama kali dipakai, bukan saat import,
+        # supaya startup tidak menunggu timeout Redis
+        self._client = None
+        self._connect_attempted = False
+        self._lock = threading.Lock()
+
+    @property
+    def redis_client(self) -> Optional[Redis]:
+        if not self._connect_attempted:
+            with self._lock:
+                if not self._connect_attempted:
+                    self._client = self._connect()
+                    self._connect_attempted = True
+        return self._client
+
+    def _connect(self) -> Optional[Redis]:
         try:
             print('------------------connect to redis----------------')
-            self.redis_client = Redis(
+            client = Redis(
                 host=os.getenv('REDIS_HOST', 'localhost'),
                 port=int(os.getenv('REDIS_PORT', 6379)),
                 decode_responses=True,
                 socket_connect_timeout=5  # 5 seconds timeout for connection
             )
             # Test connection
-            self.redis_client.ping()
+            client.ping()
+            return client
         except ConnectionError as e:
             logger.error(f"Failed to connect to Redis: {e}")
-            self.redis_client = None
+            return None
         except Exception as e:
             logger.error(f"Unexpected error while connecting to Redis: {e}")
-            self.redis_client = None
+            return None
 
     def is_connected(self) -> bool:
         """
@@ -66,17 +87,25 @@ class RedisClient:
         Get value from Redis
         Returns: Optional[Any] - Returns None if key doesn't exist or if Redis is unavailable
         """
+        with span("cache_lookup", prefix=key.split(":", 1)[0]):
+            return self._get(key)
+
+    def _get(self, key: str) -> Optional[Any]:
         if not self.is_connected():
             logger.warning("Redis connection is not available, skipping cache get")
+            record_cache_lookup(key, "unavailable")
             return None
         
         try:
             value = self.redis_client.get(key)
             if value:
+                record_cache_lookup(key, "hit")
                 return json.loads(value)
+            record_cache_lookup(key, "miss")
             return None
         except (ConnectionError, RedisError) as e:
             logger.warning(f"Redis error while getting key: {e}")
+            record_cache_lookup(key, "unavailable")
             return None
         except Exception as e:
             logger.error(f"Unexpected error getting Redis key: {e}")
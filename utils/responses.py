@@ -0,0 +1,80 @@
+"""
+Response Utilities
+
+This module provides a fast JSON response class based on orjson that
+also understands the numpy / pandas values produced by the analytics
+modules (e.g. kol_overview).
+"""
+
+import datetime
+import decimal
+
+import orjson
+from fastapi.responses import JSONResponse
+
+from utils.profiling import current_profile
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def orjson_default(obj):
+    """
+    Fallback encoder for values orjson does not serialize natively
+
+    Parameters:
+    -----------
+    obj : Any
+        Value that orjson could not serialize
+
+    Returns:
+    --------
+    Any
+        JSON-compatible representation of the value
+    """
+    # numpy scalar yang tidak tertangani OPT_SERIALIZE_NUMPY (mis. float16)
+    if hasattr(obj, "item") and callable(obj.item):
+        return obj.item()
+
+    # pandas.NA / pandas.NaT
+    if type(obj).__name__ in ("NAType", "NaTType"):
+        return None
+
+    # pandas.Timestamp dan subclass datetime lainnya
+    if hasattr(obj, "isoformat") and callable(obj.isoformat):
+        return obj.isoformat()
+
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, datetime.timedelta):
+        return obj.total_seconds()
+
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content) -> bytes:
+    """Serialize content to JSON bytes using orjson"""
+    return orjson.dumps(content, default=orjson_default, option=ORJSON_OPTIONS)
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson
+
+    Returning this class directly from an endpoint skips FastAPI's
+    jsonable_encoder pass, which walks every dict in Python. For
+    `debug=profile` requests the body becomes {"data": ..., "profile": ...}.
+    """
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        profile = current_profile()
+        if profile is None:
+            return dumps(content)
+
+        # Mode debug=profile: bungkus data bersama profile tree tanpa encode ulang
+        with profile.span("serialization") as serialization:
+            body = dumps(content)
+        serialization.attrs["bytes"] = len(body)
+        return b'{"data":' + body + b',"profile":' + dumps(profile.to_dict()) + b'}'
@@ -0,0 +1,221 @@
+"""
+Rollup Index Utilities
+
+Shared pieces for precomputed daily rollup indices (see
+utils.author_rollup): a checkpoint per rollup stored in Elasticsearch,
+the list of days an incremental run has to (re)process, composite
+paging, bulk writes and the checks that decide whether a request can be
+answered from a rollup instead of the raw post indices.
+
+A rollup run recomputes whole days and writes documents with
+deterministic ids, so re-running a day overwrites it. Every run starts
+ROLLUP_LAG_DAYS before the last processed day to pick up posts that are
+indexed late (post_created_at in the past).
+"""
+
+import os
+import time
+from datetime import date, datetime, timedelta
+
+from elasticsearch import helpers
+
+ROLLUP_ENABLED = os.getenv("ROLLUP_ENABLED", "true").lower() not in ("0", "false", "no", "off")
+ROLLUP_STATE_INDEX = os.getenv("ROLLUP_STATE_INDEX", "rollup_state")
+# Hari terakhir yang selalu dihitung ulang (post yang terlambat masuk index)
+ROLLUP_LAG_DAYS = int(os.getenv("ROLLUP_LAG_DAYS", "2"))
+# Backfill awal saat rollup belum punya checkpoint
+ROLLUP_BACKFILL_DAYS = int(os.getenv("ROLLUP_BACKFILL_DAYS", "365"))
+# Umur maksimum data hari ini di rollup sebelum request kembali ke index mentah
+ROLLUP_MAX_STALENESS = int(os.getenv("ROLLUP_MAX_STALENESS", "3600"))
+ROLLUP_PAGE_SIZE = int(os.getenv("ROLLUP_PAGE_SIZE", "1000"))
+
+SENTIMENTS = ("positive", "negative", "neutral")
+
+# Checkpoint dibaca ulang dari Elasticsearch paling cepat tiap 60 detik
+_CHECKPOINT_CACHE_SECONDS = 60
+_checkpoint_cache = {}
+
+
+def day_string(value):
+    """'YYYY-MM-DD' of a date, datetime or date-like string"""
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%Y-%m-%d")
+    return str(value)[:10]
+
+
+def days_between(start_day, end_day):
+    """Every day from start_day to end_day (inclusive) as 'YYYY-MM-DD'"""
+    day = datetime.strptime(day_string(start_day), "%Y-%m-%d").date()
+    end = datetime.strptime(day_string(end_day), "%Y-%m-%d").date()
+    days = []
+    while day <= end:
+        days.append(day.strftime("%Y-%m-%d"))
+        day += timedelta(days=1)
+    return days
+
+
+def get_checkpoint(es, name, use_cache=True):
+    """
+    Checkpoint of a rollup
+
+    Returns:
+    --------
+    dict or None
+        {"first_day", "last_day", "updated_at"}: days first_day..last_day
+        are in the rollup, last_day was aggregated at updated_at (epoch
+        seconds). None when the rollup has never run.
+    """
+    cached = _checkpoint_cache.get(name)
+    if use_cache and cached and time.time() - cached[0] < _CHECKPOINT_CACHE_SECONDS:
+        return cached[1]
+    try:
+        response = es.get(index=ROLLUP_STATE_INDEX, id=name)
+        checkpoint = response.get("_source")
+    except Exception:
+        checkpoint = None
+    _checkpoint_cache[name] = (time.time(), checkpoint)
+    return checkpoint
+
+
+def save_checkpoint(es, name, checkpoint):
+    es.index(index=ROLLUP_STATE_INDEX, id=name, document=checkpoint, refresh=True)
+    _checkpoint_cache[name] = (time.time(), checkpoint)
+
+
+def pending_days(checkpoint, today=None, lag_days=ROLLUP_LAG_DAYS, backfill_days=ROLLUP_BACKFILL_DAYS):
+    """
+    Days an incremental run has to process, oldest first
+
+    Without a checkpoint this is the backfill window; otherwise it starts
+    lag_days before the last processed day and ends today.
+    """
+    today = today or date.today()
+    if checkpoint:
+        last = datetime.strptime(checkpoint["last_day"], "%Y-%m-%d").date()
+        start = max(last - timedelta(days=lag_days),
+                    datetime.strptime(checkpoint["first_day"], "%Y-%m-%d").date())
+    else:
+        start = today - timedelta(days=backfill_days)
+    return days_between(start, today)
+
+
+def rollup_covers(checkpoint, start_date, end_date, max_staleness=ROLLUP_MAX_STALENESS):
+    """
+    Whether the rollup holds every day of [start_date, end_date]
+
+    Days before last_day are complete. last_day itself (normally today)
+    is only used while its aggregation is younger than max_staleness
+    seconds.
+    """
+    if not checkpoint:
+        return False
+    start_day, end_day = day_string(start_date), day_string(end_date)
+    if start_day < checkpoint["first_day"] or end_day > checkpoint["last_day"]:
+        return False
+    if end_day == checkpoint["last_day"]:
+        return time.time() - checkpoint.get("updated_at", 0) <= max_staleness
+    return True
+
+
+def only_date_and_channel_filters(keywords=None, search_keyword=None, sentiment=None, importance="all mentions",
+                                  influence_score_min=None, influence_score_max=None, region=None,
+                                  language=None, domain=None, **_):
+    """
+    True when a request filters on nothing but the date range and channels
+
+    Any sentiment filter, even one listing every sentiment, rules the
+    rollup out: it drops posts with a missing or unexpected sentiment,
+    which the rollup totals include.
+    """
+    if keywords or search_keyword or sentiment or region or language or domain:
+        return False
+    if importance and importance != "all mentions":
+        return False
+    if influence_score_min is not None or influence_score_max is not None:
+        return False
+    return True
+
+
+def composite_buckets(es, index, query, sources, aggs, page_size=ROLLUP_PAGE_SIZE):
+    """
+    Iterate over every bucket of a composite aggregation (after_key paging)
+
+    Parameters:
+    -----------
+    query : dict
+        Query clause (not the whole body)
+    sources : list
+        Composite sources
+    aggs : dict
+        Sub-aggregations per bucket
+    """
+    composite = {"size": page_size, "sources": sources}
+    while True:
+        response = es.search(index=index, body={
+            "size": 0,
+            "track_total_hits": False,
+            "query": query,
+            "aggs": {"rollup": {"composite": composite, "aggs": aggs}}
+        })
+        result = response.get("aggregations", {}).get("rollup", {})
+        buckets = result.get("buckets", [])
+        for bucket in buckets:
+            yield bucket
+        after_key = result.get("after_key")
+        if not buckets or not after_key or len(buckets) < page_size:
+            return
+        composite = {**composite, "after": after_key}
+
+
+def bulk_index(es, index, documents):
+    """Index documents (each with an "_id") in bulk; returns the number written"""
+    actions = ({"_index": index, "_id": doc.pop("_id"), "_source": doc} for doc in documents)
+    written, errors = helpers.bulk(es, actions, raise_on_error=False, chunk_size=1000)
+    if errors:
+        print(f"Rollup bulk into {index}: {len(errors)} errors, first: {errors[0]}")
+    return written
+
+
+def ensure_index(es, index, mappings):
+    """Create the rollup index with its mappings when it does not exist"""
+    if not es.indices.exists(index=index):
+        es.indices.create(index=index, mappings=mappings)
+
+
+def run_incremental(es, name, index, mappings, build_day, today=None, backfill_days=ROLLUP_BACKFILL_DAYS):
+    """
+    Bring a rollup up to date
+
+    Parameters:
+    -----------
+    name : str
+        Checkpoint name
+    index : str
+        Rollup index
+    mappings : dict
+        Mappings of the rollup index
+    build_day : callable
+        build_day(es, day) -> list of rollup documents (with "_id") for one day
+    backfill_days : int
+        Days processed by the first run (no checkpoint yet)
+
+    Returns:
+    --------
+    dict
+        Final checkpoint
+    """
+    ensure_index(es, index, mappings)
+    checkpoint = get_checkpoint(es, name, use_cache=False)
+    days = pending_days(checkpoint, today, backfill_days=backfill_days)
+    if not checkpoint:
+        checkpoint = {"first_day": days[0], "last_day": None, "updated_at": 0}
+
+    for day in days:
+        started = time.time()
+        written = bulk_index(es, index, build_day(es, day))
+        print(f"Rollup {name}: {day} -> {written} documents")
+        # Checkpoint tidak mundur saat hari lag dihitung ulang
+        if checkpoint["last_day"] is None or day >= checkpoint["last_day"]:
+            checkpoint = {**checkpoint, "last_day": day, "updated_at": started}
+            save_checkpoint(es, name, checkpoint)
+    return checkpoint
@@ -1,12 +1,59 @@
 import json
-import pandas as pd
 from datetime import datetime
 from typing import Dict, List, Literal, Optional, Union
 
 # Import utilitas dari paket utils
+from utils.attribute_lookup import author_avatars
+from utils.author_metrics import get_channel_top_authors
+from utils.author_rollup import author_rollup_available, top_authors_per_channel
 from utils.es_client import get_elasticsearch_client
-from utils.es_query_builder import get_date_range
+from utils.es_query_builder import build_elasticsearch_query, get_date_range
 from utils.redis_client import redis_client
+from utils.metrics import instrument
+from utils.ranked_pages import (
+    RANKED_LIST_TTL, capped_author_count, is_shallow, pack_rows, page_bounds, pagination, slice_page
+)
+SOV_COLUMNS = ["channel", "username", "total_mentions", "total_reach", "percentage_share_of_voice", "user_image_url"]
+
+
+def _sov_item(channel, username, mentions, reach, user_image_url, total_mentions):
+    sov_percentage = (mentions / total_mentions) * 100 if total_mentions > 0 else 0
+
+    # Buat fallback user_image_url untuk channel news jika tidak ada
+    if channel == "news" and not user_image_url:
+        domain_name = username.replace("www.", "")
+        user_image_url = f"https://logo.clearbit.com/{domain_name}"
+
+    return {
+        "channel": channel,
+        "username": username,
+        "total_mentions": mentions,
+        "total_reach": reach,
+        "percentage_share_of_voice": round(sov_percentage, 2),
+        "user_image_url": user_image_url
+    }
+
+
+def _rank_share_of_voice(authors, limit, total_mentions):
+    """
+    Share of voice view of the top `limit` authors per channel
+    (utils.author_metrics.get_channel_top_authors), sorted by mentions,
+    packed with ranked_pages.pack_rows plus total_mentions
+    """
+    sov_data = [
+        _sov_item(row.channel, row.username, int(row.link_post), float(row.reach_score),
+                  row.user_image_url or None, total_mentions)
+        for row in top_authors_per_channel(authors, limit).itertuples()
+    ]
+
+    # Sortir berdasarkan total_mentions
+    sov_data.sort(key=lambda x: x["total_mentions"], reverse=True)
+    ranked = pack_rows(sov_data, SOV_COLUMNS)
+    ranked["total_mentions"] = total_mentions
+    return ranked
+
+
+@instrument()
 def get_share_of_voice(
     es_host=None,
     es_username=None,
@@ -74,6 +121,30 @@ def get_share_of_voice(
         print('Returning cached result')
         return cached_result
 
+    # Daftar lengkap yang sudah diranking, tanpa page/page_size di key
+    ranked_key = redis_client.generate_cache_key(
+        "get_share_of_voice_ranked",
+        keywords=keywords,
+        search_keyword=search_keyword,
+        search_exact_phrases=search_exact_phrases,
+        case_sensitive=case_sensitive,
+        start_date=start_date,
+        end_date=end_date,
+        date_filter=date_filter,
+        custom_start_date=custom_start_date,
+        custom_end_date=custom_end_date,
+        channels=channels,
+        sentiment=sentiment,
+        importance=importance,
+        influence_score_min=influence_score_min,
+        influence_score_max=influence_score_max,
+        region=region,
+        language=language,
+        domain=domain,
+        limit=limit
+    )
+    ranked = redis_client.get(ranked_key)
+
     # Buat koneksi Elasticsearch
     es = get_elasticsearch_client(
         es_host=es_host,
@@ -129,273 +200,86 @@ def get_share_of_voice(
             custom_end_date=custom_end_date
         )
     
-    # Bangun query untuk mendapatkan jumlah mentions per username
-    must_conditions = [
-        {
-            "range": {
-                "post_created_at": {
-                    "gte": start_date,
-                    "lte": end_date
-                }
-            }
-        }
-    ]
-    
-    # Add keyword and search_keyword filters
-    if keywords or search_keyword:
-        must_conditions_inner = []
-        
-        # Handle regular keywords
-        if keywords:
-            # Konversi keywords ke list jika belum
-            keyword_list = keywords if isinstance(keywords, list) else [keywords]
-            keyword_should_conditions = []
-            
-            # Tentukan field yang akan digunakan berdasarkan case_sensitive
-            caption_field = "post_caption.keyword" if case_sensitive else "post_caption"
-            issue_field = "cluster.keyword" if case_sensitive else "cluster"
-            
-            if search_exact_phrases:
-                # Gunakan match_phrase untuk exact matching
-                for kw in keyword_list:
-                    keyword_should_conditions.extend([
-                        {"match_phrase": {caption_field: kw}},
-                        {"match_phrase": {issue_field: kw}}
-                    ])
-            else:
-                # Gunakan match dengan operator AND
-                for kw in keyword_list:
-                    keyword_should_conditions.extend([
-                        {"match": {caption_field: {"query": kw, "operator": "AND"}}},
-                        {"match": {issue_field: {"query": kw, "operator": "AND"}}}
-                    ])
-            
-            must_conditions_inner.append({
-                "bool": {
-                    "should": keyword_should_conditions,
-                    "minimum_should_match": 1
-                }
-            })
-        
-        # Handle search_keyword with same logic as keywords
-        if search_keyword:
-            # Konversi search_keyword ke list jika belum
-            search_keyword_list = search_keyword if isinstance(search_keyword, list) else [search_keyword]
-            search_keyword_should_conditions = []
-            
-            # Tentukan field yang akan digunakan berdasarkan case_sensitive
-            caption_field = "post_caption.keyword" if case_sensitive else "post_caption"
-            issue_field = "cluster.keyword" if case_sensitive else "cluster"
-            
-            if search_exact_phrases:
-                # Gunakan match_phrase untuk exact matching
-                for sk in search_keyword_list:
-                    search_keyword_should_conditions.extend([
-                        {"match_phrase": {caption_field: sk}},
-                        {"match_phrase": {issue_field: sk}}
-                    ])
-            else:
-                # Gunakan match dengan operator AND
-                for sk in search_keyword_list:
-                    search_keyword_should_conditions.extend([
-                        {"match": {caption_field: {"query": sk, "operator": "AND"}}},
-                        {"match": {issue_field: {"query": sk, "operator": "AND"}}}
-                    ])
-            
-            must_conditions_inner.append({
-                "bool": {
-                    "should": search_keyword_should_conditions,
-                    "minimum_should_match": 1
-                }
-            })
-        
-        # Add the combined conditions to must_conditions
-        must_conditions.append({
-            "bool": {
-                "must": must_conditions_inner
-            }
-        })
-
-    # Bangun filter untuk query
-    filter_conditions = []
+    # Filter request; top author per channel dibagi dengan most followers
+    # (lihat utils.author_metrics)
+    filters = dict(
+        keywords=keywords, search_keyword=search_keyword, search_exact_phrases=search_exact_phrases,
+        case_sensitive=case_sensitive, sentiment=sentiment, importance=importance,
+        influence_score_min=influence_score_min, influence_score_max=influence_score_max,
+        region=region, language=language, domain=domain
+    )
     
-    # Filter untuk importance
-    if importance == "important mentions":
-        filter_conditions.append({
-            "range": {
-                "influence_score": {
-                    "gt": 50
-                }
-            }
-        })
-        
-    # Filter untuk influence score
-    if influence_score_min is not None or influence_score_max is not None:
-        influence_condition = {"range": {"influence_score": {}}}
-        if influence_score_min is not None:
-            influence_condition["range"]["influence_score"]["gte"] = influence_score_min
-        if influence_score_max is not None:
-            influence_condition["range"]["influence_score"]["lte"] = influence_score_max
-        filter_conditions.append(influence_condition)
-        
-    # Filter untuk region menggunakan wildcard
-    if region:
-        region_conditions = []
-        region_list = region if isinstance(region, list) else [region]
-        
-        for r in region_list:
-            region_conditions.append({"wildcard": {"region": f"*{r}*"}})
-        
-        region_filter = {
-            "bool": {
-                "should": region_conditions,
-                "minimum_should_match": 1
-            }
-        }
-        filter_conditions.append(region_filter)
-        
-    # Filter untuk language menggunakan wildcard
-    if language:
-        language_conditions = []
-        language_list = language if isinstance(language, list) else [language]
-        
-        for l in language_list:
-            language_conditions.append({"wildcard": {"language": f"*{l}*"}})
-        
-        language_filter = {
-            "bool": {
-                "should": language_conditions,
-                "minimum_should_match": 1
-            }
-        }
-        filter_conditions.append(language_filter)
-        
-    # Filter untuk domain
-    if domain:
-        domain_condition = {
-            "bool": {
-                "should": [{"wildcard": {"link_post": f"*{d}*"}} for d in (domain if isinstance(domain, list) else [domain])],
-                "minimum_should_match": 1
-            }
-        }
-        filter_conditions.append(domain_condition)
+    try:
 
-    if sentiment:
-        sentiment_condition = {
-            "terms": {
-                "sentiment": sentiment if isinstance(sentiment, list) else [sentiment]
-            }
-        }
-        filter_conditions.append(sentiment_condition)
-           
-    # Gabungkan semua kondisi ke dalam query utama
-    query = {
-        "size": 0,  # Kita hanya perlu agregasi
-        "query": {
-            "bool": {
-                "must": must_conditions
-            }
-        },
-        "aggs": {
-            "by_channel": {
-                "terms": {
-                    "field": "channel",
-                    "size": len(selected_channels)
-                },
-                "aggs": {
-                    "by_username": {
-                        "terms": {
-                            "field": "username",
-                            "size": limit
+        if ranked is None and is_shallow(page, page_size, limit) and \
+                not author_rollup_available(es, start_date, end_date, **filters):
+            # Halaman dangkal: Elasticsearch memotong halaman (bucket_sort),
+            # jumlah author dari cardinality
+            start_index, end_index = page_bounds(page, page_size)
+            query = build_elasticsearch_query(start_date=start_date, end_date=end_date, size=0, **filters)
+            query["aggs"] = {
+                "page": {
+                    "multi_terms": {
+                        "terms": [{"field": "channel"}, {"field": "username"}],
+                        "size": end_index,
+                        "order": {"_count": "desc"}
+                    },
+                    "aggs": {
+                        "total_reach": {
+                            "sum": {
+                                "field": "reach_score"
+                            }
                         },
-                        "aggs": {
-                            "total_reach": {
-                                "sum": {
-                                    "field": "reach_score"
-                                }
-                            },
-                            "top_hits": {
-                                "top_hits": {
-                                    "size": 1,
-                                    "_source": ["user_image_url"]
-                                }
+                        "page_sort": {
+                            "bucket_sort": {
+                                "from": start_index,
+                                "size": page_size
                             }
                         }
                     }
-                }
-            },
-            "total_mentions": {
-                "value_count": {
-                    "field": "link_post"
+                },
+                "by_channel": {
+                    "terms": {
+                        "field": "channel",
+                        "size": len(selected_channels)
+                    },
+                    "aggs": {
+                        "authors": {
+                            "cardinality": {
+                                "field": "username"
+                            }
+                        }
+                    }
+                },
+                "total_mentions": {
+                    "value_count": {
+                        "field": "link_post"
+                    }
                 }
             }
-        }
-    }
-    
-    # Tambahkan filter jika ada
-    if filter_conditions:
-        query["query"]["bool"]["filter"] = filter_conditions
-    
-    try:
-
-        import json
-        #print(json.dumps(query, indent=2))
-        # Jalankan query
-        response = es.search(
-            index=",".join(indices),
-            body=query
-        )
-        
-        # Proses hasil untuk mendapatkan share of voice
-        channel_buckets = response["aggregations"]["by_channel"]["buckets"]
-        total_mentions = response["aggregations"]["total_mentions"]["value"]
-        
-        # Kumpulkan data dari semua channel
-        sov_data = []
-        
-        for channel_bucket in channel_buckets:
-            channel = channel_bucket["key"]
-            username_buckets = channel_bucket["by_username"]["buckets"]
-            
-            for username_bucket in username_buckets:
-                username = username_bucket["key"]
-                mentions = username_bucket["doc_count"]
-                reach = username_bucket["total_reach"]["value"]
-                
-                # Ambil user_image_url dari top_hits
-                user_image_url = None
-                if "top_hits" in username_bucket and username_bucket["top_hits"]["hits"]["hits"]:
-                    hit = username_bucket["top_hits"]["hits"]["hits"][0]
-                    if "_source" in hit and "user_image_url" in hit["_source"]:
-                        user_image_url = hit["_source"]["user_image_url"]
-                
-                sov_percentage = (mentions / total_mentions) * 100 if total_mentions > 0 else 0
-                
-                # Buat fallback user_image_url untuk channel news jika tidak ada
-                if channel == "news" and not user_image_url:
-                    domain_name = username.replace("www.", "")
-                    user_image_url = f"https://logo.clearbit.com/{domain_name}"
-                
-                sov_data.append({
-                    "channel": channel,
-                    "username": username,
-                    "total_mentions": mentions,
-                    "total_reach": reach,
-                    "percentage_share_of_voice": round(sov_percentage, 2),
-                    "user_image_url": user_image_url
-                })
-        
-        # Sortir berdasarkan total_mentions
-        sov_data.sort(key=lambda x: x["total_mentions"], reverse=True)
-        
-        # Pagination
-        total_items = len(sov_data)
-        total_pages = (total_items + page_size - 1) // page_size  # ceiling division
-        
-        start_index = (page - 1) * page_size
-        end_index = min(start_index + page_size, total_items)
-        
-        paginated_data = sov_data[start_index:end_index]
+            response = es.search(
+                index=",".join(indices),
+                body=query
+            )
+            aggregations = response["aggregations"]
+            total_mentions = aggregations["total_mentions"]["value"]
+            # Avatar hanya untuk author di halaman ini (lihat utils.attribute_lookup)
+            avatars = author_avatars(es, indices, [tuple(bucket["key"][:2]) for bucket in aggregations["page"]["buckets"]])
+            paginated_data = [
+                _sov_item(bucket["key"][0], bucket["key"][1], bucket["doc_count"],
+                          bucket["total_reach"]["value"], avatars.get(tuple(bucket["key"][:2])), total_mentions)
+                for bucket in aggregations["page"]["buckets"]
+            ]
+            page_info = pagination(page, page_size,
+                                   capped_author_count(aggregations["by_channel"]["buckets"], limit))
+        else:
+            if ranked is None:
+                authors, total_mentions = get_channel_top_authors(es, indices, selected_channels,
+                                                                  start_date, end_date, limit, **filters)
+                ranked = _rank_share_of_voice(authors, limit, total_mentions)
+                redis_client.set_with_ttl(ranked_key, ranked, ttl_seconds=RANKED_LIST_TTL)
+            paginated_data, page_info = slice_page(ranked, page, page_size)
+            total_mentions = ranked["total_mentions"]
         
         # Format username
         for item in paginated_data:
@@ -405,12 +289,7 @@ def get_share_of_voice(
         # Buat hasil dengan informasi pagination
         result = {
             "data": paginated_data,
-            "pagination": {
-                "page": page,
-                "page_size": page_size,
-                "total_pages": total_pages,
-                "total_items": total_items
-            }
+            "pagination": page_info
         }
         
         # Tambahkan daftar channel yang digunakan
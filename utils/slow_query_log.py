@@ -0,0 +1,199 @@
+"""
+Slow Query Log
+
+Every Elasticsearch call made through the instrumented client whose wall
+time exceeds ES_SLOW_QUERY_MS is recorded with the endpoint, the utils
+function, a fingerprint of its normalized parameters, the index list, the
+query body (and its hash), `took`, hit count and response size.
+
+Records are kept in an in-memory ring buffer (exposed at
+/debug/slow-queries) and, when ES_SLOW_QUERY_LOG is set, appended as
+NDJSON to a rotating log file.
+
+Environment variables:
+- ES_SLOW_QUERY_MS: threshold in milliseconds (default 1000, negative disables)
+- ES_SLOW_QUERY_BUFFER: number of records kept in memory (default 200)
+- ES_SLOW_QUERY_LOG: path of the NDJSON log file (optional)
+- ES_SLOW_QUERY_LOG_MAX_BYTES / ES_SLOW_QUERY_LOG_BACKUPS: rotation settings
+"""
+
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+
+from utils.metrics import current_operation, current_params, current_route
+
+SLOW_QUERY_MS = float(os.getenv("ES_SLOW_QUERY_MS", "1000"))
+BUFFER_SIZE = int(os.getenv("ES_SLOW_QUERY_BUFFER", "200"))
+LOG_PATH = os.getenv("ES_SLOW_QUERY_LOG")
+LOG_MAX_BYTES = int(os.getenv("ES_SLOW_QUERY_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUPS = int(os.getenv("ES_SLOW_QUERY_LOG_BACKUPS", "5"))
+
+# Parameter koneksi tidak ikut fingerprint (dan tidak boleh tersimpan di log)
+_EXCLUDED_PARAMS = {"es_host", "es_username", "es_password", "use_ssl", "verify_certs", "ca_certs"}
+
+_buffer = collections.deque(maxlen=BUFFER_SIZE)
+_lock = threading.Lock()
+
+
+def _build_file_logger():
+    if not LOG_PATH:
+        return None
+    try:
+        handler = RotatingFileHandler(LOG_PATH, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+    except OSError as e:
+        print(f"Slow query log disabled, cannot open {LOG_PATH}: {e}")
+        return None
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    file_logger = logging.getLogger("moskal.slow_query")
+    file_logger.setLevel(logging.INFO)
+    file_logger.propagate = False
+    file_logger.addHandler(handler)
+    return file_logger
+
+
+_file_logger = _build_file_logger()
+
+
+def _stable_json(value):
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def _hash(value):
+    return hashlib.sha1(_stable_json(value).encode("utf-8")).hexdigest()[:16]
+
+
+def normalize_params(params):
+    """
+    Normalize utils function parameters for fingerprinting
+
+    Connection parameters and empty values are dropped and list values
+    are sorted, so equivalent filter combinations share a fingerprint.
+    """
+    if not params:
+        return {}
+    normalized = {}
+    for key, value in params.items():
+        if key in _EXCLUDED_PARAMS or value is None or value == [] or value == "":
+            continue
+        if isinstance(value, (list, tuple, set)):
+            value = sorted(value, key=str)
+        normalized[key] = value
+    return normalized
+
+
+def _query_body(kwargs):
+    body = kwargs.get("body")
+    if body is None:
+        body = {k: v for k, v in kwargs.items() if k not in ("index", "headers", "params")}
+    if isinstance(body, dict) and "profile" in body:
+        # Flag dari mode debug=profile bukan bagian dari query
+        body = {k: v for k, v in body.items() if k != "profile"}
+    return body
+
+
+def _indices(kwargs):
+    index = kwargs.get("index")
+    if not index:
+        return []
+    if isinstance(index, str):
+        return index.split(",")
+    return list(index)
+
+
+def _response_stats(response):
+    body = getattr(response, "body", response)
+    took = hits = None
+    if isinstance(body, dict):
+        took = body.get("took")
+        total = body.get("hits", {}).get("total")
+        hits = total.get("value") if isinstance(total, dict) else total
+
+    size = None
+    headers = getattr(getattr(response, "meta", None), "headers", None)
+    if headers is not None:
+        content_length = headers.get("content-length")
+        if content_length and str(content_length).isdigit():
+            size = int(content_length)
+    return took, hits, size
+
+
+def maybe_record(method, kwargs, wall_seconds, response=None, error=None):
+    """
+    Record an Elasticsearch call if it exceeded the slow query threshold
+
+    Parameters:
+    -----------
+    method : str
+        Client method name ('search', 'msearch', 'scroll', 'count')
+    kwargs : dict
+        Keyword arguments passed to the client method
+    wall_seconds : float
+        Client-side wall time of the call
+    response : ObjectApiResponse, optional
+        Elasticsearch response (None when the call failed)
+    error : str, optional
+        Exception class name when the call failed
+    """
+    wall_ms = wall_seconds * 1000
+    if SLOW_QUERY_MS < 0 or wall_ms < SLOW_QUERY_MS:
+        return
+
+    params = normalize_params(current_params())
+    body = _query_body(kwargs)
+    took, hits, size = _response_stats(response)
+
+    record = {
+        "ts": datetime.now(timezone.utc).isoformat(),
+        "endpoint": current_route(),
+        "operation": current_operation(),
+        "method": method,
+        "params_fingerprint": _hash(params),
+        "params": params,
+        "indices": _indices(kwargs),
+        "body_hash": _hash(body),
+        "wall_ms": round(wall_ms, 1),
+        "took_ms": took,
+        "hits": hits,
+        "response_bytes": size,
+        "error": error,
+        "body": body
+    }
+
+    with _lock:
+        _buffer.append(record)
+    if _file_logger is not None:
+        _file_logger.info(_stable_json(record))
+
+
+def get_slow_queries(limit=50, endpoint=None, operation=None):
+    """
+    Most recent slow queries, newest first
+
+    Parameters:
+    -----------
+    limit : int
+        Maximum number of records returned
+    endpoint : str, optional
+        Only return records for this route template
+    operation : str, optional
+        Only return records for this utils function
+    """
+    with _lock:
+        records = list(_buffer)
+    records.reverse()
+    if endpoint:
+        records = [r for r in records if r["endpoint"] == endpoint]
+    if operation:
+        records = [r for r in records if r["operation"] == operation]
+    return {
+        "threshold_ms": SLOW_QUERY_MS,
+        "buffer_size": BUFFER_SIZE,
+        "count": len(records[:limit]),
+        "queries": records[:limit]
+    }
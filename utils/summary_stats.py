@@ -5,8 +5,29 @@ from typing import Dict
 # Import utilitas dari paket utils
 from utils.es_client import get_elasticsearch_client
 from utils.es_query_builder import get_date_range
+from utils.mentions_rollup import daily_totals, mentions_rollup_set
 from utils.redis_client import redis_client
+from utils.metrics import instrument
 
+
+def _rollup_series(totals, field, **extra):
+    """
+    Time series of one mentions_daily metric in the shape of the raw
+    date_histogram buckets: days without a value at the start and end are
+    dropped, extra maps output keys to other metrics of the same day
+    """
+    days = totals["days"]
+    counted = [i for i, day in enumerate(days) if day[field]]
+    if not counted:
+        return []
+    return [{
+        "date": day["date"],
+        "value": int(day[field]),
+        **{name: day[metric] for name, metric in extra.items()}
+    } for day in days[counted[0]:counted[-1] + 1]]
+
+
+@instrument()
 def get_stats_summary(
     es_host=None,
     es_username=None,
@@ -145,6 +166,31 @@ def get_stats_summary(
     previous_start_str = previous_start.strftime("%Y-%m-%d")
     previous_end_str = previous_end.strftime("%Y-%m-%d")
     
+    # Tanpa filter selain tanggal, channel dan keywords: pakai rollup mentions_daily
+    # (periode sebelumnya harus ikut tercakup)
+    use_rollup = False
+    rollup_set = mentions_rollup_set(
+        es, previous_start_str if compare_with_previous else start_date, end_date, keywords=keywords,
+        search_keyword=search_keyword, search_exact_phrases=search_exact_phrases, case_sensitive=case_sensitive,
+        sentiment=sentiment, importance=importance, influence_score_min=influence_score_min,
+        influence_score_max=influence_score_max, region=region, language=language, domain=domain
+    )
+    if rollup_set:
+        try:
+            rollup = {}
+            for group, group_indices, group_channels in (("non_social", non_social_indices, non_social_channels),
+                                                         ("social", social_media_indices, social_media_channels),
+                                                         ("video", video_indices, video_channels)):
+                if group_indices:
+                    rollup[group] = (
+                        daily_totals(es, rollup_set, group_channels, start_date, end_date),
+                        daily_totals(es, rollup_set, group_channels, previous_start_str, previous_end_str)
+                        if compare_with_previous else None
+                    )
+            use_rollup = True
+        except Exception as e:
+            print(f"Mentions rollup failed, using raw indices: {e}")
+    
     # Bangun query dasar
     def build_base_query(query_start_date, query_end_date):
         must_conditions = [
@@ -437,7 +483,12 @@ def get_stats_summary(
         previous_video_query = build_video_query(previous_metrics_query)
     
     # === QUERY UNTUK NON-SOCIAL MEDIA ===
-    if non_social_indices:
+    if use_rollup and non_social_indices:
+        current, previous = rollup["non_social"]
+        current_non_social_mentions = int(current["totals"]["link_count"])
+        current_non_social_time_series = _rollup_series(current, "mentions")
+        previous_non_social_mentions = int(previous["totals"]["link_count"]) if previous else 0
+    elif non_social_indices:
         # Current period
         current_non_social_response = es.search(
             index=",".join(non_social_indices),
@@ -462,7 +513,16 @@ def get_stats_summary(
         previous_non_social_mentions = 0
 
     # === QUERY UNTUK SOCIAL MEDIA ===
-    if social_media_indices:
+    if use_rollup and social_media_indices:
+        current, previous = rollup["social"]
+        current_social_mentions = int(current["totals"]["link_count"])
+        current_social_likes = current["totals"]["likes_sum"]
+        current_social_shares = current["totals"]["shares_sum"]
+        current_social_time_series = _rollup_series(current, "mentions", likes="likes_sum", shares="shares_sum")
+        previous_social_mentions = int(previous["totals"]["link_count"]) if previous else 0
+        previous_social_likes = previous["totals"]["likes_sum"] if previous else 0
+        previous_social_shares = previous["totals"]["shares_sum"] if previous else 0
+    elif social_media_indices:
         # Current period
         current_social_response = es.search(
             index=",".join(social_media_indices),
@@ -500,7 +560,12 @@ def get_stats_summary(
         previous_social_shares = 0
 
     # === QUERY UNTUK VIDEO ===
-    if video_indices:
+    if use_rollup and video_indices:
+        current, previous = rollup["video"]
+        current_video_mentions = int(current["totals"]["video_mentions"])
+        current_video_time_series = _rollup_series(current, "video_mentions")
+        previous_video_mentions = int(previous["totals"]["video_mentions"]) if previous else 0
+    elif video_indices:
         # Current period
         current_video_response = es.search(
             index=",".join(video_indices),
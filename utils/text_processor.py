@@ -7,8 +7,6 @@ stopwords handling and text preprocessing.
 
 import re
 import string
-import nltk
-from nltk.corpus import stopwords
 
 def get_stopwords():
     """
@@ -19,6 +17,10 @@ def get_stopwords():
     set
         Combined set of Indonesian and English stopwords
     """
+    # nltk di-import di sini agar tidak ikut dimuat saat startup
+    import nltk
+    from nltk.corpus import stopwords
+
     try:
         nltk.data.find('corpora/stopwords')
     except LookupError:
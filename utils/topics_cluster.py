@@ -1,10 +1,10 @@
 import json
 import re
-import pandas as pd
 from datetime import datetime
 from typing import Dict, List, Literal, Optional, Union
 
 # Import utilitas dari paket utils
+from utils.attribute_lookup import cluster_descriptions
 from utils.es_client import get_elasticsearch_client
 from utils.es_query_builder import (
     build_elasticsearch_query,
@@ -12,8 +12,10 @@ from utils.es_query_builder import (
     get_date_range
 )
 from utils.redis_client import redis_client
+from utils.metrics import instrument
 from utils.script_score import script_score
 
+@instrument()
 def get_topics_cluster(
     es_host=None,
     es_username=None,
@@ -140,14 +142,6 @@ def get_topics_cluster(
                     "size": cluster_size
                 },
                 "aggs": {
-                    "cluster_description": {
-                        "top_hits": {
-                            "_source": {
-                                "includes": ["cluster_description"]
-                            },
-                            "size": 1
-                        }
-                    },
                     "total_mentions": {
                         "value_count": {
                             "field": "cluster.keyword"
@@ -203,14 +197,17 @@ def get_topics_cluster(
         for bucket in response["aggregations"]["unique_clusters"]["buckets"]:
             total_all_posts += bucket["total_mentions"]["value"]
         
+        # Deskripsi cluster dalam satu lookup (lihat utils.attribute_lookup)
+        descriptions = cluster_descriptions(
+            es, indices, [bucket["key"] for bucket in response["aggregations"]["unique_clusters"]["buckets"]]
+        )
+        
         for bucket in response["aggregations"]["unique_clusters"]["buckets"]:
             cluster_name = bucket["key"]
             total_posts = bucket["total_mentions"]["value"]
             
             # Get cluster description
-            description = ""
-            if bucket["cluster_description"]["hits"]["hits"]:
-                description = bucket["cluster_description"]["hits"]["hits"][0]["_source"].get("cluster_description", "")
+            description = descriptions.get(cluster_name, "")
             
             # Get sentiment counts
             positive_count = bucket["sentiment_positive"]["doc_count"]
@@ -1,11 +1,21 @@
-from utils.list_of_mentions import get_mentions
+from utils.es_client import get_elasticsearch_client
+from utils.es_query_builder import build_elasticsearch_query, get_indices_from_channels, get_date_range
 from utils.gemini import call_gemini
 from utils.redis_client import redis_client
-import pandas as pd
+from utils.metrics import instrument
+from utils.prompt_context import PROMPT_TOKEN_BUDGET, build_post_context
 import re
 import json
 
-def get_topics_sentiment_analysis(
+# Field yang dibutuhkan prompt
+PROMPT_SOURCE_FIELDS = [
+    "post_caption", "channel",
+    "likes", "comments", "replies", "shares", "retweets", "views"
+]
+TOP_POSTS_PER_SENTIMENT = 50
+
+
+def fetch_top_posts_by_sentiment(
     es_host=None,
     es_username=None,
     es_password=None,
@@ -16,7 +26,6 @@ def get_topics_sentiment_analysis(
     search_keyword=None,
     search_exact_phrases=False,
     case_sensitive=False,
-    sentiment=None,
     start_date=None,
     end_date=None,
     date_filter="last 30 days",
@@ -28,45 +37,128 @@ def get_topics_sentiment_analysis(
     influence_score_max=None,
     region=None,
     language=None,
-    domain=None
+    domain=None,
+    size=TOP_POSTS_PER_SENTIMENT
 ):
+    """
+    Top positive and negative posts by viral_score in a single search
 
-    # Generate cache key based on all parameters
-    cache_key = redis_client.generate_cache_key(
-        "topics_sentiment_analysis",
+    A `filters` aggregation splits the matching posts by sentiment and a
+    `top_hits` sub-aggregation sorted on the stored viral_score returns
+    the best `size` posts of each, with only PROMPT_SOURCE_FIELDS.
+
+    Returns:
+    --------
+    dict
+        {'positive': [_source, ...], 'negative': [_source, ...]}
+    """
+    empty = {"positive": [], "negative": []}
+
+    es = get_elasticsearch_client(
         es_host=es_host,
         es_username=es_username,
         es_password=es_password,
         use_ssl=use_ssl,
         verify_certs=verify_certs,
-        ca_certs=ca_certs,
+        ca_certs=ca_certs
+    )
+    if not es:
+        return empty
+
+    indices = get_indices_from_channels(channels)
+    if not indices:
+        print("Error: Tidak ada indeks yang valid")
+        return empty
+
+    if not start_date or not end_date:
+        start_date, end_date = get_date_range(
+            date_filter=date_filter,
+            custom_start_date=custom_start_date,
+            custom_end_date=custom_end_date
+        )
+
+    query = build_elasticsearch_query(
         keywords=keywords,
         search_keyword=search_keyword,
         search_exact_phrases=search_exact_phrases,
         case_sensitive=case_sensitive,
-        sentiment=sentiment,
+        sentiment=["positive", "negative"],
         start_date=start_date,
         end_date=end_date,
-        date_filter=date_filter,
-        custom_start_date=custom_start_date,
-        custom_end_date=custom_end_date,
-        channels=channels,
         importance=importance,
         influence_score_min=influence_score_min,
         influence_score_max=influence_score_max,
         region=region,
         language=language,
-        domain=domain
+        domain=domain,
+        size=0
     )
+    # Sama seperti get_mentions: hanya post yang punya viral_score
+    query["query"]["bool"]["filter"].append({"exists": {"field": "viral_score"}})
+    query["track_total_hits"] = False
+    query["aggs"] = {
+        "by_sentiment": {
+            "filters": {
+                "filters": {
+                    "positive": {"term": {"sentiment": "positive"}},
+                    "negative": {"term": {"sentiment": "negative"}}
+                }
+            },
+            "aggs": {
+                "top_posts": {
+                    "top_hits": {
+                        "size": size,
+                        "sort": [{"viral_score": {"order": "desc"}}],
+                        "_source": PROMPT_SOURCE_FIELDS
+                    }
+                }
+            }
+        }
+    }
 
-    # Try to get from cache first
-    cached_result = redis_client.get(cache_key)
-    if cached_result is not None:
-        print('Returning cached result')
-        return cached_result
+    try:
+        response = es.search(index=",".join(indices), body=query)
+    except Exception as e:
+        print(f"Error querying Elasticsearch: {e}")
+        return empty
+
+    buckets = response.get("aggregations", {}).get("by_sentiment", {}).get("buckets", {})
+    return {
+        sentiment: [hit["_source"] for hit in buckets.get(sentiment, {}).get("top_posts", {}).get("hits", {}).get("hits", [])]
+        for sentiment in ("positive", "negative")
+    }
+
+
+@instrument()
+def get_topics_sentiment_analysis(
+    es_host=None,
+    es_username=None,
+    es_password=None,
+    use_ssl=False,
+    verify_certs=False,
+    ca_certs=None,
+    keywords=None,
+    search_keyword=None,
+    search_exact_phrases=False,
+    case_sensitive=False,
+    sentiment=None,
+    start_date=None,
+    end_date=None,
+    date_filter="last 30 days",
+    custom_start_date=None,
+    custom_end_date=None,
+    channels=None,
+    importance="all mentions",
+    influence_score_min=None,
+    influence_score_max=None,
+    region=None,
+    language=None,
+    domain=None
+):
 
-    # Mendapatkan post positif
-    post_positive = get_mentions(
+    # Generate cache key based on all parameters
+    cache_key = redis_client.generate_cache_key(
+        "topics_sentiment_analysis",
         es_host=es_host,
         es_username=es_username,
         es_password=es_password,
@@ -77,7 +169,7 @@ def get_topics_sentiment_analysis(
         search_keyword=search_keyword,
         search_exact_phrases=search_exact_phrases,
         case_sensitive=case_sensitive,
-        sentiment=['positive'],
+        sentiment=sentiment,
         start_date=start_date,
         end_date=end_date,
         date_filter=date_filter,
@@ -89,16 +181,17 @@ def get_topics_sentiment_analysis(
         influence_score_max=influence_score_max,
         region=region,
         language=language,
-        domain=domain,
-        sort_type="viral_score",  # Sort berdasarkan viral_score
-        sort_order="desc",
-        is_print = False,
-    page=1,
-    page_size=50
+        domain=domain
     )
 
-    # Mendapatkan post negatif
-    post_negative = get_mentions(
+    # Try to get from cache first
+    cached_result = redis_client.get(cache_key)
+    if cached_result is not None:
+        print('Returning cached result')
+        return cached_result
+
+    # Post positif dan negatif teratas diambil dalam satu request ES
+    top_posts = fetch_top_posts_by_sentiment(
         es_host=es_host,
         es_username=es_username,
         es_password=es_password,
@@ -109,7 +202,6 @@ def get_topics_sentiment_analysis(
         search_keyword=search_keyword,
         search_exact_phrases=search_exact_phrases,
         case_sensitive=case_sensitive,
-        sentiment=['negative'],
         start_date=start_date,
         end_date=end_date,
         date_filter=date_filter,
@@ -121,21 +213,22 @@ def get_topics_sentiment_analysis(
         influence_score_max=influence_score_max,
         region=region,
         language=language,
-        domain=domain,
-        sort_type="viral_score",  # Sort berdasarkan viral_score
-        sort_order="desc",
-        page=1,
-    page_size=50
+        domain=domain
     )
 
+    # Konteks ringkas: caption + channel + engagement, duplikat digabung,
+    # masing-masing sentimen mendapat separuh budget token
+    positive_context = build_post_context(top_posts['positive'], token_budget=PROMPT_TOKEN_BUDGET // 2)
+    negative_context = build_post_context(top_posts['negative'], token_budget=PROMPT_TOKEN_BUDGET // 2)
+
     # Menyusun prompt untuk Gemini
     prompt = f"""Kamu adalah seorang Ahli Analisis Media Sosial. Tugasmu adalah menganalisis dan merangkum isi konten berdasarkan daftar postingan media sosial yang disediakan di bawah ini. Postingan telah dibagi menjadi dua kategori berdasarkan sentimen:
 
     POSTINGAN POSITIF
-    {post_positive['data']}
+{positive_context}
 
     POSTINGAN NEGATIF
-    {post_negative['data']}
+{negative_context}
 
     OUTPUT (dalam format JSON):
     {{
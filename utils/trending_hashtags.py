@@ -1,4 +1,5 @@
 import json
+import re
 from datetime import datetime
 from typing import Dict, List, Literal, Optional, Union
 
@@ -6,9 +7,38 @@ from typing import Dict, List, Literal, Optional, Union
 from utils.es_client import get_elasticsearch_client
 from utils.es_query_builder import get_date_range
 from utils.redis_client import redis_client
+from utils.metrics import instrument
 # Define blacklisted words for filtering hashtags
 BLACKLISTED_WORDS = {'fyp', 'capcut', 'viral'}
 
+
+def blacklist_exclude_regex(words):
+    """
+    Lucene regex for the `exclude` of a terms aggregation that drops every
+    term containing one of `words`, case-insensitive
+
+    Lucene regexes have no case-insensitive flag, so each letter becomes a
+    [xX] class; other characters are escaped.
+    """
+    alternatives = []
+    for word in sorted(words):
+        pattern = ""
+        for char in word.lower():
+            if char.isalpha() and char.upper() != char:
+                pattern += f"[{char}{char.upper()}]"
+            elif char.isalnum():
+                pattern += char
+            else:
+                pattern += "\\" + char
+        alternatives.append(pattern)
+    return ".*(" + "|".join(alternatives) + ").*"
+
+
+BLACKLIST_EXCLUDE = blacklist_exclude_regex(BLACKLISTED_WORDS)
+# Safety net di Python untuk bucket yang lolos exclude (mis. huruf non-ASCII)
+BLACKLIST_PATTERN = re.compile("|".join(re.escape(word) for word in sorted(BLACKLISTED_WORDS)), re.IGNORECASE)
+
+@instrument()
 def get_trending_hashtags(
     es_host=None,
     es_username=None,
@@ -326,7 +356,9 @@ def get_trending_hashtags(
             "hashtags": {
                 "terms": {
                     "field": "post_hashtags",  # Tidak perlu .keyword karena field sudah bertipe keyword
-                    "size": es_limit
+                    "size": es_limit,
+                    # Hashtag blacklist dibuang di Elasticsearch supaya halaman tetap penuh
+                    "exclude": BLACKLIST_EXCLUDE
                 },
                 "aggs": {
                     "sentiment_breakdown": {
@@ -351,8 +383,6 @@ def get_trending_hashtags(
     
     try:
 
-        import json
-        #print(json.dumps(alt_query, indent=2))
         # Execute query
         response = es.search(
             index=",".join(indices),
@@ -370,8 +400,7 @@ def get_trending_hashtags(
             hashtag = hashtag_bucket["key"]
             
             # Skip hashtags yang mengandung kata-kata yang di-blacklist
-            hashtag_lower = hashtag.lower()
-            if any(word in hashtag_lower for word in BLACKLISTED_WORDS):
+            if BLACKLIST_PATTERN.search(hashtag):
                 continue
                 
             mentions = hashtag_bucket["doc_count"]
@@ -5,10 +5,12 @@ from typing import Dict, List, Literal, Optional, Union
 # Import utilitas dari paket utils
 from utils.es_client import get_elasticsearch_client
 from utils.es_query_builder import get_date_range
+from utils.ingest_pipelines import enrichment_ready
 from utils.redis_client import redis_client
+from utils.metrics import instrument
 
 def normalize_link(link, channel):
- 
+    # Aturan yang sama dipakai ingest pipeline link_normalized (utils.ingest_pipelines)
     if not link or not isinstance(link, str):
         return link
     
@@ -44,6 +46,101 @@ def normalize_link(link, channel):
         print(f"Error normalizing link {link}: {e}")
         return link
 
+def _normalized_links(es, indices, query, size):
+    """
+    Top normalized links from the link_normalized field (see
+    utils.ingest_pipelines): one terms aggregation with exact counts per
+    normalized link plus the number of distinct normalized links
+
+    Returns:
+    --------
+    tuple
+        (link data, total items, total unique links)
+    """
+    response = es.search(
+        index=",".join(indices),
+        body={
+            "size": 0,
+            "track_total_hits": False,
+            "query": query,
+            "aggs": {
+                "links": {
+                    "terms": {
+                        "field": "link_normalized",
+                        "size": size
+                    }
+                },
+                "total_unique_links": {
+                    "cardinality": {
+                        "field": "link_normalized"
+                    }
+                }
+            }
+        }
+    )
+    link_data = [
+        {"link_post": bucket["key"], "total_mentions": bucket["doc_count"]}
+        for bucket in response["aggregations"]["links"]["buckets"]
+    ]
+    total_unique_links = response["aggregations"]["total_unique_links"]["value"]
+    return link_data, total_unique_links, total_unique_links
+
+
+def _raw_links(es, indices, query, size):
+    """
+    Fallback before the link_normalized backfill: top raw links,
+    normalized and merged in Python
+    """
+    response = es.search(
+        index=",".join(indices),
+        body={
+            "size": 0,
+            "query": query,
+            "aggs": {
+                "links": {
+                    "terms": {
+                        "field": "link_post",
+                        "size": size
+                    },
+                    "aggs": {
+                        "channel": {
+                            "terms": {
+                                "field": "channel",
+                                "size": 1
+                            }
+                        }
+                    }
+                },
+                "total_unique_links": {
+                    "cardinality": {
+                        "field": "link_post"
+                    }
+                }
+            }
+        }
+    )
+    
+    # Process the links with normalization
+    normalized_links = {}
+    
+    for link_bucket in response["aggregations"]["links"]["buckets"]:
+        # Get the channel (should be one primary channel per link)
+        channel = "other"
+        if link_bucket["channel"]["buckets"]:
+            channel = link_bucket["channel"]["buckets"][0]["key"]
+        
+        normalized_link = normalize_link(link_bucket["key"], channel)
+        normalized_links[normalized_link] = normalized_links.get(normalized_link, 0) + link_bucket["doc_count"]
+    
+    # Convert to list format, sorted by mentions
+    link_data = [
+        {"link_post": link, "total_mentions": count}
+        for link, count in normalized_links.items()
+    ]
+    link_data.sort(key=lambda x: x["total_mentions"], reverse=True)
+    return link_data, len(link_data), response["aggregations"]["total_unique_links"]["value"]
+
+@instrument()
 def get_trending_links(
     es_host=None,
     es_username=None,
@@ -348,164 +445,31 @@ def get_trending_links(
     # Pastikan limit cukup besar untuk mendapat semua data yang diperlukan
     es_limit = max(limit, page * page_size)
     
-    # Try two approaches: aggregation or direct scan depending on index structure
     try:
-        # First approach: Try using aggregation (faster but may not work with all index configurations)
-        aggs_query = {
-            "size": 0,
-            "query": {
-                "bool": {
-                    "must": must_conditions
-                }
-            },
-            "aggs": {
-                "links": {
-                    "terms": {
-                        "field": "link_post",
-                        "size": es_limit
-                    },
-                    "aggs": {
-                        "channel": {
-                            "terms": {
-                                "field": "channel",
-                                "size": 1
-                            }
-                        }
-                    }
-                },
-                "total_unique_links": {
-                    "cardinality": {
-                        "field": "link_post"
-                    }
-                }
+        query = {
+            "bool": {
+                "must": must_conditions
             }
         }
         
         # Add filters if needed
         if filter_conditions:
-            aggs_query["query"]["bool"]["filter"] = filter_conditions
-            
-        try:
-
-            import json
-            #print(json.dumps(aggs_query, indent=2))
-            # Try the aggregation approach
-            print("Trying aggregation approach...")
-            response = es.search(
-                index=",".join(indices),
-                body=aggs_query
-            )
-            
-            # Process results for aggregation approach
-            link_buckets = response["aggregations"]["links"]["buckets"]
-            total_unique_links = response["aggregations"]["total_unique_links"]["value"]
-            
-            # Process the links with normalization
-            normalized_links = {}
-            
-            for link_bucket in link_buckets:
-                link = link_bucket["key"]
-                mentions = link_bucket["doc_count"]
-                
-                # Get the channel (should be one primary channel per link)
-                channel = "other"
-                if link_bucket["channel"]["buckets"]:
-                    channel = link_bucket["channel"]["buckets"][0]["key"]
-                
-                # Normalize the link
-                normalized_link = normalize_link(link, channel)
-                
-                # Add to normalized links count
-                if normalized_link not in normalized_links:
-                    normalized_links[normalized_link] = mentions
-                else:
-                    normalized_links[normalized_link] += mentions
-            
-            # Convert to list format
-            link_data = [
-                {"link_post": link, "total_mentions": count}
-                for link, count in normalized_links.items()
-            ]
-            
-            # Sort by mentions
-            link_data.sort(key=lambda x: x["total_mentions"], reverse=True)
-            
-        except Exception as e1:
-            print(f"Aggregation approach failed: {e1}")
-            
-            # Fallback to scan/scroll approach
-            print("Trying scan/scroll approach...")
-            scan_query = {
-                "query": {
-                    "bool": {
-                        "must": must_conditions
-                    }
-                },
-                "_source": ["link_post", "channel"],
-                "size": 1000
-            }
-            
-            if filter_conditions:
-                scan_query["query"]["bool"]["filter"] = filter_conditions
-                
-            # Execute initial scroll request
-            resp = es.search(
-                index=",".join(indices),
-                body=scan_query,
-                scroll="2m"
-            )
-            
-            # Process all scrolled batches
-            scroll_id = resp["_scroll_id"]
-            scroll_size = len(resp["hits"]["hits"])
-            documents = []
-            
-            # Initial batch
-            documents.extend([hit["_source"] for hit in resp["hits"]["hits"]])
-            
-            # Continue scrolling if there are more results
-            while scroll_size > 0:
-                resp = es.scroll(scroll_id=scroll_id, scroll="2m")
-                scroll_id = resp["_scroll_id"]
-                batch = [hit["_source"] for hit in resp["hits"]["hits"]]
-                documents.extend(batch)
-                scroll_size = len(batch)
-            
-            # Process documents manually
-            normalized_links = {}
-            
-            for doc in documents:
-                link = doc.get("link_post")
-                channel = doc.get("channel", "other")
-                
-                if not link:
-                    continue
-                    
-                normalized_link = normalize_link(link, channel)
-                
-                if normalized_link not in normalized_links:
-                    normalized_links[normalized_link] = 1
-                else:
-                    normalized_links[normalized_link] += 1
-            
-            # Convert to list format
-            link_data = [
-                {"link_post": link, "total_mentions": count}
-                for link, count in normalized_links.items()
-            ]
-            
-            # Sort by mentions
-            link_data.sort(key=lambda x: x["total_mentions"], reverse=True)
-            
-            # Set total_unique_links
-            total_unique_links = len(normalized_links)
+            query["bool"]["filter"] = filter_conditions
+        
+        if enrichment_ready(es, "link_normalized"):
+            # link_normalized diisi ingest pipeline: cukup top link sampai halaman ini
+            link_data, total_items, total_unique_links = _normalized_links(
+                es, indices, query, min(es_limit, max(page, 1) * page_size))
+        else:
+            link_data, total_items, total_unique_links = _raw_links(es, indices, query, es_limit)
         
         # Limit to top entries if needed
         if limit and len(link_data) > limit:
             link_data = link_data[:limit]
         
         # Calculate pagination values
-        total_items = len(link_data)
+        if limit:
+            total_items = min(total_items, limit)
         total_pages = (total_items + page_size - 1) // page_size  # ceiling division
         
         # Validate page number